@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+testdata 下各个命令行工具共用的参数解析和输出格式化
+"""
+from __future__ import print_function
+
+
+def format_size(size):
+    """格式化字节数"""
+    if size is None:
+        return "N/A"
+    for unit in ["B", "K", "M", "G"]:
+        if abs(size) < 1024:
+            return "%.1f%s" % (size, unit)
+        size /= 1024.0
+    return "%.1fT" % size
+
+
+def parse_size(value):
+    """解析 50G / 512M / 字节数形式的大小"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    factor = 1
+    if value and value[-1] in units:
+        factor = units[value[-1]]
+        value = value[:-1]
+    return int(float(value) * factor)
+
+
+def parse_worker_counts(value):
+    """解析 worker 数列表，如 1,2,4,8"""
+    counts = [int(v) for v in value.split(",") if v.strip()]
+    if not counts or min(counts) < 1:
+        raise ValueError(value)
+    return counts
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+coredump tarball 转换工具
+
+--sparse: 把 tarball 重新打包为 GNU sparse 格式，core 中的空洞和全 0 页只在
+sparse map 中记录，不再作为数据存储。支持 sparse 的解压工具（GNU tar、Python
+tarfile、coredump_store.py）解压时直接保留空洞，不必写回这些 0 字节。
+
+重新打包保持文件名和 member 顺序不变；已有清单时同时重新生成清单。
+需要 GNU tar。
+
+--dedup: 在 --sparse 的基础上把带 build-id 的 ELF member（libc、libstdc++、exe 等）
+移到 testdata/objects 按 build-id 去重存放，tarball 中只保留 .objects.json 引用，
+见 object_store.py。
+
+--zstd: 在同目录生成可随机访问的 .tar.zst（见 zstd_archive.py）并为其生成清单，
+原 .tar.gz 保留：maze 通过 --tar 只能读取 gzip。与 --sparse / --dedup 同时使用时先重新打包再转换。
+
+Usage:
+    python3 convert_tarball.py [--sparse | --dedup] [--zstd] <tarball> ...
+    python3 convert_tarball.py --sparse --all    # testdata 下所有 .tar.gz
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+import tar_manifest
+import zstd_archive
+import object_store
+import coredump_store
+
+
+def check_gnu_tar():
+    """确认 PATH 中的 tar 是 GNU tar，否则退出"""
+    try:
+        output = subprocess.check_output(["tar", "--version"])
+    except (OSError, subprocess.CalledProcessError):
+        output = b""
+    if b"GNU tar" not in output:
+        print("Error: GNU tar is required for sparse repacking")
+        sys.exit(1)
+
+
+def dedup_members(work_dir, names, objects_dir):
+    """把解压目录中带 build-id 的 ELF 文件移到对象存储
+
+    Returns:
+        dict: {member 名: build-id}
+    """
+    refs = {}
+    for name in names:
+        path = os.path.join(work_dir, name)
+        if not os.path.isfile(path) or tar_manifest.pid_from_member_name(name):
+            continue
+        if os.path.getsize(path) > tar_manifest.BUILD_ID_MAX_MEMBER_SIZE:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != tar_manifest.ELF_MAGIC:
+            continue
+        build_id = tar_manifest.parse_elf_build_id(data)
+        if not build_id:
+            continue
+        object_store.add(objects_dir, path, build_id)
+        os.remove(path)
+        refs[name] = build_id
+    return refs
+
+
+def repack(tarball_path, objects_dir=None):
+    """把 tarball 原地重新打包为 GNU sparse 格式
+
+    Args:
+        objects_dir: 不为 None 时同时把 ELF member 去重到该对象存储
+
+    Returns:
+        tuple: (原大小, 新大小)
+    """
+    tarball_path = os.path.abspath(tarball_path)
+    if zstd_archive.is_zstd_archive(tarball_path):
+        raise ValueError("Repacking only supports .tar.gz")
+    old_size = os.path.getsize(tarball_path)
+    work_dir = tempfile.mkdtemp(
+        prefix=".repack-", dir=os.path.dirname(tarball_path)
+    )
+    tmp_path = "%s.%d.tmp" % (tarball_path, os.getpid())
+    try:
+        # 解压时跳过全 0 块，GNU tar 再通过 SEEK_HOLE 识别空洞
+        names = coredump_store.extract_members(tarball_path, work_dir)
+        names = [n for n in names if n != object_store.REFS_MEMBER]
+        if objects_dir is not None:
+            refs = dedup_members(work_dir, names, objects_dir)
+            names = [n for n in names if n not in refs]
+            with open(os.path.join(work_dir, object_store.REFS_MEMBER), "w") as f:
+                json.dump(refs, f, indent=2, sort_keys=True)
+            names.insert(0, object_store.REFS_MEMBER)
+        subprocess.check_call(
+            ["tar", "--sparse", "--format=gnu", "--no-recursion", "-czf", tmp_path,
+             "-C", work_dir, "--"] + names
+        )
+        os.rename(tmp_path, tarball_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # 去重 tarball 依赖清单判断是否需要经预解压存储交给 maze，总是生成
+    if objects_dir is not None or os.path.exists(tar_manifest.manifest_path(tarball_path)):
+        tar_manifest.write_manifest(tarball_path)
+    return old_size, os.path.getsize(tarball_path)
+
+
+def convert_zstd(tarball_path):
+    """生成 .tar.zst 及其清单，原 .tar.gz 保留
+
+    Returns:
+        tuple: (.tar.zst 路径, 原大小, 新大小)
+    """
+    old_size = os.path.getsize(tarball_path)
+    zstd_path = zstd_archive.convert(tarball_path)
+    tar_manifest.write_manifest(zstd_path)
+    return zstd_path, old_size, os.path.getsize(zstd_path)
+
+
+def main():
+    args = sys.argv[1:]
+    dedup = "--dedup" in args
+    sparse = "--sparse" in args or dedup
+    to_zstd = "--zstd" in args
+    if "--replace" in args:
+        # 删除 .tar.gz 后测试目录中没有 maze 能读取的 tarball
+        print("Error: --replace is not supported, maze can only read .tar.gz")
+        sys.exit(1)
+    args = [a for a in args if a not in ("--sparse", "--dedup", "--zstd")]
+    if not (sparse or to_zstd) or not args:
+        print("Usage: python convert_tarball.py [--sparse | --dedup] [--zstd] <tarball> ...")
+        print("       python convert_tarball.py [--sparse | --dedup] [--zstd] --all")
+        sys.exit(1)
+
+    if args == ["--all"]:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        tarballs = [
+            t
+            for t in tar_manifest.find_all_tarballs(testdata_dir)
+            if not zstd_archive.is_zstd_archive(t)
+        ]
+    else:
+        tarballs = args
+
+    if sparse:
+        check_gnu_tar()
+    if to_zstd:
+        try:
+            zstd_archive.find_zstd()
+        except RuntimeError as e:
+            print("Error: %s" % str(e))
+            sys.exit(1)
+
+    failed = 0
+    for tarball in tarballs:
+        try:
+            if sparse:
+                objects_dir = object_store.default_objects_dir() if dedup else None
+                old_size, new_size = repack(tarball, objects_dir=objects_dir)
+                print(
+                    "Repacked: %s (%.1fM -> %.1fM)"
+                    % (tarball, old_size / 1024.0 / 1024.0, new_size / 1024.0 / 1024.0)
+                )
+            if to_zstd:
+                zstd_path, old_size, new_size = convert_zstd(tarball)
+                print(
+                    "Converted: %s (%.1fM -> %.1fM)"
+                    % (zstd_path, old_size / 1024.0 / 1024.0, new_size / 1024.0 / 1024.0)
+                )
+        except Exception as e:
+            print("Error: Failed to convert %s: %s" % (tarball, str(e)))
+            failed += 1
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预解压 coredump 存储
+
+按 tarball 内容的 sha256 把 coredump tarball 解压到
+<maze_root>/tmp/extract-store/<sha256>/，同一个 tarball 在多次运行、多种模式
+（普通 / --py-merge）之间只解压一次。总大小超过上限时按最近使用时间 (LRU) 淘汰。
+
+run_test.py 开启 --extract-store 时通过环境变量 MAZE_EXTRACTED_DIR 把解压目录
+传给 maze，支持该变量的 maze 直接使用目录中的文件，跳过 gunzip 和写盘。
+
+gcore 生成的 core 大部分是空洞和全 0 页，解压时全 0 的页不写盘（保留为文件空洞），
+tarball 中的 GNU sparse member 也按其空洞信息还原，节省磁盘空间和写盘时间。
+.tar.zst 归档的各 frame 并行解压。按 build-id 去重的 tarball 中被移出的 ELF 文件
+从 object_store.py 的存储硬链接回来。
+
+Usage:
+    python3 coredump_store.py list
+    python3 coredump_store.py extract <tarball> [--max-size 50G]
+    python3 coredump_store.py prune --max-size 50G
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+
+import cli_util
+import zstd_archive
+import object_store
+
+
+# 解压完成标记，写入后目录才可用；内容为解压后实际占用的磁盘字节数
+COMPLETE_MARKER = ".complete"
+
+# 最近使用时间标记，每次使用时 touch
+LAST_USED_MARKER = ".last_used"
+
+# 解压锁文件后缀：<store_dir>/<digest>.lock
+LOCK_SUFFIX = ".lock"
+
+# 最近这段时间内使用过的条目不淘汰，避免删除并行 job 正在使用的目录（秒）
+EVICT_MIN_IDLE = 600
+
+# 稀疏写入的粒度：整块为 0 的数据不写盘，在文件中留下空洞
+SPARSE_BLOCK_SIZE = 4096
+
+# 解压时每次读取的数据量
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def default_store_dir(maze_root=None):
+    """默认存储目录：<maze_root>/tmp/extract-store"""
+    if maze_root is None:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        maze_root = os.path.dirname(testdata_dir)
+    return os.path.join(maze_root, "tmp", "extract-store")
+
+
+def sha256_file(path):
+    """计算文件 sha256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def touch(path):
+    """更新文件 mtime，文件不存在时创建"""
+    with open(path, "a"):
+        os.utime(path, None)
+
+
+def entry_size(entry_dir):
+    """条目解压后实际占用的磁盘字节数（记录在完成标记中）"""
+    try:
+        with open(os.path.join(entry_dir, COMPLETE_MARKER), "r") as f:
+            return int(f.read().strip() or 0)
+    except (IOError, OSError, ValueError):
+        return 0
+
+
+def entry_last_used(entry_dir):
+    """条目最近使用时间"""
+    try:
+        return os.path.getmtime(os.path.join(entry_dir, LAST_USED_MARKER))
+    except OSError:
+        return 0
+
+
+def list_entries(store_dir):
+    """返回 [(digest, size, last_used)]，只包含解压完成的条目"""
+    entries = []
+    if not os.path.isdir(store_dir):
+        return entries
+    for name in os.listdir(store_dir):
+        entry_dir = os.path.join(store_dir, name)
+        if not os.path.exists(os.path.join(entry_dir, COMPLETE_MARKER)):
+            continue
+        entries.append((name, entry_size(entry_dir), entry_last_used(entry_dir)))
+    return entries
+
+
+def copy_sparse(src, dst, size):
+    """把 src 中 size 字节复制到 dst，全 0 的块通过 seek 跳过，保留为文件空洞"""
+    zero_chunk = b"\0" * COPY_CHUNK_SIZE
+    zero_block = b"\0" * SPARSE_BLOCK_SIZE
+    remaining = size
+    while remaining > 0:
+        buf = src.read(min(COPY_CHUNK_SIZE, remaining))
+        if not buf:
+            raise IOError("Unexpected end of data, %d bytes missing" % remaining)
+        remaining -= len(buf)
+
+        if buf == zero_chunk[: len(buf)]:
+            dst.seek(len(buf), os.SEEK_CUR)
+            continue
+
+        for off in range(0, len(buf), SPARSE_BLOCK_SIZE):
+            block = buf[off : off + SPARSE_BLOCK_SIZE]
+            if block == zero_block[: len(block)]:
+                dst.seek(len(block), os.SEEK_CUR)
+            else:
+                dst.write(block)
+
+    # 文件以空洞结尾时需要 truncate 才能得到正确的大小
+    dst.truncate(size)
+
+
+def disk_usage(path):
+    """目录下文件实际占用的磁盘字节数（空洞和从对象存储硬链接的文件不计）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+                if st.st_nlink == 1:
+                    total += st.st_blocks * 512
+            except (OSError, AttributeError):
+                pass
+    return total
+
+
+def extract_members(tarball_path, dest, objects_dir=None):
+    """稀疏感知地把 tarball 解压到 dest
+
+    普通 member 逐块复制并跳过全 0 块；GNU sparse member 由 tarfile 按
+    sparse map 还原空洞。去重 tarball 中 .objects.json 记录的对象从
+    objects_dir（默认 testdata/objects）硬链接回来。
+
+    Returns:
+        list: 按 tarball 中顺序排列的 member 名
+    """
+    names = []
+    with zstd_archive.open_tar(tarball_path) as tf:
+        for member in safe_members(tf, dest):
+            names.append(member.name)
+            target = os.path.join(dest, member.name)
+            if member.isdir():
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                continue
+            if member.sparse is not None:
+                tf.extract(member, dest)
+                continue
+
+            parent = os.path.dirname(target)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            src = tf.extractfile(member)
+            with open(target, "wb") as dst:
+                copy_sparse(src, dst, member.size)
+            os.chmod(target, member.mode & 0o7777)
+            os.utime(target, (member.mtime, member.mtime))
+
+    if object_store.REFS_MEMBER in names:
+        object_store.restore_refs(objects_dir or object_store.default_objects_dir(), dest)
+    return names
+
+
+def safe_members(tf, dest):
+    """过滤掉会写到解压目录之外的 member（绝对路径、..、链接）"""
+    dest = os.path.realpath(dest)
+    for member in tf:
+        if not (member.isfile() or member.isdir()):
+            continue
+        target = os.path.realpath(os.path.join(dest, member.name))
+        if target != dest and not target.startswith(dest + os.sep):
+            continue
+        yield member
+
+
+def extract(store_dir, tarball_path, digest=None, objects_dir=None):
+    """确保 tarball 已解压到存储中，返回解压目录
+
+    同一个 tarball 的解压由锁文件串行化：并行 job（如 --py-merge-parallel 同时
+    运行的两种模式）中只有一个实际解压，其他 job 等待后直接使用其结果。
+    先解压到临时目录再 rename，中途失败不会留下不完整的条目。
+
+    Args:
+        digest: tarball 的 sha256，调用方已计算时传入避免重复读取
+        objects_dir: 去重 tarball 的对象存储，默认 testdata/objects
+    """
+    if digest is None:
+        digest = sha256_file(tarball_path)
+
+    entry_dir = os.path.join(store_dir, digest)
+    if os.path.exists(os.path.join(entry_dir, COMPLETE_MARKER)):
+        touch(os.path.join(entry_dir, LAST_USED_MARKER))
+        return entry_dir
+
+    if not os.path.isdir(store_dir):
+        try:
+            os.makedirs(store_dir)
+        except OSError:
+            if not os.path.isdir(store_dir):
+                raise
+
+    with open(entry_dir + LOCK_SUFFIX, "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        # 等锁期间其他 job 已经完成了解压
+        if os.path.exists(os.path.join(entry_dir, COMPLETE_MARKER)):
+            touch(os.path.join(entry_dir, LAST_USED_MARKER))
+            return entry_dir
+
+        tmp_dir = "%s.tmp.%d" % (entry_dir, os.getpid())
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        try:
+            extract_members(tarball_path, tmp_dir, objects_dir=objects_dir)
+            with open(os.path.join(tmp_dir, COMPLETE_MARKER), "w") as f:
+                f.write("%d\n" % disk_usage(tmp_dir))
+            touch(os.path.join(tmp_dir, LAST_USED_MARKER))
+            if os.path.isdir(entry_dir):
+                # 被淘汰或中断后残留的不完整条目
+                shutil.rmtree(entry_dir)
+            os.rename(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    return entry_dir
+
+
+def prune(store_dir, max_size, keep=()):
+    """按 LRU 淘汰条目，直到总大小不超过 max_size
+
+    keep 中的 digest 以及最近 EVICT_MIN_IDLE 秒内使用过的条目不淘汰。
+
+    Returns:
+        list: 被淘汰的 digest
+    """
+    entries = sorted(list_entries(store_dir), key=lambda e: e[2])
+    total = sum(size for _, size, _ in entries)
+    now = time.time()
+    evicted = []
+
+    for digest, size, last_used in entries:
+        if total <= max_size:
+            break
+        if digest in keep or now - last_used < EVICT_MIN_IDLE:
+            continue
+        entry_dir = os.path.join(store_dir, digest)
+        # 先把目录原子地改名移开再删除，其他进程不会看到半删除的条目；
+        # 并发的 prune 已经移走该条目时 rename 失败，跳过
+        evict_dir = "%s.evict.%d" % (entry_dir, os.getpid())
+        try:
+            os.rename(entry_dir, evict_dir)
+        except OSError:
+            continue
+        try:
+            os.remove(os.path.join(evict_dir, COMPLETE_MARKER))
+        except OSError:
+            pass
+        shutil.rmtree(evict_dir, ignore_errors=True)
+        total -= size
+        evicted.append(digest)
+
+    return evicted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-extracted coredump store")
+    parser.add_argument("--store", default=default_store_dir(), help="Store directory")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("list", help="List extracted tarballs")
+
+    extract_parser = sub.add_parser("extract", help="Extract a tarball into the store")
+    extract_parser.add_argument("tarball")
+    extract_parser.add_argument("--max-size", help="Prune the store to SIZE afterwards")
+
+    prune_parser = sub.add_parser("prune", help="Evict least recently used entries")
+    prune_parser.add_argument("--max-size", required=True, help="e.g. 50G")
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        entries = sorted(list_entries(args.store), key=lambda e: -e[2])
+        for digest, size, last_used in entries:
+            print(
+                "%s %10.1fM  %s"
+                % (
+                    digest,
+                    size / 1024.0 / 1024.0,
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used)),
+                )
+            )
+        print("Total: %d entries, %.1fM" % (
+            len(entries), sum(e[1] for e in entries) / 1024.0 / 1024.0))
+    elif args.command == "extract":
+        entry_dir = extract(args.store, args.tarball)
+        print("Extracted: %s" % entry_dir)
+        if args.max_size:
+            keep = [os.path.basename(entry_dir)]
+            for digest in prune(args.store, cli_util.parse_size(args.max_size), keep=keep):
+                print("Evicted: %s" % digest)
+    elif args.command == "prune":
+        for digest in prune(args.store, cli_util.parse_size(args.max_size)):
+            print("Evicted: %s" % digest)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ from pathlib import Path
 SCRIPT_DIR = Path(__file__).parent.absolute()
 ROOT_DIR = SCRIPT_DIR.parent.parent
 TESTDATA_CPP = SCRIPT_DIR
+TESTDATA_DIR = SCRIPT_DIR.parent
 CMD_DIR = ROOT_DIR / "cmd"
 
 # mimalloc versions to test
@@ -219,6 +220,11 @@ def create_testcase(version):
     tarball = tarballs[0]
     print(f"Tarball created: {tarball}")
 
+    # Write <tarball>.manifest.json so tools can read pid / members / build-ids
+    # without decompressing the tarball
+    print("Writing tarball manifest...")
+    run_cmd(["python3", str(TESTDATA_DIR / "tar_manifest.py"), str(tarball)])
+
     # Stop the test program
     print("Stopping test program...")
     proc.terminate()
@@ -99,6 +99,13 @@ echo "Packaging coredump..."
 cd "$TEST_DIR"
 python3 "$MAZE_ROOT/cmd/maze-tar-coredump.py" "coredump.$PID"
 
+# 重新打包为 GNU sparse 格式，core 中的空洞不再存储
+# （不使用 --dedup：去重后的 tarball 不含 exe 和共享库，maze 直接读取 tarball 时无法分析）
+python3 "$MAZE_ROOT/testdata/convert_tarball.py" --sparse "$TEST_DIR"/coredump-$PID-*.tar.gz
+
+# 生成 tarball 清单（pid / member 偏移 / build-id），工具无需解压即可读取
+python3 "$MAZE_ROOT/testdata/tar_manifest.py" "$TEST_DIR"/coredump-$PID-*.tar.gz
+
 # 清理原始 coredump
 rm -f "$TEST_DIR/coredump.$PID"
 
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Precomputed per-version mimalloc layout table
+
+maze's mimalloc walker has to know, for every supported mimalloc version,
+the offsets of mi_page_t / mi_segment_t / mi_heap_t fields, which field
+holds the block size (xblock_size vs block_size), whether free lists are
+encoded with page keys, and where the heap / segment cookies live.
+Working this out while walking is slow and error prone, so this script
+computes it once per version from the mimalloc headers in
+3rd/mimalloc-<version>/include and writes cpp/mimalloc_layouts.json.
+
+For each version a small probe program is compiled against the headers
+with the same configuration as the release so used by the testcases
+(NDEBUG, so MI_DEBUG=0 and no MI_PADDING):
+
+- struct layouts are read from the probe's DWARF (readelf --debug-dump=info),
+  anonymous unions / structs are flattened into their parent
+- configuration constants (MI_SEGMENT_SIZE, MI_ENCODE_FREELIST, ...) are
+  printed by running the probe
+
+run_test.py passes the table to maze as MAZE_MIMALLOC_LAYOUTS. The table
+is not committed yet: it has to be generated (generate --all) on a machine
+with the 3rd/mimalloc-* sources and checked in alongside this script.
+
+Usage:
+    python3 mimalloc_layouts.py generate [--version 1-1-0] [--all]
+    python3 mimalloc_layouts.py show 1-9-7 [--type mi_page_t]
+    python3 mimalloc_layouts.py diff 1-9-7 2-0-9
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from create_mimalloc_testcases import ALL_VERSIONS, ROOT_DIR, SCRIPT_DIR
+
+TABLE_PATH = SCRIPT_DIR / "mimalloc_layouts.json"
+
+TABLE_FORMAT_VERSION = 1
+
+# 1-0-0 is the template testcase and not in ALL_VERSIONS
+TABLE_VERSIONS = ["1-0-0"] + ALL_VERSIONS
+
+# Types the walker reads; types missing from a version are skipped
+LAYOUT_TYPES = [
+    "mi_page_t",
+    "mi_segment_t",
+    "mi_heap_t",
+    "mi_tld_t",
+    "mi_page_queue_t",
+    "mi_segments_tld_t",
+    "mi_arena_t",
+]
+
+# Configuration constants; constants missing from a version are skipped
+LAYOUT_CONSTANTS = [
+    "MI_INTPTR_SIZE",
+    "MI_SEGMENT_SHIFT",
+    "MI_SEGMENT_SIZE",
+    "MI_SEGMENT_SLICE_SHIFT",
+    "MI_SEGMENT_SLICE_SIZE",
+    "MI_SMALL_PAGE_SHIFT",
+    "MI_MEDIUM_PAGE_SHIFT",
+    "MI_LARGE_PAGE_SHIFT",
+    "MI_SMALL_OBJ_SIZE_MAX",
+    "MI_MEDIUM_OBJ_SIZE_MAX",
+    "MI_LARGE_OBJ_SIZE_MAX",
+    "MI_HUGE_BLOCK_SIZE",
+    "MI_BIN_HUGE",
+    "MI_BIN_FULL",
+    "MI_PAGES_DIRECT",
+    "MI_ARENA_SLICE_SIZE",
+    "MI_ARENA_SLICE_SHIFT",
+    "MI_DEBUG",
+    "MI_SECURE",
+    "MI_PADDING",
+    "MI_ENCODE_FREELIST",
+]
+
+# Header holding the type definitions: mimalloc 2.x+ / 1.x
+TYPES_HEADERS = ["mimalloc/types.h", "mimalloc-types.h"]
+
+DIE_RE = re.compile(r"^\s*<(\d+)><([0-9a-f]+)>: Abbrev Number: (\d+)(?: \((DW_TAG_\w+)\))?")
+ATTR_RE = re.compile(r"^\s*<[0-9a-f]+>\s+(DW_AT_\w+)\s*:\s*(.*)$")
+REF_RE = re.compile(r"<0x([0-9a-f]+)>")
+FORM_RE = re.compile(r"^\(\w+\)\s*")
+UNKNOWN_TYPE_RE = re.compile(r"unknown type name '(\w+)'")
+
+
+def mimalloc_include_dir(version):
+    return ROOT_DIR / "3rd" / f"mimalloc-{version}" / "include"
+
+
+def find_types_header(include_dir):
+    for header in TYPES_HEADERS:
+        if (include_dir / header).exists():
+            return header
+    return None
+
+
+def probe_source(header, types, constants):
+    """C source declaring one global per type and printing the constants"""
+    lines = [
+        "#include <stdio.h>",
+        f'#include "{header}"',
+        "",
+    ]
+    for i, name in enumerate(types):
+        lines.append(f"{name} mi_layout_probe_{i};")
+    lines += ["", "int main(void)", "{"]
+    for name in constants:
+        lines += [
+            f"#ifdef {name}",
+            f'\tprintf("{name} %lld\\n", (long long)({name}));',
+            "#endif",
+        ]
+    lines += ["\treturn 0;", "}", ""]
+    return "\n".join(lines)
+
+
+def compile_probe(include_dir, header, work_dir):
+    """Compile the probe, dropping types the headers do not define
+
+    Returns:
+        (probe binary path, types present)
+    """
+    types = list(LAYOUT_TYPES)
+    source = Path(work_dir) / "probe.c"
+    binary = Path(work_dir) / "probe"
+    while True:
+        source.write_text(probe_source(header, types, LAYOUT_CONSTANTS))
+        result = subprocess.run(
+            ["gcc", "-g", "-O0", "-std=gnu11", "-DNDEBUG", "-I", str(include_dir),
+             "-o", str(binary), str(source)],
+            capture_output=True,
+            text=True,
+            env=dict(os.environ, LC_ALL="C"),
+        )
+        if result.returncode == 0:
+            return binary, types
+        missing = set(UNKNOWN_TYPE_RE.findall(result.stderr)) & set(types)
+        if not missing:
+            raise RuntimeError(f"Probe compilation failed:\n{result.stderr}")
+        types = [t for t in types if t not in missing]
+
+
+def read_constants(binary):
+    output = subprocess.run([str(binary)], capture_output=True, text=True, check=True).stdout
+    constants = {}
+    for line in output.splitlines():
+        name, value = line.split()
+        constants[name] = int(value)
+    return constants
+
+
+def attr_value(value):
+    """Strip readelf's form prefixes, e.g. (strp) (offset: 0x12): name or (data1) 64"""
+    value = FORM_RE.sub("", value)
+    if value.startswith("(") and "): " in value:
+        value = value.split("): ", 1)[1]
+    return value.strip()
+
+
+def attr_int(value):
+    """Integer attribute, including DWARF 2 style "(DW_OP_plus_uconst: 8)" locations"""
+    match = re.search(r"DW_OP_plus_uconst: (\d+)", value)
+    if match:
+        return int(match.group(1))
+    value = attr_value(value)
+    return int(value, 16) if value.startswith("0x") else int(value)
+
+
+def parse_dies(binary):
+    """Parse readelf's DWARF dump into {offset: die}, each die a dict with
+    tag, attrs and children (offsets)"""
+    output = subprocess.run(
+        ["readelf", "--wide", "--debug-dump=info", str(binary)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    dies = {}
+    stack = []
+    current = None
+    for line in output.splitlines():
+        match = DIE_RE.match(line)
+        if match:
+            depth, offset, abbrev, tag = match.groups()
+            depth = int(depth)
+            offset = int(offset, 16)
+            del stack[depth:]
+            if abbrev == "0":
+                current = None
+                continue
+            current = {"tag": tag, "attrs": {}, "children": []}
+            dies[offset] = current
+            if stack:
+                dies[stack[-1]]["children"].append(offset)
+            stack.append(offset)
+            continue
+        match = ATTR_RE.match(line)
+        if match and current is not None:
+            current["attrs"][match.group(1)] = match.group(2)
+    return dies
+
+
+def type_ref(die):
+    ref = die["attrs"].get("DW_AT_type")
+    if ref is None:
+        return None
+    return int(REF_RE.search(ref).group(1), 16)
+
+
+def type_size(dies, offset):
+    """Size in bytes of a type DIE, None when unknown (e.g. void)"""
+    while offset is not None:
+        die = dies[offset]
+        if "DW_AT_byte_size" in die["attrs"]:
+            return attr_int(die["attrs"]["DW_AT_byte_size"])
+        if die["tag"] == "DW_TAG_array_type":
+            count = 1
+            for child in die["children"]:
+                attrs = dies[child]["attrs"]
+                if "DW_AT_count" in attrs:
+                    count *= attr_int(attrs["DW_AT_count"])
+                elif "DW_AT_upper_bound" in attrs:
+                    count *= attr_int(attrs["DW_AT_upper_bound"]) + 1
+                else:
+                    # flexible array member
+                    count = 0
+            element = type_size(dies, type_ref(die))
+            return None if element is None else element * count
+        offset = type_ref(die)
+    return None
+
+
+def find_typedef(dies, name):
+    for offset, die in dies.items():
+        if die["tag"] == "DW_TAG_typedef" and attr_value(die["attrs"].get("DW_AT_name", "")) == name:
+            return type_ref(die)
+    return None
+
+
+def struct_fields(dies, offset, base=0, prefix=""):
+    """{field name: [offset, size]}, anonymous members flattened into the parent
+    and named nested struct / union members kept as a whole"""
+    fields = {}
+    for child in dies[offset]["children"]:
+        member = dies[child]
+        if member["tag"] != "DW_TAG_member":
+            continue
+        attrs = member["attrs"]
+        if "DW_AT_data_member_location" in attrs:
+            field_offset = base + attr_int(attrs["DW_AT_data_member_location"])
+        elif "DW_AT_data_bit_offset" in attrs:
+            field_offset = base + attr_int(attrs["DW_AT_data_bit_offset"]) // 8
+        else:
+            # union members
+            field_offset = base
+        name = attr_value(attrs["DW_AT_name"]) if "DW_AT_name" in attrs else None
+        if name is None:
+            target = type_ref(member)
+            while dies[target]["tag"] in ("DW_TAG_typedef", "DW_TAG_volatile_type", "DW_TAG_const_type"):
+                target = type_ref(dies[target])
+            fields.update(struct_fields(dies, target, field_offset, prefix))
+            continue
+        if "DW_AT_bit_size" in attrs:
+            fields[prefix + name] = [field_offset, None]
+        else:
+            fields[prefix + name] = [field_offset, type_size(dies, type_ref(member))]
+    return fields
+
+
+def derive(types):
+    """Walker-facing summary of the version-specific details"""
+    page = types.get("mi_page_t", {}).get("fields", {})
+    heap = types.get("mi_heap_t", {}).get("fields", {})
+    segment = types.get("mi_segment_t", {}).get("fields", {})
+    block_size_field = None
+    for name in ("xblock_size", "block_size"):
+        if name in page:
+            block_size_field = name
+            break
+    return {
+        "block_size_field": block_size_field,
+        "page_keys": "keys" in page,
+        "heap_cookie": heap.get("cookie", [None])[0],
+        "heap_keys": heap.get("keys", [None])[0],
+        "segment_cookie": segment.get("cookie", [None])[0],
+    }
+
+
+def generate_layout(version):
+    include_dir = mimalloc_include_dir(version)
+    header = find_types_header(include_dir)
+    if header is None:
+        raise RuntimeError(f"mimalloc headers not found in {include_dir}")
+
+    work_dir = tempfile.mkdtemp(prefix="mimalloc-layout-")
+    try:
+        binary, present = compile_probe(include_dir, header, work_dir)
+        constants = read_constants(binary)
+        dies = parse_dies(binary)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    types = {}
+    for name in present:
+        offset = find_typedef(dies, name)
+        if offset is None:
+            continue
+        types[name] = {
+            "size": type_size(dies, offset),
+            "fields": struct_fields(dies, offset),
+        }
+    return {
+        "header": header,
+        "constants": constants,
+        "types": types,
+        "derived": derive(types),
+    }
+
+
+def load_table(path=TABLE_PATH):
+    if not Path(path).exists():
+        return {"format": TABLE_FORMAT_VERSION, "layouts": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_table(table, path=TABLE_PATH):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.rename(tmp_path, path)
+
+
+def format_fields(fields):
+    lines = []
+    for name, (offset, size) in sorted(fields.items(), key=lambda item: (item[1][0], item[0])):
+        size_str = "bits" if size is None else str(size)
+        lines.append(f"    {offset:6d} {size_str:>6}  {name}")
+    return lines
+
+
+def show(layout, type_name=None):
+    if type_name is None:
+        print(f"header: {layout['header']}")
+        for name, value in sorted(layout["derived"].items()):
+            print(f"  {name}: {value}")
+        for name, value in sorted(layout["constants"].items()):
+            print(f"  {name}: {value}")
+    for name, info in sorted(layout["types"].items()):
+        if type_name and name != type_name:
+            continue
+        print(f"{name} (size {info['size']})")
+        print("\n".join(format_fields(info["fields"])))
+
+
+def diff(old, new):
+    """Print constants, derived values and fields that differ between two layouts"""
+    for section in ("derived", "constants"):
+        for name in sorted(set(old[section]) | set(new[section])):
+            a, b = old[section].get(name), new[section].get(name)
+            if a != b:
+                print(f"  {name}: {a} -> {b}")
+    for type_name in sorted(set(old["types"]) | set(new["types"])):
+        a = old["types"].get(type_name, {"size": None, "fields": {}})
+        b = new["types"].get(type_name, {"size": None, "fields": {}})
+        changes = []
+        if a["size"] != b["size"]:
+            changes.append(f"    size: {a['size']} -> {b['size']}")
+        for name in sorted(set(a["fields"]) | set(b["fields"])):
+            if a["fields"].get(name) != b["fields"].get(name):
+                changes.append(f"    {name}: {a['fields'].get(name)} -> {b['fields'].get(name)}")
+        if changes:
+            print(type_name)
+            print("\n".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-version mimalloc layout table")
+    sub = parser.add_subparsers(dest="command")
+    gen_parser = sub.add_parser("generate", help="Compute layouts from 3rd/mimalloc-<version>")
+    gen_parser.add_argument("--version", "-v", action="append", help="Version, e.g. 1-1-0")
+    gen_parser.add_argument("--all", "-a", action="store_true", help="All testcase versions")
+    show_parser = sub.add_parser("show", help="Show the layout of a version")
+    show_parser.add_argument("version")
+    show_parser.add_argument("--type", help="Only this type, e.g. mi_page_t")
+    diff_parser = sub.add_parser("diff", help="Show layout differences between versions")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    args = parser.parse_args()
+
+    table = load_table()
+    layouts = table["layouts"]
+
+    if args.command == "generate":
+        versions = TABLE_VERSIONS if args.all else (args.version or [])
+        if not versions:
+            gen_parser.print_help()
+            sys.exit(1)
+        failed = 0
+        for version in versions:
+            try:
+                layouts[version] = generate_layout(version)
+            except Exception as e:
+                print(f"ERROR: mimalloc-{version}: {e}")
+                failed += 1
+                continue
+            derived = layouts[version]["derived"]
+            print(f"  mimalloc-{version}: {len(layouts[version]['types'])} types, "
+                  f"block size field {derived['block_size_field']}, "
+                  f"page keys {derived['page_keys']}")
+        if failed < len(versions):
+            table["format"] = TABLE_FORMAT_VERSION
+            save_table(table)
+            print(f"Saved: {TABLE_PATH} ({len(layouts)} versions)")
+        sys.exit(1 if failed else 0)
+
+    if args.command in ("show", "diff"):
+        for version in [args.version] if args.command == "show" else [args.old, args.new]:
+            if version not in layouts:
+                print(f"ERROR: mimalloc-{version} not in {TABLE_PATH}")
+                sys.exit(1)
+        if args.command == "show":
+            show(layouts[args.version], args.type)
+        else:
+            diff(layouts[args.old], layouts[args.new])
+        return
+
+    parser.print_help()
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
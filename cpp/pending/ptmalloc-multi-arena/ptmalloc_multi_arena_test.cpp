@@ -0,0 +1,137 @@
+/**
+ * ptmalloc 多 arena 内存分配测试
+ *
+ * 测试目的：
+ *   验证 Maze 按 arena / heap segment 并行遍历 ptmalloc 堆时，chunk 数量与
+ *   串行遍历一致，不丢失、不重复；同时作为并行遍历的加速比测试用例
+ *
+ * 线程设计：
+ *   - 主线程 + 8 个子线程，M_ARENA_MAX 设为 9，每个线程首次 malloc 时
+ *     获得自己的 arena（主线程使用 main_arena）
+ *   - 每个线程只分配一种大小，结果中每种大小的数量对应一个 arena 的 chunk 数
+ *   - 线程 1 额外分配约 72MB，超过非主 arena 单个 heap 的上限（64MB），
+ *     其 arena 由两个 heap segment 组成
+ *   - 子线程分配完成后保持存活，arena 仍挂在线程上
+ *
+ * 内存布局（线程 t = 0..8，t = 0 为主线程）：
+ *   - 每个线程 25000 个 malloc(40 + 16 * t) 块，即 malloc(40) ... malloc(168)
+ *   - 线程 1 额外 72000 个 malloc(1000) 块
+ *
+ * > 请求大小均为 16n + 8，chunk 大小恰好为请求大小 + 8，Maze 报告的大小与请求大小一致
+ *
+ * 编译命令：
+ *   g++ -g -O0 -pthread -o ptmalloc_multi_arena_test ptmalloc_multi_arena_test.cpp
+ *
+ * 使用方法：
+ *   1. 编译并运行: ./ptmalloc_multi_arena_test
+ *   2. 看到 ">>> READY FOR GCORE <<<" 后执行 gcore
+ *   3. 使用 maze-tar-coredump.py 打包
+ */
+
+#include <cstdio>
+#include <cstdlib>
+#include <malloc.h>
+#include <unistd.h>
+#include <pthread.h>
+#include <atomic>
+
+static const int THREADS = 8;
+static const int N = 25000;
+static const int SPAN_THREAD = 1;
+static const int SPAN_COUNT = 72000;
+static const size_t SPAN_SIZE = 1000;
+
+// 指针保存在 .bss 中，不产生额外的堆 chunk
+static void *blocks[THREADS + 1][N];
+static void *span_blocks[SPAN_COUNT];
+
+static std::atomic<int> done_threads(0);
+
+static size_t block_size(int t)
+{
+	return 40 + 16 * t;
+}
+
+static void allocate(int t)
+{
+	size_t size = block_size(t);
+	for (int i = 0; i < N; i++)
+	{
+		blocks[t][i] = malloc(size);
+	}
+	if (t == SPAN_THREAD)
+	{
+		for (int i = 0; i < SPAN_COUNT; i++)
+		{
+			span_blocks[i] = malloc(SPAN_SIZE);
+		}
+	}
+}
+
+static void *worker(void *arg)
+{
+	int t = (int)(long)arg;
+	allocate(t);
+	done_threads++;
+
+	// 保持线程存活
+	while (1)
+	{
+		sleep(3600);
+	}
+	return NULL;
+}
+
+int main()
+{
+	printf("============================================================\n");
+	printf("ptmalloc Multi-Arena Test - PID: %d\n", getpid());
+	printf("============================================================\n");
+
+	// 保证每个线程都能获得独立的 arena，与 CPU 核数无关
+	mallopt(M_ARENA_MAX, THREADS + 1);
+
+	printf("\nAllocating memory...\n");
+	for (int t = 0; t <= THREADS; t++)
+	{
+		printf("  - thread %d: %d malloc(%zu) blocks\n", t, N, block_size(t));
+	}
+	printf("  - thread %d: %d malloc(%zu) blocks (spans two heap segments)\n",
+		   SPAN_THREAD, SPAN_COUNT, SPAN_SIZE);
+
+	pthread_t threads[THREADS];
+	for (int t = 1; t <= THREADS; t++)
+	{
+		pthread_create(&threads[t - 1], NULL, worker, (void *)(long)t);
+	}
+	allocate(0);
+
+	while (done_threads.load() < THREADS)
+	{
+		usleep(10000);
+	}
+
+	printf("\nAllocation complete!\n");
+
+	// 每个 arena 一段 "Arena N:" 统计，确认 arena 数量
+	malloc_stats();
+
+	// 输出标志性结束符号
+	printf("\n============================================================\n");
+	printf(">>> READY FOR GCORE <<<\n");
+	printf("gcore %d\n", getpid());
+	printf("============================================================\n");
+	fflush(stdout);
+
+	printf("\nWaiting for coredump generation...\n");
+	printf("Press Ctrl+C to exit after gcore is done.\n");
+	fflush(stdout);
+
+	// 保持进程运行
+	while (1)
+	{
+		sleep(3600);
+	}
+
+	return 0;
+}
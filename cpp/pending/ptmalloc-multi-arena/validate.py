@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ptmalloc 多 arena 测试验证脚本
+
+验证目标：
+    1. 每个 arena 的 chunk 数量与分配数量完全一致（并行遍历不丢失、不重复）
+    2. 跨两个 heap segment 的 arena 被完整遍历
+    3. ptmalloc 堆总大小合理
+
+测试数据（线程 t = 0..8，每个线程独占一个 arena）：
+    - 每个线程 25000 个 malloc(40 + 16 * t) 块
+    - 线程 1 额外 72000 个 malloc(1000) 块，超过 64MB，占两个 heap segment
+"""
+from __future__ import print_function
+import json
+import sys
+
+
+# =========================================================
+# 预期值常量
+# =========================================================
+THREADS = 8
+EXPECTED_COUNT = 25000
+SPAN_SIZE = 1000
+SPAN_COUNT = 72000
+
+# 每个 arena 的块大小（请求大小为 16n + 8，报告大小与请求大小一致）
+ARENA_SIZES = [40 + 16 * t for t in range(THREADS + 1)]
+
+
+def count_by_size(items, size):
+    """统计 avg_size 为 size 的 malloc 块数量（类型名可能带 (weak) 等前缀）"""
+    total = 0
+    for item in items:
+        if item.get("avg_size") == size and "malloc(%d)" % size in item.get("type", ""):
+            total += item.get("amount", 0)
+    return total
+
+
+def validate(data):
+    """验证 maze 分析结果"""
+    print("=" * 60)
+    print("ptmalloc Multi-Arena Test Validation")
+    print("=" * 60)
+
+    assert "items" in data, "Missing 'items'"
+    assert "summary" in data, "Missing 'summary'"
+
+    items = data["items"]
+    summary = data["summary"]
+
+    print("\n[Summary]")
+    print("  VMS: %s" % summary.get("vms", "N/A"))
+    print("  Ptmalloc: %s" % summary.get("ptmalloc", "N/A"))
+
+    all_passed = True
+
+    # =========================================================
+    # Check 1: 每个 arena 的 chunk 数量
+    # =========================================================
+    print("\n[Check 1] Chunks per arena...")
+    for t, size in enumerate(ARENA_SIZES):
+        amount = count_by_size(items, size)
+        ok = amount == EXPECTED_COUNT
+        print(
+            "  %s thread %d malloc(%d): %d (expected: %d)"
+            % ("✓" if ok else "✗", t, size, amount, EXPECTED_COUNT)
+        )
+        if not ok:
+            all_passed = False
+
+    # =========================================================
+    # Check 2: 跨 heap segment 的 arena
+    # =========================================================
+    print("\n[Check 2] Arena spanning two heap segments...")
+    amount = count_by_size(items, SPAN_SIZE)
+    print("  malloc(%d): %d (expected: %d)" % (SPAN_SIZE, amount, SPAN_COUNT))
+    if amount == SPAN_COUNT:
+        print("  ✓ All chunks of both heap segments found")
+    else:
+        print("  ✗ Chunk count mismatch")
+        all_passed = False
+
+    # =========================================================
+    # Check 3: 内存大小合理性
+    # =========================================================
+    print("\n[Check 3] Memory size sanity check...")
+
+    # chunk 大小 = 请求大小 + 8
+    expected_heap = sum((size + 8) * EXPECTED_COUNT for size in ARENA_SIZES)
+    expected_heap += (SPAN_SIZE + 8) * SPAN_COUNT
+    ptmalloc_heap = summary.get("ptmalloc", 0)
+    print("  Ptmalloc heap: %.2f MB (allocated: %.2f MB)" % (
+        ptmalloc_heap / (1024.0 * 1024), expected_heap / (1024.0 * 1024)))
+    if expected_heap <= ptmalloc_heap < expected_heap * 1.5:
+        print("  ✓ Heap size reasonable")
+    else:
+        print("  ✗ Heap size outside expected range")
+        all_passed = False
+
+    print("\n" + "=" * 60)
+    if all_passed:
+        print("All validations passed!")
+    else:
+        print("Some validations failed!")
+    print("=" * 60)
+
+    return all_passed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python validate.py <maze-result.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as f:
+        data = json.load(f)
+
+    result = validate(data)
+    sys.exit(0 if result else 1)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+常驻 GDB worker
+
+maze 每次分析会启动三次 `gdb -q -x .gdbcommand.py -ex maze`（GDB.do、Cpp.merge、
+GDB.ctypes），每次都重新加载 exe、所有共享库和 DWARF。本模块只启动一次 GDB、
+加载一次 exe 和 core，之后通过管道以 JSON 行批量处理请求，启动开销每个 core 只付一次。
+
+同一个文件有两种用法：
+
+- 在 GDB 中以 `-x gdb_worker.py` 加载时作为服务端，从 stdin 读取请求
+- 在普通 Python 中 import 时提供客户端 GdbWorker
+
+协议（serve / WorkerClient）与 GDB 无关：serve 接受任意 op 处理函数表，
+WorkerClient 可以连接任何以 serve 应答的进程，不启动 GDB 也能验证往返。
+type_db.py 用 GdbWorker 为新 build-id 批量查询类型和容器布局，每个 ELF 只加载一次。
+
+请求（一行一个 JSON），op 为：
+    type_layout  {"name": "std::string"}        -> {size, fields: [{name, type, offset, bitpos, bitsize, size, base}]}
+    flat_layout  {"name": "std::vector<int>"}    -> {size, fields: {"_M_impl._M_start": offset, ...}}
+    sizeof       {"name": "struct foo"}          -> int
+    find_types   {"regex": "^std::vector<"}      -> [类型名]
+    symbol       {"addr": 0x...}                 -> {name, offset} 或 None，用于 vtable 地址反查类型
+    address      {"name": "main_arena"}          -> int 或 None
+    tls          {"name": "tcache", "thread": 2} -> 该线程中 TLS 变量的地址
+    eval         {"expr": "sizeof(long)"}         -> str
+    batch        {"requests": [...]}             -> [每个请求的结果]，一次往返处理整批请求
+
+响应为一行 `@@gdb-worker {"id": ..., "result": ...}` 或 `{"id": ..., "error": "..."}`，
+前缀用于和 GDB 自身的输出区分。
+
+Usage:
+    with GdbWorker(exe, core) as gdb:
+        layouts = gdb.batch([("type_layout", {"name": n}) for n in names])
+        vtables = gdb.batch([("symbol", {"addr": a}) for a in addrs])
+
+    # 命令行调试：逐行输入 JSON 请求
+    python3 gdb_worker.py <exe> [<core>]
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import subprocess
+
+try:
+    import gdb
+except ImportError:
+    gdb = None
+
+
+RESPONSE_PREFIX = "@@gdb-worker "
+
+# maze 自带的 GDB，相对 maze 根目录
+MAZE_GDB = os.path.join("gdb-10-2-lmy-tls", "bin", "gdb")
+
+INFO_SYMBOL_RE = re.compile(r"^(.+?)(?: \+ (\d+))? in section (\S+)")
+
+INFO_ADDRESS_RE = re.compile(r"\bat (?:address )?(0x[0-9a-fA-F]+)")
+
+# `info types` 输出中的类型行，如 `123:    class std::vector<int, std::allocator<int> >;`
+INFO_TYPES_RE = re.compile(r"^\s*(?:\d+:\s*)?(?:class|struct|union)\s+(.+?);$")
+
+# flat_layout 展开嵌套成员的最大深度
+FLAT_LAYOUT_DEPTH = 4
+
+
+# ---------------------------------------------------------------------------
+# 服务端：在 GDB 进程内运行
+# ---------------------------------------------------------------------------
+
+
+def type_layout(name):
+    """类型大小和字段布局"""
+    t = gdb.lookup_type(name).strip_typedefs()
+    fields = []
+    if t.code in (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION):
+        for f in t.fields():
+            if not hasattr(f, "bitpos"):
+                # 静态成员没有偏移
+                continue
+            fields.append(
+                {
+                    "name": f.name,
+                    "type": str(f.type),
+                    "offset": f.bitpos // 8,
+                    "bitpos": f.bitpos,
+                    "bitsize": f.bitsize,
+                    "size": f.type.strip_typedefs().sizeof,
+                    "base": bool(f.is_base_class),
+                }
+            )
+    return {"name": str(t), "size": t.sizeof, "fields": fields}
+
+
+def flatten_fields(t, prefix, base, depth, out):
+    """把嵌套结构体成员展开为 {"a.b.c": 偏移}"""
+    for f in t.fields():
+        if not hasattr(f, "bitpos"):
+            continue
+        name = f.name or ""
+        path = prefix + name if not prefix or not name else prefix + "." + name
+        offset = base + f.bitpos // 8
+        ft = f.type.strip_typedefs()
+        if ft.code in (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION) and depth > 0:
+            flatten_fields(ft, path, offset, depth - 1, out)
+        elif path:
+            out[path] = offset
+
+
+def flat_layout(name):
+    """类型大小和展开后的成员偏移，用于 STL 容器等多层嵌套的实现类型"""
+    t = gdb.lookup_type(name).strip_typedefs()
+    fields = {}
+    if t.code in (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION):
+        flatten_fields(t, "", 0, FLAT_LAYOUT_DEPTH, fields)
+    return {"name": str(t), "size": t.sizeof, "fields": fields}
+
+
+def find_types(regex):
+    """名字匹配 regex 的 class / struct / union 类型"""
+    out = gdb.execute("info types %s" % regex, to_string=True)
+    names = []
+    for line in out.splitlines():
+        match = INFO_TYPES_RE.match(line)
+        if match and match.group(1) not in names:
+            names.append(match.group(1))
+    return names
+
+
+def sizeof(name):
+    """类型大小"""
+    return gdb.lookup_type(name).strip_typedefs().sizeof
+
+
+def symbol(addr):
+    """反查地址所在的符号，返回 {name, offset}，找不到时返回 None"""
+    out = gdb.execute("info symbol 0x%x" % addr, to_string=True).strip()
+    match = INFO_SYMBOL_RE.match(out)
+    if not match:
+        return None
+    return {"name": match.group(1), "offset": int(match.group(2) or 0)}
+
+
+def address(name):
+    """全局符号地址，找不到时返回 None"""
+    sym = gdb.lookup_global_symbol(name) or gdb.lookup_static_symbol(name)
+    if sym is not None:
+        return int(sym.value().address)
+    # 没有调试信息的符号只能通过 minimal symbol 查找
+    try:
+        out = gdb.execute("info address %s" % name, to_string=True)
+    except gdb.error:
+        return None
+    match = INFO_ADDRESS_RE.search(out)
+    if match:
+        return int(match.group(1), 16)
+    return None
+
+
+def tls(name, thread):
+    """thread（GDB 线程号）中 TLS 变量的地址"""
+    for th in gdb.selected_inferior().threads():
+        if th.num == thread:
+            th.switch()
+            return int(gdb.parse_and_eval("&" + name))
+    raise ValueError("No thread %d" % thread)
+
+
+def evaluate(expr):
+    """计算表达式，返回字符串形式"""
+    return str(gdb.parse_and_eval(expr))
+
+
+GDB_HANDLERS = {
+    "type_layout": type_layout,
+    "flat_layout": flat_layout,
+    "sizeof": sizeof,
+    "find_types": find_types,
+    "symbol": symbol,
+    "address": address,
+    "tls": tls,
+    "eval": evaluate,
+}
+
+
+def handle(request, handlers):
+    """处理单个请求，返回结果或抛出异常"""
+    op = request.get("op")
+    args = request.get("args", {})
+    if op == "batch":
+        return [handle_safely(r, handlers) for r in args.get("requests", [])]
+    if op not in handlers:
+        raise ValueError("Unknown op: %s" % op)
+    return handlers[op](**args)
+
+
+def handle_safely(request, handlers):
+    """批量请求中单个请求失败不影响其他请求"""
+    try:
+        return {"result": handle(request, handlers)}
+    except Exception as e:
+        return {"error": "%s: %s" % (type(e).__name__, str(e))}
+
+
+def write_response(fd, response):
+    """直接写 fd，绕过 GDB 对 sys.stdout 的包装和分页"""
+    data = (RESPONSE_PREFIX + json.dumps(response) + "\n").encode("utf-8")
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def serve(stdin=None, fd=1, handlers=None):
+    """逐行读取请求并应答，读到 EOF 或 quit 时返回
+
+    Args:
+        handlers: {op: 处理函数}，默认为在 GDB 中查询的 GDB_HANDLERS
+    """
+    stdin = stdin or sys.stdin
+    if handlers is None:
+        handlers = GDB_HANDLERS
+        gdb.execute("set pagination off")
+        gdb.execute("set width 0")
+
+    # 告知客户端 exe、共享库和 core 已加载完成
+    write_response(fd, {"id": None, "result": "ready"})
+
+    for line in iter(stdin.readline, ""):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {"id": None, "error": "Invalid request: %s" % str(e)}
+        else:
+            if request.get("op") == "quit":
+                break
+            response = handle_safely(request, handlers)
+            response["id"] = request.get("id")
+        write_response(fd, response)
+
+
+# ---------------------------------------------------------------------------
+# 客户端：在 maze / harness 进程中运行
+# ---------------------------------------------------------------------------
+
+
+class GdbWorkerError(RuntimeError):
+    pass
+
+
+def find_gdb(maze_root=None):
+    """优先使用 maze 自带的 GDB，其次 PATH 中的 gdb"""
+    if maze_root is None:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        maze_root = os.path.dirname(testdata_dir)
+    path = os.path.join(maze_root, MAZE_GDB)
+    if os.path.isfile(path):
+        return path
+    return "gdb"
+
+
+def worker_script():
+    """在 GDB 中以 -x 加载的服务端脚本路径（即本文件）"""
+    path = os.path.abspath(__file__)
+    if path.endswith(".pyc"):
+        path = path[:-1]
+    return path
+
+
+def gdb_available(gdb_path=None):
+    """gdb 是否可以启动且带 Python 支持"""
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.call(
+                [gdb_path or find_gdb(), "-q", "-nx", "-batch", "-ex", "python pass"],
+                stdout=devnull,
+                stderr=devnull,
+            ) == 0
+    except OSError:
+        return False
+
+
+class WorkerClient(object):
+    """以 serve 协议应答的常驻进程的客户端"""
+
+    def __init__(self, cmd, cwd=None):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.process = None
+        self._next_id = 0
+
+    def command(self):
+        return self.cmd
+
+    def start(self):
+        """启动服务端并等待其就绪"""
+        self.process = subprocess.Popen(
+            self.command(),
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self._read_response()
+        return self
+
+    def _read_response(self):
+        """跳过 GDB 自身的输出，读取下一条应答"""
+        for line in iter(self.process.stdout.readline, ""):
+            if line.startswith(RESPONSE_PREFIX):
+                return json.loads(line[len(RESPONSE_PREFIX) :])
+        raise GdbWorkerError("Worker exited with code %s" % self.process.poll())
+
+    def _send(self, op, args):
+        self._next_id += 1
+        request = {"id": self._next_id, "op": op, "args": args}
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        response = self._read_response()
+        if "error" in response:
+            raise GdbWorkerError(response["error"])
+        return response["result"]
+
+    def request(self, op, **args):
+        """发送单个请求并返回结果，失败时抛出 GdbWorkerError"""
+        return self._send(op, args)
+
+    def batch(self, requests, strict=False):
+        """一次往返处理一批 (op, args) 请求
+
+        Returns:
+            list: 与 requests 对应的结果；失败的请求为 None，strict 时抛出异常
+        """
+        responses = self._send(
+            "batch", {"requests": [{"op": op, "args": args} for op, args in requests]}
+        )
+        results = []
+        for (op, args), response in zip(requests, responses):
+            if "error" in response:
+                if strict:
+                    raise GdbWorkerError("%s %s: %s" % (op, args, response["error"]))
+                results.append(None)
+            else:
+                results.append(response["result"])
+        return results
+
+    def close(self):
+        """通知服务端退出"""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(json.dumps({"op": "quit"}) + "\n")
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+        self.process.wait()
+        self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GdbWorker(WorkerClient):
+    """常驻 GDB 进程的客户端，core 为 None 时只加载 exe（查询类型信息）"""
+
+    def __init__(self, exe, core=None, gdb_path=None, solib_search_path=None, cwd=None):
+        WorkerClient.__init__(self, None, cwd=cwd)
+        self.exe = exe
+        self.core = core
+        self.gdb_path = gdb_path or find_gdb()
+        self.solib_search_path = solib_search_path
+
+    def command(self):
+        cmd = [self.gdb_path, "-q", "-nx", "-batch", "-ex", "set pagination off"]
+        if self.solib_search_path:
+            cmd += ["-ex", "set solib-search-path %s" % self.solib_search_path]
+        cmd += ["-ex", "file %s" % self.exe]
+        if self.core:
+            cmd += ["-ex", "core-file %s" % self.core]
+        return cmd + ["-x", worker_script()]
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python gdb_worker.py <exe> [<core>]")
+        sys.exit(1)
+
+    with GdbWorker(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None) as worker:
+        for line in iter(sys.stdin.readline, ""):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                result = worker.request(request.pop("op"), **request)
+            except (ValueError, KeyError, GdbWorkerError) as e:
+                print("Error: %s" % str(e))
+                continue
+            print(json.dumps(result, indent=2))
+
+
+# GDB 以 __main__ 执行 -x 加载的脚本；在 GDB 中被 import 时不进入服务循环
+if __name__ == "__main__":
+    if gdb is not None:
+        serve()
+    else:
+        main()
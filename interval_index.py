@@ -0,0 +1,688 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+地址 -> 内存块查找索引及其 microbenchmark
+
+maze 在 MemoryPieceManager.Sort 之后的每一步指针跟踪（C++ 容器展开、Python
+refcnt 合并、V8 refgraph、weak 分类）都要把任意地址映射到所属的内存块。
+本模块是这个只读查找结构的参考实现，排序后一次构建：
+
+- 扁平的 starts / ends 数组（按起始地址排序、互不重叠），二分查找
+- Eytzinger（BFS）顺序的 starts：查找路径上的元素集中在数组前部，
+  每步只有一次比较和一次乘加，没有分支预测失败，对 cache 友好
+- 4K 页粒度的位图（按 2M 区域分块）：指向非堆页的值不做查找直接拒绝
+
+bench 从 core 中回放真实的查找：在 core 的主堆中按 chunk 头遍历 ptmalloc
+chunk 作为内存块，core 中所有可写段的非 0 对齐 8 字节字作为待查找的值，
+依次用各个策略查找并检查结果一致，报告每次查找的耗时和位图的拒绝率。
+--dump 把内存块和查找序列写成小端 u64 数组，供 maze 的 Go benchmark 回放。
+
+weak 分类、MarkBssMmap、栈上局部变量和 C++ 数组识别都逐字扫描，问「这是不是
+堆指针」，绝大多数字都不是。Prefilter 在区间查找之前用 2M 粒度的区域位图和
+chunk 起始地址的 bloom filter 拒绝这些字；prefilter 子命令按扫描来源报告拒绝率。
+
+Usage:
+    python3 interval_index.py bench cpp/20260225-cpp-long-list-ptr-array
+    python3 interval_index.py bench <tarball | core 文件> [--max-lookups N] [--dump DIR]
+    python3 interval_index.py bench --synthetic 500000
+    python3 interval_index.py prefilter <测试目录 | tarball | core 文件> [--bits-per-key N]
+"""
+from __future__ import print_function
+import os
+import sys
+import mmap
+import glob
+import time
+import array
+import random
+import struct
+import bisect
+import argparse
+
+import tar_manifest
+import coredump_store
+
+
+PAGE_SHIFT = 12
+REGION_SHIFT = 21
+PAGES_PER_REGION = 1 << (REGION_SHIFT - PAGE_SHIFT)
+
+# Python 2 的 array 不支持 "Q"，64 位 Linux 上 "L" 同为 8 字节
+try:
+    array.array("Q")
+    ADDRESS_TYPECODE = "Q"
+except ValueError:
+    ADDRESS_TYPECODE = "L"
+
+PT_LOAD = 1
+PF_W = 2
+
+# ptmalloc chunk 头：prev_size、size（低 3 位为标志）
+PTMALLOC_HEADER = 16
+PTMALLOC_MIN_CHUNK = 32
+PTMALLOC_ALIGN = 16
+PREV_INUSE = 1
+IS_MMAPPED = 2
+SIZE_FLAGS = 7
+
+# 主堆中至少有这么多 chunk 才认为找到了 ptmalloc 堆
+MIN_HEAP_CHUNKS = 16
+
+DEFAULT_MAX_LOOKUPS = 2000000
+
+# 预过滤的 chunk 起始地址 bloom filter：每个 key 10 bit、7 个哈希，误判率约 1%
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+MASK64 = (1 << 64) - 1
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# NT_PRSTATUS 中 x86_64 寄存器组的偏移和 rsp 的下标
+NT_PRSTATUS = 1
+PT_NOTE = 4
+PRSTATUS_REGS_OFFSET = 112
+RSP_INDEX = 19
+
+# 保守扫描的来源，对应 maze 中按字扫描、询问「是不是堆指针」的阶段
+SCAN_PHASES = [
+    ("heap", "weak 分类 / C++ 数组识别：扫描 chunk 内容"),
+    ("bss-mmap", "MarkBssMmap：扫描 .data/.bss 和匿名 mmap"),
+    ("stack", "栈上局部变量：扫描各线程 rsp 以上的栈"),
+]
+
+
+def address_array(values=()):
+    return array.array(ADDRESS_TYPECODE, values)
+
+
+def build_eytzinger(values):
+    """把有序数组排成 Eytzinger 顺序（下标从 1 开始）
+
+    Returns:
+        (eytz, order)：eytz[k] 为树节点 k 的值，order[k] 为其在有序数组中的下标
+    """
+    n = len(values)
+    eytz = address_array([0]) * (n + 1)
+    order = array.array("l", [0]) * (n + 1)
+    i = 0
+    k = 1
+    stack = []
+    # 中序遍历隐式完全二叉树，依次填入有序值
+    while stack or k <= n:
+        while k <= n:
+            stack.append(k)
+            k *= 2
+        k = stack.pop()
+        eytz[k] = values[i]
+        order[k] = i
+        i += 1
+        k = 2 * k + 1
+    return eytz, order
+
+
+class PageBitmap(object):
+    """4K 页粒度的位图，按 2M 区域分块，只为有内存块的区域分配空间"""
+
+    def __init__(self):
+        self.regions = {}
+
+    def add_range(self, start, end):
+        page = start >> PAGE_SHIFT
+        last = (end - 1) >> PAGE_SHIFT
+        while page <= last:
+            region = self.regions.get(page >> (REGION_SHIFT - PAGE_SHIFT))
+            if region is None:
+                region = bytearray(PAGES_PER_REGION // 8)
+                self.regions[page >> (REGION_SHIFT - PAGE_SHIFT)] = region
+            bit = page & (PAGES_PER_REGION - 1)
+            region[bit >> 3] |= 1 << (bit & 7)
+            page += 1
+
+    def contains(self, addr):
+        region = self.regions.get(addr >> REGION_SHIFT)
+        if region is None:
+            return False
+        bit = (addr >> PAGE_SHIFT) & (PAGES_PER_REGION - 1)
+        return bool(region[bit >> 3] & (1 << (bit & 7)))
+
+
+class IntervalIndex(object):
+    """只读的地址区间索引
+
+    Args:
+        ranges: 按起始地址排序、互不重叠的 (start, end) 列表，end 不含
+    """
+
+    def __init__(self, ranges):
+        self.starts = address_array(r[0] for r in ranges)
+        self.ends = address_array(r[1] for r in ranges)
+        self.eytz, self.order = build_eytzinger(self.starts)
+        self.bitmap = PageBitmap()
+        # 相邻的内存块合并后再标记页，避免逐块重复标记同一页
+        span_start = span_end = None
+        for start, end in ranges:
+            if span_end is not None and start <= span_end:
+                span_end = max(span_end, end)
+                continue
+            if span_end is not None:
+                self.bitmap.add_range(span_start, span_end)
+            span_start, span_end = start, end
+        if span_end is not None:
+            self.bitmap.add_range(span_start, span_end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, addr):
+        """二分查找包含 addr 的内存块下标，不存在时返回 -1"""
+        i = bisect.bisect_right(self.starts, addr) - 1
+        if i >= 0 and addr < self.ends[i]:
+            return i
+        return -1
+
+    def find_eytzinger(self, addr):
+        """在 Eytzinger 数组上查找包含 addr 的内存块下标，不存在时返回 -1"""
+        eytz = self.eytz
+        n = len(eytz) - 1
+        k = 1
+        while k <= n:
+            k = 2 * k + (eytz[k] <= addr)
+        # 去掉末尾连续的 1 和其上的一个 0，得到第一个 start > addr 的节点
+        k >>= ((~k) & (k + 1)).bit_length()
+        i = (self.order[k] if k else n) - 1
+        if i >= 0 and addr < self.ends[i]:
+            return i
+        return -1
+
+    def maybe_heap(self, addr):
+        """页位图预过滤：返回 False 时 addr 一定不在任何内存块中"""
+        return self.bitmap.contains(addr)
+
+    def lookup(self, addr):
+        """先用页位图拒绝非堆地址，再二分查找"""
+        if not self.bitmap.contains(addr):
+            return -1
+        return self.find(addr)
+
+
+class RegionBitmap(object):
+    """2M 粒度的扁平位图，覆盖最低到最高内存块之间的所有区域"""
+
+    def __init__(self, ranges):
+        self.base = 0
+        self.bits = bytearray()
+        if not ranges:
+            return
+        self.base = ranges[0][0] >> REGION_SHIFT
+        last = max(end for _, end in ranges) - 1
+        self.bits = bytearray(((last >> REGION_SHIFT) - self.base) // 8 + 1)
+        for start, end in ranges:
+            region = start >> REGION_SHIFT
+            while region <= (end - 1) >> REGION_SHIFT:
+                bit = region - self.base
+                self.bits[bit >> 3] |= 1 << (bit & 7)
+                region += 1
+
+    def contains(self, addr):
+        bit = (addr >> REGION_SHIFT) - self.base
+        if bit < 0 or (bit >> 3) >= len(self.bits):
+            return False
+        return bool(self.bits[bit >> 3] & (1 << (bit & 7)))
+
+
+class ChunkStartBloom(object):
+    """chunk 起始地址的 bloom filter，不存在的起始地址以约 1% 的概率误判为存在"""
+
+    def __init__(self, starts, bits_per_key=BLOOM_BITS_PER_KEY, num_hashes=BLOOM_HASHES):
+        num_bits = 64
+        while num_bits < len(starts) * bits_per_key:
+            num_bits *= 2
+        self.mask = num_bits - 1
+        self.num_hashes = num_hashes
+        self.bits = bytearray(num_bits // 8)
+        for addr in starts:
+            for bit in self._bits(addr):
+                self.bits[bit >> 3] |= 1 << (bit & 7)
+
+    def _bits(self, addr):
+        # 双重哈希：h1 + i * h2，h2 为奇数保证遍历不同的 bit
+        h = ((addr >> 3) * HASH_MULTIPLIER) & MASK64
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        return [(h1 + i * h2) & self.mask for i in range(self.num_hashes)]
+
+    def __contains__(self, addr):
+        # 与 _bits 相同的哈希，逐个检查，遇到 0 即返回
+        h = ((addr >> 3) * HASH_MULTIPLIER) & MASK64
+        bit = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        bits, mask = self.bits, self.mask
+        for _ in range(self.num_hashes):
+            b = bit & mask
+            if not bits[b >> 3] & (1 << (b & 7)):
+                return False
+            bit += h2
+        return True
+
+    def size(self):
+        return len(self.bits)
+
+
+class Prefilter(object):
+    """保守指针扫描的预过滤，在真正的区间查找之前拒绝不可能是堆指针的字
+
+    - maybe_pointer：2M 区域位图，拒绝不指向任何堆区域的字
+    - maybe_chunk_start：区域位图 + 起始地址对齐 + bloom filter，
+      拒绝不可能是某个 chunk 起始地址的字（weak 分类、MarkBssMmap 等只关心起始地址）
+
+    两者返回 True 时仍需用 IntervalIndex 确认。
+    """
+
+    def __init__(self, index, bits_per_key=BLOOM_BITS_PER_KEY):
+        ranges = list(zip(index.starts, index.ends))
+        self.regions = RegionBitmap(ranges)
+        # 所有起始地址共同的对齐（最多 16）
+        align = 16
+        for start in index.starts:
+            while start & (align - 1):
+                align //= 2
+        self.align_mask = align - 1
+        self.bloom = ChunkStartBloom(index.starts, bits_per_key=bits_per_key)
+
+    def maybe_pointer(self, addr):
+        return self.regions.contains(addr)
+
+    def maybe_chunk_start(self, addr):
+        if addr & self.align_mask or not self.regions.contains(addr):
+            return False
+        return addr in self.bloom
+
+
+# ---------------------------------------------------------------------------
+# 从 core 中读取内存块和查找序列
+# ---------------------------------------------------------------------------
+
+
+def read_load_segments(core):
+    """返回 core 的 PT_LOAD 段 [(vaddr, offset, filesz, flags)]"""
+    if core[:4] != tar_manifest.ELF_MAGIC or core[4:5] != b"\x02":
+        raise ValueError("Not a 64-bit ELF core")
+    e_phoff = struct.unpack_from("<Q", core, 0x20)[0]
+    e_phentsize, e_phnum = struct.unpack_from("<HH", core, 0x36)
+    segments = []
+    for i in range(e_phnum):
+        p_type, p_flags, p_offset, p_vaddr, _, p_filesz = struct.unpack_from(
+            "<IIQQQQ", core, e_phoff + i * e_phentsize
+        )
+        if p_type == PT_LOAD and p_filesz:
+            segments.append((p_vaddr, p_offset, p_filesz, p_flags))
+    return segments
+
+
+def walk_ptmalloc_heap(core, vaddr, offset, size):
+    """从段起始处按 chunk 头遍历，一直走到段末尾（top chunk）时返回使用中的
+    chunk [(用户指针, 用户区域末尾)]，不是 ptmalloc 堆时返回 None"""
+    chunks = []
+    pos = 0
+    while pos + PTMALLOC_HEADER <= size:
+        field = struct.unpack_from("<Q", core, offset + pos + 8)[0]
+        chunk_size = field & ~SIZE_FLAGS
+        if (
+            chunk_size < PTMALLOC_MIN_CHUNK
+            or chunk_size % PTMALLOC_ALIGN
+            or field & IS_MMAPPED
+            or pos + chunk_size > size
+        ):
+            return None
+        next_pos = pos + chunk_size
+        if next_pos + PTMALLOC_HEADER > size:
+            # top chunk
+            break
+        next_field = struct.unpack_from("<Q", core, offset + next_pos + 8)[0]
+        if next_field & PREV_INUSE:
+            # 用户区域包括下一个 chunk 的 prev_size
+            chunks.append((vaddr + pos + PTMALLOC_HEADER, vaddr + next_pos + 8))
+        pos = next_pos
+    if len(chunks) < MIN_HEAP_CHUNKS:
+        return None
+    return chunks
+
+
+def read_thread_stack_pointers(core):
+    """返回 core 中每个线程（NT_PRSTATUS）的 rsp"""
+    e_phoff = struct.unpack_from("<Q", core, 0x20)[0]
+    e_phentsize, e_phnum = struct.unpack_from("<HH", core, 0x36)
+    stack_pointers = []
+    for i in range(e_phnum):
+        p_type, _, p_offset, _, _, p_filesz = struct.unpack_from(
+            "<IIQQQQ", core, e_phoff + i * e_phentsize
+        )
+        if p_type != PT_NOTE:
+            continue
+        pos = p_offset
+        while pos + 12 <= p_offset + p_filesz:
+            namesz, descsz, n_type = struct.unpack_from("<III", core, pos)
+            desc = pos + 12 + ((namesz + 3) & ~3)
+            if n_type == NT_PRSTATUS:
+                stack_pointers.append(struct.unpack_from(
+                    "<Q", core, desc + PRSTATUS_REGS_OFFSET + RSP_INDEX * 8)[0])
+            pos = desc + ((descsz + 3) & ~3)
+    return stack_pointers
+
+
+def find_heap_chunks(core, segments):
+    """在可写段中找出能完整遍历的 ptmalloc 主堆，返回排序后的 chunk 列表"""
+    chunks = []
+    for vaddr, offset, filesz, flags in segments:
+        if not flags & PF_W:
+            continue
+        found = walk_ptmalloc_heap(core, vaddr, offset, filesz)
+        if found:
+            chunks.extend(found)
+    chunks.sort()
+    return chunks
+
+
+def collect_lookups(core, segments, max_lookups):
+    """core 可写段中所有非 0 的对齐 8 字节字，即指针跟踪时会查找的值"""
+    lookups = address_array()
+    for _, offset, filesz, flags in segments:
+        if not flags & PF_W:
+            continue
+        words = address_array()
+        count = min(filesz // 8, max_lookups - len(lookups))
+        data = core[offset : offset + count * 8]
+        if hasattr(words, "frombytes"):
+            words.frombytes(data)
+        else:
+            words.fromstring(data)
+        lookups.extend(w for w in words if w)
+        if len(lookups) >= max_lookups:
+            break
+    return lookups[:max_lookups]
+
+
+def collect_scan_words(core, segments, chunks, max_words):
+    """按来源（SCAN_PHASES）收集保守扫描会检查的非 0 对齐 8 字节字
+
+    chunk 所在的段为 heap，含有线程 rsp 的段只取 rsp 以上的部分为 stack，
+    其余可写段为 bss-mmap。每个来源最多 max_words 个。
+
+    Returns:
+        dict: 来源 -> address_array
+    """
+    words = dict((name, address_array()) for name, _ in SCAN_PHASES)
+    heap = RegionBitmap(chunks)
+    stack_pointers = read_thread_stack_pointers(core)
+    for vaddr, offset, filesz, flags in segments:
+        if not flags & PF_W:
+            continue
+        begin, phase = 0, "bss-mmap"
+        for rsp in stack_pointers:
+            if vaddr <= rsp < vaddr + filesz:
+                begin, phase = (rsp - vaddr) & ~7, "stack"
+        if heap.contains(vaddr) and walk_ptmalloc_heap(core, vaddr, offset, filesz):
+            phase = "heap"
+        out = words[phase]
+        count = min((filesz - begin) // 8, max_words - len(out))
+        if count <= 0:
+            continue
+        segment_words = address_array()
+        data = core[offset + begin : offset + begin + count * 8]
+        if hasattr(segment_words, "frombytes"):
+            segment_words.frombytes(data)
+        else:
+            segment_words.fromstring(data)
+        out.extend(w for w in segment_words if w)
+    return words
+
+
+def find_core_file(path):
+    """path 为 core 文件、解压目录、tarball 或测试目录，返回 core 文件路径"""
+    if os.path.isfile(path) and not (path.endswith(".tar.gz") or path.endswith(".tar.zst")):
+        return path
+    if os.path.isdir(path):
+        tarballs = glob.glob(os.path.join(path, "coredump-*.tar.*"))
+        if not tarballs:
+            cores = glob.glob(os.path.join(path, "core.*"))
+            if not cores:
+                raise RuntimeError("No core file or tarball in %s" % path)
+            return cores[0]
+        path = sorted(tarballs)[-1]
+    extracted = coredump_store.extract(coredump_store.default_store_dir(), path)
+    for name in os.listdir(extracted):
+        if tar_manifest.pid_from_member_name(name):
+            return os.path.join(extracted, name)
+    raise RuntimeError("No core.<pid> member in %s" % path)
+
+
+def load_core_workload(path, max_lookups):
+    """返回 (chunks, lookups)"""
+    with open(find_core_file(path), "rb") as f:
+        core = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        segments = read_load_segments(core)
+        chunks = find_heap_chunks(core, segments)
+        lookups = collect_lookups(core, segments, max_lookups)
+    finally:
+        core.close()
+    if not chunks:
+        raise RuntimeError("No ptmalloc heap found in core")
+    return chunks, lookups
+
+
+def load_core_scan_words(path, max_words):
+    """返回 (chunks, 来源 -> 扫描的字)"""
+    with open(find_core_file(path), "rb") as f:
+        core = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        segments = read_load_segments(core)
+        chunks = find_heap_chunks(core, segments)
+        if not chunks:
+            raise RuntimeError("No ptmalloc heap found in core")
+        phase_words = collect_scan_words(core, segments, chunks, max_words)
+    finally:
+        core.close()
+    return chunks, phase_words
+
+
+def synthetic_workload(num_chunks, max_lookups, seed=1):
+    """随机生成内存块和查找序列：一半查找指向内存块内部，一半为随机值"""
+    rng = random.Random(seed)
+    chunks = []
+    addr = 0x555555560000
+    for _ in range(num_chunks):
+        size = rng.choice([32, 48, 64, 128, 256, 1024])
+        chunks.append((addr + 16, addr + size + 8))
+        addr += size
+        if rng.random() < 0.001:
+            # 偶尔跳到新的 mmap 区域
+            addr += rng.randrange(1, 64) << 21
+    lookups = address_array()
+    for _ in range(max_lookups):
+        if rng.random() < 0.5:
+            start, end = chunks[rng.randrange(num_chunks)]
+            lookups.append(rng.randrange(start, end))
+        else:
+            lookups.append(rng.randrange(1, 1 << 47))
+    return chunks, lookups
+
+
+def dump_workload(out_dir, chunks, lookups):
+    """写出 chunks.bin（start, end 交替）和 lookups.bin，均为小端 u64"""
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with open(os.path.join(out_dir, "chunks.bin"), "wb") as f:
+        for start, end in chunks:
+            f.write(struct.pack("<QQ", start, end))
+    with open(os.path.join(out_dir, "lookups.bin"), "wb") as f:
+        for addr in lookups:
+            f.write(struct.pack("<Q", addr))
+
+
+def run_bench(chunks, lookups, repeat=1):
+    """用各个策略回放查找，结果不一致时返回 False"""
+    clock = getattr(time, "perf_counter", time.time)
+
+    start = clock()
+    index = IntervalIndex(chunks)
+    build_time = clock() - start
+
+    strategies = [
+        ("bisect", index.find),
+        ("eytzinger", index.find_eytzinger),
+        ("bitmap+bisect", index.lookup),
+        (
+            "bitmap+eytzinger",
+            lambda addr: index.find_eytzinger(addr) if index.maybe_heap(addr) else -1,
+        ),
+    ]
+
+    print("Chunks: %d, lookups: %d, build %.2fs, bitmap %d regions" % (
+        len(index), len(lookups), build_time, len(index.bitmap.regions)))
+    print("%-18s %10s %12s %10s" % ("Strategy", "Time", "ns/lookup", "Hits"))
+
+    expected = None
+    consistent = True
+    for name, func in strategies:
+        best = None
+        for _ in range(repeat):
+            start = clock()
+            results = [func(addr) for addr in lookups]
+            elapsed = clock() - start
+            best = elapsed if best is None else min(best, elapsed)
+        hits = sum(1 for r in results if r >= 0)
+        print("%-18s %9.2fs %12.0f %10d" % (
+            name, best, best * 1e9 / max(len(lookups), 1), hits))
+        if expected is None:
+            expected = results
+        elif results != expected:
+            print("  ❌ Results differ from %s" % strategies[0][0])
+            consistent = False
+
+    rejected = sum(1 for addr in lookups if not index.maybe_heap(addr))
+    print("Page bitmap rejects %.1f%% of lookups" % (
+        rejected * 100.0 / max(len(lookups), 1)))
+    return consistent
+
+
+def run_prefilter_bench(chunks, phase_words, bits_per_key=BLOOM_BITS_PER_KEY):
+    """按来源报告预过滤的拒绝率和扫描耗时
+
+    - Region：2M 区域位图拒绝的比例（「是不是堆指针」）
+    - Start：区域位图 + 对齐 + bloom 拒绝的比例（「是不是 chunk 起始地址」）
+    - FP：通过 Start 预过滤但不是起始地址的比例（bloom 误判和区域内的非起始地址）
+    - ns/word：不带 / 带预过滤时每个字判断是否为起始地址的耗时
+    """
+    clock = getattr(time, "perf_counter", time.time)
+    index = IntervalIndex(chunks)
+    start = clock()
+    prefilter = Prefilter(index, bits_per_key=bits_per_key)
+    build_time = clock() - start
+    starts = index.starts
+
+    def is_start(addr):
+        i = index.find(addr)
+        return i >= 0 and starts[i] == addr
+
+    def is_start_filtered(addr):
+        return prefilter.maybe_chunk_start(addr) and is_start(addr)
+
+    print("Chunks: %d, prefilter build %.2fs, region bitmap %d bytes, bloom %d bytes" % (
+        len(index), build_time, len(prefilter.regions.bits), prefilter.bloom.size()))
+    print("%-10s %10s %8s %8s %8s %10s %10s %8s" % (
+        "Phase", "Words", "Region", "Start", "FP", "ns/word", "filtered", "Saved"))
+
+    consistent = True
+    for name, description in SCAN_PHASES:
+        words = phase_words.get(name)
+        if not words:
+            continue
+        total = float(len(words))
+        region_rejected = sum(1 for w in words if not prefilter.maybe_pointer(w))
+
+        t0 = clock()
+        expected = [is_start(w) for w in words]
+        plain = clock() - t0
+        # 计时包含预过滤本身的开销
+        t0 = clock()
+        results = [is_start_filtered(w) for w in words]
+        filtered = clock() - t0
+        passed = [prefilter.maybe_chunk_start(w) for w in words]
+        if results != expected:
+            print("  ❌ %s: prefilter rejected a real chunk start" % name)
+            consistent = False
+
+        start_rejected = passed.count(False)
+        false_positive = sum(1 for p, e in zip(passed, expected) if p and not e)
+        print("%-10s %10d %7.1f%% %7.1f%% %7.2f%% %10.0f %10.0f %7.1f%%" % (
+            name, len(words),
+            region_rejected * 100 / total,
+            start_rejected * 100 / total,
+            false_positive * 100 / total,
+            plain * 1e9 / total,
+            filtered * 1e9 / total,
+            (plain - filtered) * 100 / plain if plain else 0.0))
+        print("           %s" % description)
+    return consistent
+
+
+def resolve_source(source):
+    """相对路径既可以相对当前目录，也可以相对 testdata"""
+    testdata_dir = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.exists(source) and os.path.exists(os.path.join(testdata_dir, source)):
+        return os.path.join(testdata_dir, source)
+    return source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Address to memory piece lookup index")
+    sub = parser.add_subparsers(dest="command")
+    bench_parser = sub.add_parser("bench", help="Replay lookups from a core")
+    bench_parser.add_argument("source", nargs="?", help="Test dir, tarball or core file")
+    bench_parser.add_argument("--synthetic", type=int, metavar="N",
+                              help="Use N random chunks instead of a core")
+    bench_parser.add_argument("--max-lookups", type=int, default=DEFAULT_MAX_LOOKUPS)
+    bench_parser.add_argument("--repeat", type=int, default=1, help="Report the best of N runs")
+    bench_parser.add_argument("--dump", metavar="DIR",
+                              help="Write chunks.bin / lookups.bin for replay in maze")
+    prefilter_parser = sub.add_parser(
+        "prefilter", help="Report prefilter reject rates per conservative scan phase")
+    prefilter_parser.add_argument("source", help="Test dir, tarball or core file")
+    prefilter_parser.add_argument("--max-words", type=int, default=DEFAULT_MAX_LOOKUPS,
+                                  help="Words to scan per phase (default: %(default)s)")
+    prefilter_parser.add_argument("--bits-per-key", type=int, default=BLOOM_BITS_PER_KEY,
+                                  help="Bloom filter bits per chunk start (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "prefilter":
+        try:
+            chunks, phase_words = load_core_scan_words(
+                resolve_source(args.source), args.max_words)
+        except (RuntimeError, ValueError) as e:
+            print("Error: %s" % str(e))
+            sys.exit(1)
+        sys.exit(0 if run_prefilter_bench(
+            chunks, phase_words, bits_per_key=args.bits_per_key) else 1)
+
+    if args.command != "bench" or not (args.source or args.synthetic):
+        parser.print_help()
+        sys.exit(1)
+
+    if args.synthetic:
+        chunks, lookups = synthetic_workload(args.synthetic, args.max_lookups)
+    else:
+        try:
+            chunks, lookups = load_core_workload(resolve_source(args.source), args.max_lookups)
+        except (RuntimeError, ValueError) as e:
+            print("Error: %s" % str(e))
+            sys.exit(1)
+
+    if args.dump:
+        dump_workload(args.dump, chunks, lookups)
+        print("Workload written to %s" % args.dump)
+
+    sys.exit(0 if run_bench(chunks, lookups, repeat=args.repeat) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+按 build-id 去重的共享对象存储
+
+cpp/ 下每个 tarball 都带着自己的一份 libc、libstdc++、libpthread、libthread_db
+和测试 exe。去重后的 tarball 不再包含这些 ELF 文件，而是在 `.objects.json`
+member 中记录 {member 名: build-id}，文件本身按 build-id 存放在
+testdata/objects/<build-id 前 2 位>/<build-id 其余部分> 中，多个 tarball 共用一份。
+
+解压时（coredump_store.py）从存储中硬链接回解压目录，不再重复 gunzip 和写盘。
+存储中的文件是只读的，硬链接出去的文件被修改时不会影响存储。
+
+由普通 tarball 转换：python3 convert_tarball.py --dedup <tarball>
+
+Usage:
+    python3 object_store.py list
+    python3 object_store.py verify
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import shutil
+import argparse
+
+import tar_manifest
+
+
+# 去重 tarball 中记录被移出 member 的清单 member 名
+REFS_MEMBER = tar_manifest.REFS_MEMBER
+
+# 存储中文件的权限：只读，保留执行权限（exe 和 so 需要）
+OBJECT_MODE = 0o555
+
+
+def default_objects_dir():
+    """默认存储目录：testdata/objects"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "objects")
+
+
+def object_path(objects_dir, build_id):
+    """build-id 对应的存储路径"""
+    return os.path.join(objects_dir, build_id[:2], build_id[2:])
+
+
+def add(objects_dir, path, build_id):
+    """把文件加入存储，已存在时不重复写入
+
+    Returns:
+        bool: 是否新写入
+    """
+    target = object_path(objects_dir, build_id)
+    if os.path.exists(target):
+        return False
+
+    target_dir = os.path.dirname(target)
+    if not os.path.isdir(target_dir):
+        try:
+            os.makedirs(target_dir)
+        except OSError:
+            if not os.path.isdir(target_dir):
+                raise
+
+    tmp_path = "%s.%d.tmp" % (target, os.getpid())
+    shutil.copyfile(path, tmp_path)
+    os.chmod(tmp_path, OBJECT_MODE)
+    os.rename(tmp_path, target)
+    return True
+
+
+def link(objects_dir, build_id, dest):
+    """把存储中的对象硬链接到 dest，跨文件系统时回退为复制"""
+    source = object_path(objects_dir, build_id)
+    if not os.path.exists(source):
+        raise RuntimeError("Object %s not found in %s" % (build_id, objects_dir))
+
+    dest_dir = os.path.dirname(dest)
+    if dest_dir and not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+        os.chmod(dest, OBJECT_MODE)
+
+
+def read_refs(path):
+    """读取解压目录中的 .objects.json，不存在时返回空 dict"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return {}
+
+
+def restore_refs(objects_dir, dest):
+    """按解压目录中的 .objects.json 把被移出的 member 链接回来
+
+    Returns:
+        int: 链接的对象数
+    """
+    refs = read_refs(os.path.join(dest, REFS_MEMBER))
+    for name, build_id in sorted(refs.items()):
+        link(objects_dir, build_id, os.path.join(dest, name))
+    return len(refs)
+
+
+def list_objects(objects_dir):
+    """返回 [(build_id, size)]"""
+    objects = []
+    if not os.path.isdir(objects_dir):
+        return objects
+    for prefix in sorted(os.listdir(objects_dir)):
+        prefix_dir = os.path.join(objects_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for rest in sorted(os.listdir(prefix_dir)):
+            if rest.endswith(".tmp"):
+                continue
+            objects.append((prefix + rest, os.path.getsize(os.path.join(prefix_dir, rest))))
+    return objects
+
+
+def verify(objects_dir):
+    """检查每个对象的 build-id 与文件名一致，返回不一致的 build-id 列表"""
+    bad = []
+    for build_id, _ in list_objects(objects_dir):
+        with open(object_path(objects_dir, build_id), "rb") as f:
+            actual = tar_manifest.parse_elf_build_id(f.read())
+        if actual != build_id:
+            bad.append(build_id)
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build-id keyed shared object store")
+    parser.add_argument("--objects", default=default_objects_dir(), help="Store directory")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("list", help="List stored objects")
+    sub.add_parser("verify", help="Check that every object matches its build-id")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        objects = list_objects(args.objects)
+        for build_id, size in objects:
+            print("%s %10.1fK" % (build_id, size / 1024.0))
+        print("Total: %d objects, %.1fM" % (
+            len(objects), sum(size for _, size in objects) / 1024.0 / 1024.0))
+    elif args.command == "verify":
+        bad = verify(args.objects)
+        for build_id in bad:
+            print("Mismatch: %s" % build_id)
+        sys.exit(1 if bad else 0)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+maze 性能历史数据库
+
+run_test.py 每次实际运行 maze 后把本次的耗时、阶段耗时和资源占用追加到本地
+SQLite 数据库（默认 <maze_root>/tmp/perf-history.sqlite3），用于按 maze 版本
+查看性能趋势、二分定位性能回归。
+
+Usage:
+    python3 testdata/perf_history.py runs [--test T] [--limit N]
+    python3 testdata/perf_history.py trend --test T [--phase P] [--metric M] [--limit N]
+
+Examples:
+    # WalkJemalloc 阶段在最近 50 个 maze 版本上的耗时
+    python3 testdata/perf_history.py trend \\
+        --test 20260211-jemalloc-5-3-0-multithread --phase WalkJemalloc --limit 50
+
+    # 整体峰值 RSS 趋势
+    python3 testdata/perf_history.py trend --test cpp/20260201-basic-malloc --metric max_rss
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at TEXT NOT NULL,
+    test TEXT NOT NULL,
+    flags TEXT NOT NULL,
+    maze_rev TEXT,
+    maze_hash TEXT,
+    passed INTEGER,
+    wall_time REAL,
+    user_time REAL,
+    sys_time REAL,
+    max_rss INTEGER,
+    core_size INTEGER,
+    vms INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_test ON runs (test, flags);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    start REAL,
+    duration REAL,
+    cpu REAL,
+    rss INTEGER
+);
+CREATE INDEX IF NOT EXISTS phases_run ON phases (run_id);
+"""
+
+# runs 表中可用于 trend 的指标
+RUN_METRICS = ["wall_time", "user_time", "sys_time", "max_rss", "core_size", "vms"]
+
+# phases 表中可用于 trend 的指标
+PHASE_METRICS = ["duration", "cpu", "rss"]
+
+
+def default_db_path(maze_root=None):
+    """默认数据库路径：<maze_root>/tmp/perf-history.sqlite3"""
+    if maze_root is None:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        maze_root = os.path.dirname(testdata_dir)
+    return os.path.join(maze_root, "tmp", "perf-history.sqlite3")
+
+
+def open_db(path):
+    """打开（必要时创建）数据库"""
+    db_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(db_dir):
+        os.makedirs(db_dir)
+    # 并行 job 会同时写入，等待写锁而不是直接报错
+    conn = sqlite3.connect(path, timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def normalize_test(test):
+    """测试目录统一为相对 testdata 的形式，作为数据库中的 key
+
+    cpp/x、cpp/x/、./cpp/x、testdata/cpp/x 和 testdata 下的绝对路径都得到 cpp/x；
+    只有目录名（x）时原样返回，查询时按目录名匹配。
+    """
+    testdata_dir = os.path.dirname(os.path.abspath(__file__))
+    if os.path.isabs(test):
+        test = os.path.relpath(test, testdata_dir)
+    test = os.path.normpath(test).replace(os.sep, "/")
+    prefix = os.path.basename(testdata_dir) + "/"
+    if test.startswith(prefix):
+        test = test[len(prefix) :]
+    return test
+
+
+def open_db_readonly(path):
+    """只读打开已有数据库，不创建表；用于 --shard-history 等固定的历史快照"""
+    if not os.path.exists(path):
+        raise IOError("Database not found: %s" % path)
+    if sys.version_info[0] >= 3:
+        from urllib.request import pathname2url
+
+        return sqlite3.connect(
+            "file:%s?mode=ro" % pathname2url(os.path.abspath(path)), uri=True
+        )
+    return sqlite3.connect(path)
+
+
+def record_run(path, test, flags, profile, summary=None, passed=None,
+               maze_rev=None, maze_hash=None):
+    """追加一次 maze 运行记录
+
+    Args:
+        path: 数据库路径
+        test: 测试目录，按 normalize_test 统一后存储
+        flags: maze 参数字符串，如 "--py-merge --no-cpp --limit 500"
+        profile: phases.json 的内容（wall_time/user_time/sys_time/max_rss/phases）
+        summary: maze-result.json 中的 summary，提供 core_size 和 vms
+        passed: 验证是否通过
+        maze_rev: maze 的 git revision
+        maze_hash: maze 程序的 sha256
+
+    Returns:
+        int: 新记录的 run id
+    """
+    summary = summary or {}
+    conn = open_db(path)
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO runs (recorded_at, test, flags, maze_rev, maze_hash, "
+                "passed, wall_time, user_time, sys_time, max_rss, core_size, vms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.strftime("%Y-%m-%d %H:%M:%S"),
+                    normalize_test(test),
+                    flags,
+                    maze_rev,
+                    maze_hash,
+                    None if passed is None else int(bool(passed)),
+                    profile.get("wall_time"),
+                    profile.get("user_time"),
+                    profile.get("sys_time"),
+                    profile.get("max_rss"),
+                    summary.get("core_size"),
+                    summary.get("vms"),
+                ),
+            )
+            run_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO phases (run_id, seq, name, start, duration, cpu, rss) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        seq,
+                        phase["name"],
+                        phase.get("start"),
+                        phase.get("duration"),
+                        phase.get("cpu"),
+                        phase.get("rss"),
+                    )
+                    for seq, phase in enumerate(profile.get("phases", []))
+                ],
+            )
+    finally:
+        conn.close()
+    return run_id
+
+
+def make_test_filter(test):
+    """test 支持完整路径 (cpp/xxx，按 normalize_test 统一) 或目录名 (xxx)"""
+    test = normalize_test(test)
+    return "(runs.test = ? OR runs.test LIKE ?)", [test, "%/" + test]
+
+
+def query_runs(conn, test=None, limit=20):
+    """最近的运行记录"""
+    sql = (
+        "SELECT id, recorded_at, test, flags, maze_rev, passed, wall_time, "
+        "max_rss FROM runs"
+    )
+    params = []
+    if test:
+        cond, params = make_test_filter(test)
+        sql += " WHERE " + cond
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def query_trend(conn, test, metric, phase=None, flags=None, limit=50):
+    """按 maze 版本聚合指标，返回 [(maze_rev, last_recorded_at, runs, avg_value)]
+
+    phase 按子串匹配阶段名（如 WalkJemalloc 匹配
+    maze/mallocer/jemalloc.WalkJemalloc），同一次运行中匹配多个阶段时求和。
+    结果按版本最后一次运行的时间从旧到新排列。
+    """
+    cond, params = make_test_filter(test)
+    if flags is not None:
+        cond += " AND runs.flags = ?"
+        params.append(flags)
+
+    if phase:
+        if metric not in PHASE_METRICS:
+            raise ValueError("Phase metric must be one of %s" % PHASE_METRICS)
+        value_sql = (
+            "(SELECT SUM(phases.%s) FROM phases WHERE phases.run_id = runs.id "
+            "AND phases.name LIKE ?)" % metric
+        )
+        params = ["%" + phase + "%"] + params
+    else:
+        if metric not in RUN_METRICS:
+            raise ValueError("Run metric must be one of %s" % RUN_METRICS)
+        value_sql = "runs.%s" % metric
+
+    sql = (
+        "SELECT maze_rev, MAX(recorded_at), COUNT(*), AVG(value), MAX(id) AS last_id "
+        "FROM (SELECT runs.id AS id, runs.recorded_at AS recorded_at, "
+        "COALESCE(runs.maze_rev, '-') AS maze_rev, %s AS value FROM runs WHERE %s) "
+        "WHERE value IS NOT NULL GROUP BY maze_rev ORDER BY last_id DESC LIMIT ?"
+        % (value_sql, cond)
+    )
+    params.append(limit)
+    rows = conn.execute(sql, params).fetchall()
+    rows.reverse()
+    return [row[:4] for row in rows]
+
+
+def query_expected_values(conn, metric="wall_time", recent=10):
+    """每个 (test, flags) 最近 recent 次运行中 metric 的中位数，test 按 normalize_test 统一
+
+    Returns:
+        dict: {(test, flags): value}
+    """
+    if metric not in RUN_METRICS:
+        raise ValueError("Run metric must be one of %s" % RUN_METRICS)
+
+    samples = {}
+    rows = conn.execute(
+        "SELECT test, flags, %s FROM runs WHERE %s IS NOT NULL ORDER BY id DESC"
+        % (metric, metric)
+    )
+    for test, flags, value in rows:
+        values = samples.setdefault((normalize_test(test), flags), [])
+        if len(values) < recent:
+            values.append(value)
+
+    expected = {}
+    for key, values in samples.items():
+        values.sort()
+        mid = len(values) // 2
+        if len(values) % 2:
+            expected[key] = values[mid]
+        else:
+            expected[key] = (values[mid - 1] + values[mid]) / 2.0
+    return expected
+
+
+def format_value(metric, value):
+    """格式化指标值"""
+    if value is None:
+        return "N/A"
+    if metric in ("max_rss", "rss", "core_size", "vms"):
+        return "%.1fM" % (value / 1024.0 / 1024.0)
+    return "%.3fs" % value
+
+
+def print_trend(rows, metric, width=40):
+    """以文本柱状图打印趋势"""
+    if not rows:
+        print("No records found")
+        return
+
+    peak = max(row[3] for row in rows) or 1
+    for maze_rev, recorded_at, count, value in rows:
+        bar = "#" * max(1, int(round(value * width / peak)))
+        print(
+            "%-12s %s  n=%-3d %10s  %s"
+            % ((maze_rev or "-")[:12], recorded_at, count, format_value(metric, value), bar)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query maze performance history")
+    parser.add_argument("--db", default=default_db_path(), help="Database path")
+    sub = parser.add_subparsers(dest="command")
+
+    runs_parser = sub.add_parser("runs", help="List recent runs")
+    runs_parser.add_argument("--test", help="Test directory, e.g. cpp/20260201-basic-malloc")
+    runs_parser.add_argument("--limit", type=int, default=20)
+
+    trend_parser = sub.add_parser("trend", help="Show a metric across maze revisions")
+    trend_parser.add_argument("--test", required=True, help="Test directory")
+    trend_parser.add_argument("--phase", help="Phase name substring, e.g. WalkJemalloc")
+    trend_parser.add_argument(
+        "--metric",
+        help="Run metric %s or phase metric %s (default: wall_time / duration)"
+        % (RUN_METRICS, PHASE_METRICS),
+    )
+    trend_parser.add_argument(
+        "--flags", help='Only runs with these maze flags, e.g. "--no-cpp --limit 500"'
+    )
+    trend_parser.add_argument("--limit", type=int, default=50, help="Number of revisions")
+
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+        sys.exit(1)
+
+    if not os.path.exists(args.db):
+        print("Error: Database not found: %s" % args.db)
+        sys.exit(1)
+
+    conn = open_db(args.db)
+    try:
+        if args.command == "runs":
+            for row in query_runs(conn, test=args.test, limit=args.limit):
+                run_id, recorded_at, test, flags, maze_rev, passed, wall, rss = row
+                print(
+                    "%6d %s %-12s %-8s %10s %10s  %s %s"
+                    % (
+                        run_id,
+                        recorded_at,
+                        (maze_rev or "-")[:12],
+                        {1: "PASSED", 0: "FAILED"}.get(passed, "-"),
+                        format_value("wall_time", wall),
+                        format_value("max_rss", rss),
+                        test,
+                        flags,
+                    )
+                )
+        else:
+            metric = args.metric or ("duration" if args.phase else "wall_time")
+            try:
+                rows = query_trend(
+                    conn,
+                    args.test,
+                    metric,
+                    phase=args.phase,
+                    flags=args.flags,
+                    limit=args.limit,
+                )
+            except ValueError as e:
+                print("Error: %s" % str(e))
+                sys.exit(1)
+            print_trend(rows, metric)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内存块的 struct-of-arrays 表示和并行 LSD 基数排序
+
+maze 在各个堆遍历器结束后、c.Main 之前执行 MemoryPieceManager.Sort，按地址对所有
+内存块做比较排序；几千万个 chunk 时这一步在 profile 中很明显。chunk 地址是 48 位
+整数，可以改为在紧凑的平行数组 (addr, size, kind) 上做 LSD 基数排序：
+
+- 每轮按地址的 16 位做计数排序，48 位地址 3 轮完成，与比较排序的 log n 无关
+- 每轮只移动地址和 u32 下标两个数组，排序完成后按下标一次性重排 size / kind
+- 每轮分为两步，都按 worker 切分输入：各自统计直方图，合并前缀和后各自把
+  自己的切片分散写到互不重叠的位置，因此 worker 之间不需要同步
+- 每个内存块 17 字节（u64 地址、u64 大小、u8 类别），排序时额外 16 字节的
+  地址和下标缓冲，没有每个对象的头部和指针
+
+本模块是 maze 中这条排序路径的参考实现，bench 用 core 中的 ptmalloc chunk
+（或随机数据）比较基数排序与对象列表上的比较排序，并检查两者结果一致。
+run_test.py --piece-sort radix 通过 MAZE_PIECE_SORT 让 maze 使用这条路径。
+
+Usage:
+    python3 piece_sort.py bench                     # 语料中最大的 3 个 core
+    python3 piece_sort.py bench cpp/20260225-cpp-long-list-ptr-array --jobs 1,4
+    python3 piece_sort.py bench --synthetic 2000000 --jobs 1,2,4,8
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import array
+import random
+import tarfile
+import ctypes
+import argparse
+import operator
+import multiprocessing
+
+import cli_util
+import tar_manifest
+import interval_index
+
+
+# 地址有效位数和每轮排序的位数
+ADDRESS_BITS = 48
+RADIX_BITS = 16
+RADIX_SIZE = 1 << RADIX_BITS
+RADIX_MASK = RADIX_SIZE - 1
+
+ADDRESS_TYPECODE = interval_index.ADDRESS_TYPECODE
+INDEX_TYPECODE = "I"
+
+# 内存块类别（对应 maze 中的分配器）
+KIND_PTMALLOC = 0
+
+# 每个内存块的字节数：u64 地址 + u64 大小 + u8 类别
+PIECE_BYTES = 8 + 8 + 1
+# 排序时额外的缓冲：目标地址数组 + 两个 u32 下标数组
+SORT_SCRATCH_BYTES = 8 + 4 + 4
+
+DEFAULT_LARGEST = 3
+
+# 并行排序时 fork 出的 worker 共享的数组，见 _init_shared
+_shared = {}
+
+
+class PieceArrays(object):
+    """内存块的平行数组：addrs[i]、sizes[i]、kinds[i] 描述第 i 个内存块"""
+
+    def __init__(self, addrs=None, sizes=None, kinds=None):
+        self.addrs = addrs if addrs is not None else array.array(ADDRESS_TYPECODE)
+        self.sizes = sizes if sizes is not None else array.array(ADDRESS_TYPECODE)
+        self.kinds = kinds if kinds is not None else array.array("B")
+
+    @classmethod
+    def from_chunks(cls, chunks, kind=KIND_PTMALLOC):
+        """由 [(start, end)] 构建"""
+        pieces = cls()
+        for start, end in chunks:
+            pieces.append(start, end - start, kind)
+        return pieces
+
+    def append(self, addr, size, kind):
+        self.addrs.append(addr)
+        self.sizes.append(size)
+        self.kinds.append(kind)
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.addrs, self.sizes, self.kinds))
+
+    def gather(self, order):
+        """按下标数组重排，返回新的 PieceArrays"""
+        addrs, sizes, kinds = self.addrs, self.sizes, self.kinds
+        return PieceArrays(
+            array.array(ADDRESS_TYPECODE, (addrs[i] for i in order)),
+            array.array(ADDRESS_TYPECODE, (sizes[i] for i in order)),
+            array.array("B", (kinds[i] for i in order)),
+        )
+
+
+def split_ranges(n, jobs):
+    """把 [0, n) 切成 jobs 段连续区间"""
+    step = (n + jobs - 1) // jobs if n else 1
+    return [(lo, min(lo + step, n)) for lo in range(0, n, step)]
+
+
+def count_digits(keys, lo, hi, shift):
+    """统计 keys[lo:hi] 第 shift 位开始的 RADIX_BITS 位的直方图"""
+    counts = [0] * RADIX_SIZE
+    for i in range(lo, hi):
+        counts[(keys[i] >> shift) & RADIX_MASK] += 1
+    return counts
+
+
+def scatter_digits(keys, index, out_keys, out_index, lo, hi, shift, offsets):
+    """把 keys[lo:hi] 按 offsets 分散写入目标数组，offsets 原地递增"""
+    for i in range(lo, hi):
+        key = keys[i]
+        digit = (key >> shift) & RADIX_MASK
+        pos = offsets[digit]
+        out_keys[pos] = key
+        out_index[pos] = index[i]
+        offsets[digit] = pos + 1
+
+
+def prefix_offsets(histograms):
+    """由每个 worker 的直方图计算各 worker 每个桶的起始写入位置
+
+    桶按数字排序，同一个桶内按 worker 顺序排列，保证排序稳定。
+    """
+    offsets = [[0] * RADIX_SIZE for _ in histograms]
+    total = 0
+    for digit in range(RADIX_SIZE):
+        for w, counts in enumerate(histograms):
+            offsets[w][digit] = total
+            total += counts[digit]
+    return offsets
+
+
+def radix_sort_order(addrs):
+    """单线程 LSD 基数排序，返回按地址排序的下标数组"""
+    n = len(addrs)
+    keys = array.array(ADDRESS_TYPECODE, addrs)
+    index = array.array(INDEX_TYPECODE, range(n))
+    out_keys = array.array(ADDRESS_TYPECODE, keys)
+    out_index = array.array(INDEX_TYPECODE, index)
+    for shift in range(0, ADDRESS_BITS, RADIX_BITS):
+        offsets = prefix_offsets([count_digits(keys, 0, n, shift)])[0]
+        scatter_digits(keys, index, out_keys, out_index, 0, n, shift, offsets)
+        keys, out_keys = out_keys, keys
+        index, out_index = out_index, index
+    return index
+
+
+def typed_view(raw, typecode):
+    """共享内存上的 memoryview，按下标访问比 ctypes 数组快；Python 2 没有 cast，直接用 ctypes 数组"""
+    try:
+        return memoryview(raw).cast("B").cast(typecode)
+    except (AttributeError, TypeError):
+        return raw
+
+
+def _init_shared(buffers):
+    _shared.clear()
+    for name, raw in buffers.items():
+        _shared[name] = typed_view(raw, "Q" if name.endswith("keys") else "I")
+
+
+def pass_buffers(buffers, parity):
+    """第 parity 轮的 (源地址, 源下标, 目标地址, 目标下标)，每轮交换源和目标"""
+    if parity % 2 == 0:
+        return buffers["keys"], buffers["index"], buffers["out_keys"], buffers["out_index"]
+    return buffers["out_keys"], buffers["out_index"], buffers["keys"], buffers["index"]
+
+
+def _count_task(task):
+    lo, hi, shift, parity = task
+    keys = pass_buffers(_shared, parity)[0]
+    return count_digits(keys, lo, hi, shift)
+
+
+def _scatter_task(task):
+    lo, hi, shift, parity, offsets = task
+    keys, index, out_keys, out_index = pass_buffers(_shared, parity)
+    scatter_digits(keys, index, out_keys, out_index, lo, hi, shift, offsets)
+
+
+def parallel_radix_sort_order(addrs, jobs):
+    """多进程 LSD 基数排序，返回按地址排序的下标数组
+
+    地址和下标放在 fork 前分配的共享内存中；每轮先并行统计各切片的直方图，
+    合并出每个切片每个桶的写入位置，再并行分散写入。
+    """
+    n = len(addrs)
+    if jobs <= 1 or n < jobs or not hasattr(os, "fork"):
+        return radix_sort_order(addrs)
+
+    from multiprocessing import sharedctypes
+
+    buffers = {
+        "keys": sharedctypes.RawArray(ctypes.c_uint64, n),
+        "index": sharedctypes.RawArray(ctypes.c_uint32, n),
+        "out_keys": sharedctypes.RawArray(ctypes.c_uint64, n),
+        "out_index": sharedctypes.RawArray(ctypes.c_uint32, n),
+    }
+    buffers["keys"][:] = addrs
+    buffers["index"][:] = range(n)
+    ranges = split_ranges(n, jobs)
+
+    pool = multiprocessing.Pool(jobs, initializer=_init_shared, initargs=(buffers,))
+    try:
+        parity = 0
+        for shift in range(0, ADDRESS_BITS, RADIX_BITS):
+            histograms = pool.map(
+                _count_task, [(lo, hi, shift, parity) for lo, hi in ranges]
+            )
+            offsets = prefix_offsets(histograms)
+            pool.map(
+                _scatter_task,
+                [(lo, hi, shift, parity, offsets[w]) for w, (lo, hi) in enumerate(ranges)],
+            )
+            parity += 1
+    finally:
+        pool.close()
+        pool.join()
+
+    # 结果在下一轮的源缓冲中
+    index = pass_buffers(buffers, parity)[1]
+    return array.array(INDEX_TYPECODE, index)
+
+
+def radix_sort(pieces, jobs=1):
+    """按地址排序，返回新的 PieceArrays"""
+    return pieces.gather(parallel_radix_sort_order(pieces.addrs, jobs))
+
+
+# ---------------------------------------------------------------------------
+# 对照：每个内存块一个对象，按地址比较排序
+# ---------------------------------------------------------------------------
+
+
+class MemoryPiece(object):
+    """对照组：maze 中每个内存块是一个独立的堆对象"""
+
+    def __init__(self, addr, size, kind):
+        self.addr = addr
+        self.size = size
+        self.kind = kind
+
+
+def object_bytes(piece):
+    """单个对象及其字段的字节数（小整数共享，不计入）"""
+    total = sys.getsizeof(piece) + sys.getsizeof(piece.__dict__)
+    return total + sys.getsizeof(piece.addr) + sys.getsizeof(piece.size)
+
+
+def comparison_sort(objects):
+    return sorted(objects, key=operator.attrgetter("addr"))
+
+
+# ---------------------------------------------------------------------------
+# benchmark
+# ---------------------------------------------------------------------------
+
+
+def find_largest_tests(testdata_dir, count):
+    """按 core 大小（清单中 core member 的大小，没有清单时用 tarball 大小）选出最大的测试目录"""
+    sizes = {}
+    for tarball in tar_manifest.find_all_tarballs(testdata_dir):
+        size = os.path.getsize(tarball)
+        manifest = tar_manifest.read_manifest(tarball)
+        if manifest:
+            for member in manifest.get("members", []):
+                if tar_manifest.pid_from_member_name(os.path.basename(member["name"])):
+                    size = member["size"]
+        test_dir = os.path.relpath(os.path.dirname(tarball), testdata_dir)
+        sizes[test_dir] = max(size, sizes.get(test_dir, 0))
+    ordered = sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+    return ordered[:count]
+
+
+def walker_order(chunks, seed=1):
+    """模拟遍历器的输出顺序：按 2M 区域切成有序的段，段的顺序打乱
+
+    多个 arena / 遍历器的结果拼接后，MemoryPieceManager 看到的就是若干有序段。
+    """
+    runs = {}
+    for chunk in chunks:
+        runs.setdefault(chunk[0] >> interval_index.REGION_SHIFT, []).append(chunk)
+    ordered = [runs[key] for key in sorted(runs)]
+    random.Random(seed).shuffle(ordered)
+    return [chunk for run in ordered for chunk in run]
+
+
+def shuffled_order(chunks, seed=1):
+    chunks = list(chunks)
+    random.Random(seed).shuffle(chunks)
+    return chunks
+
+
+def bench_chunks(label, chunks, worker_counts):
+    """对同一组 chunk 按两种输入顺序比较各种排序，结果不一致时返回 False"""
+    clock = getattr(time, "perf_counter", time.time)
+    expected = sorted(chunks)
+    expected_addrs = array.array(ADDRESS_TYPECODE, (start for start, _ in expected))
+    ok = True
+
+    print("\n%s: %d pieces" % (label, len(chunks)))
+    objects = [MemoryPiece(start, end - start, KIND_PTMALLOC) for start, end in chunks]
+    per_object = object_bytes(objects[0]) + 8 if objects else 0
+    del objects
+    print("  Memory/piece: objects %d B (+ list slot), struct-of-arrays %d B (+ %d B while sorting)" % (
+        per_object, PIECE_BYTES, SORT_SCRATCH_BYTES))
+    print("  %-10s %-18s %10s %10s" % ("Order", "Sort", "Time", "Speedup"))
+
+    for order_name, order in (("walker", walker_order), ("shuffled", shuffled_order)):
+        input_chunks = order(chunks)
+        objects = [MemoryPiece(start, end - start, KIND_PTMALLOC) for start, end in input_chunks]
+        start = clock()
+        result = comparison_sort(objects)
+        baseline = clock() - start
+        if [p.addr for p in result] != list(expected_addrs):
+            print("  ❌ Comparison sort result is not sorted")
+            ok = False
+        del objects, result
+        print("  %-10s %-18s %9.2fs %10s" % (order_name, "comparison", baseline, "1.00x"))
+
+        pieces = PieceArrays.from_chunks(input_chunks)
+        for jobs in worker_counts:
+            start = clock()
+            result = radix_sort(pieces, jobs=jobs)
+            elapsed = clock() - start
+            if result.addrs != expected_addrs:
+                print("  ❌ Radix sort (%d jobs) differs from comparison sort" % jobs)
+                ok = False
+            print("  %-10s %-18s %9.2fs %9.2fx" % (
+                order_name, "radix jobs=%d" % jobs, elapsed,
+                baseline / elapsed if elapsed else 0.0))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Struct-of-arrays radix sort for memory pieces")
+    sub = parser.add_subparsers(dest="command")
+    bench_parser = sub.add_parser("bench", help="Compare radix sort with a comparison sort")
+    bench_parser.add_argument("sources", nargs="*",
+                              help="Test dirs, tarballs or core files (default: largest cores)")
+    bench_parser.add_argument("--largest", type=int, default=DEFAULT_LARGEST,
+                              help="Number of largest cores to use when no source is given "
+                                   "(default: %(default)s)")
+    bench_parser.add_argument("--synthetic", type=int, metavar="N",
+                              help="Use N random chunks instead of a core")
+    bench_parser.add_argument("--jobs", default="1,%d" % multiprocessing.cpu_count(),
+                              help="Comma separated radix sort worker counts (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command != "bench":
+        parser.print_help()
+        sys.exit(1)
+    try:
+        worker_counts = cli_util.parse_worker_counts(args.jobs)
+    except ValueError:
+        print("Error: Invalid worker counts: %s" % args.jobs)
+        sys.exit(1)
+
+    if args.synthetic:
+        chunks, _ = interval_index.synthetic_workload(args.synthetic, 0)
+        sys.exit(0 if bench_chunks("synthetic", chunks, worker_counts) else 1)
+
+    sources = [(source, None) for source in args.sources]
+    if not sources:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        sources = find_largest_tests(testdata_dir, args.largest)
+        if not sources:
+            print("Error: No coredump tarballs found")
+            sys.exit(1)
+
+    ok = True
+    for source, size in sources:
+        label = source if size is None else "%s (%.1f MB)" % (source, size / (1024.0 * 1024))
+        try:
+            chunks, _ = interval_index.load_core_workload(
+                interval_index.resolve_source(source), 0)
+        except (RuntimeError, ValueError, IOError, OSError, tarfile.TarError) as e:
+            print("\n%s: skipped (%s)" % (label, str(e)))
+            continue
+        ok = bench_chunks(label, chunks, worker_counts) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
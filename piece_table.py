@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内存块的紧凑表示：定宽平行数组 + 类型名字符串表
+
+maze 分析 18.5MB 的 basic-malloc core 时报告 `Mem 2.8G`，峰值内存是 core 的 100 多倍，
+主要来自每个 chunk 一个堆对象（对象头、指针、每个对象各自的类型名字符串）。
+本模块是 maze 中内存块存储的参考实现：
+
+- 每个内存块是平行数组中的一行：u64 地址、u64 大小、u8 分配器、u32 类型槽位、u8 标志，
+  共 22 字节，没有对象头和指针
+- 类型名只在 TypeTable 中存一次：所有名字拼接在一个字节串中，按槽位记录偏移和
+  maze-result.json 中的 type_id（如 300000001000004）；内存块只记录 4 字节的槽位
+- 继承 piece_sort.PieceArrays，可以直接用 piece_sort.radix_sort 按地址排序
+
+内存随内存块数量线性增长，每个内存块的开销固定，estimate_peak_bytes 据此估算
+大 core 的峰值内存。bench 用 core 中的 ptmalloc chunk（或随机数据）分别构建本表示和
+每个内存块一个对象的表示，比较实测 RSS 增量，并按 core 大小外推。
+
+Usage:
+    python3 piece_table.py bench cpp/20260225-cpp-long-list-ptr-array
+    python3 piece_table.py bench --synthetic 2000000 --project-core-size 64G
+"""
+from __future__ import print_function
+import gc
+import os
+import sys
+import array
+import tarfile
+import argparse
+
+import cli_util
+import interval_index
+import piece_sort
+
+
+ADDRESS_TYPECODE = piece_sort.ADDRESS_TYPECODE
+TYPE_SLOT_TYPECODE = "I"
+
+# 分配器，下标即内存块的 kind
+ALLOCATORS = ["ptmalloc", "jemalloc", "mimalloc", "pymempool"]
+ALLOCATOR_PTMALLOC = ALLOCATORS.index("ptmalloc")
+
+# 内存块标志
+FLAG_WEAK = 1  # 只由 weak 分类确定类型
+FLAG_ROOT = 2  # 被 .data/.bss 或栈直接引用
+
+# 每个内存块的字节数：u64 地址 + u64 大小 + u8 分配器 + u32 类型槽位 + u8 标志
+PIECE_BYTES = 8 + 8 + 1 + 4 + 1
+
+# bench 中没有真实类型时生成的 type_id 起点（与 maze 中 malloc(N) 类型的编号方式无关）
+SYNTHETIC_TYPE_ID_BASE = 300000001000000
+
+
+class TypeTable(object):
+    """类型名字符串表：每个类型一个槽位，记录 type_id 和名字在 blob 中的范围"""
+
+    def __init__(self):
+        self.type_ids = array.array(ADDRESS_TYPECODE)
+        self.offsets = array.array(ADDRESS_TYPECODE, [0])
+        self.blob = bytearray()
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def intern(self, type_id, name):
+        """返回 type_id 的槽位，第一次出现时追加名字"""
+        slot = self.slots.get(type_id)
+        if slot is None:
+            slot = len(self.type_ids)
+            self.type_ids.append(type_id)
+            self.blob.extend(name.encode("utf-8"))
+            self.offsets.append(len(self.blob))
+            self.slots[type_id] = slot
+        return slot
+
+    def name(self, slot):
+        return self.blob[self.offsets[slot] : self.offsets[slot + 1]].decode("utf-8")
+
+    def type_id(self, slot):
+        return self.type_ids[slot]
+
+    def nbytes(self):
+        return len(self.blob) + sum(
+            a.itemsize * len(a) for a in (self.type_ids, self.offsets)
+        )
+
+
+class PieceTable(piece_sort.PieceArrays):
+    """内存块的定宽平行数组，kinds 为分配器（ALLOCATORS 的下标）
+
+    Args:
+        types: 共享的 TypeTable，None 时新建
+    """
+
+    def __init__(self, addrs=None, sizes=None, kinds=None, type_slots=None, flags=None,
+                 types=None):
+        piece_sort.PieceArrays.__init__(self, addrs, sizes, kinds)
+        self.type_slots = (
+            type_slots if type_slots is not None else array.array(TYPE_SLOT_TYPECODE)
+        )
+        self.flags = flags if flags is not None else array.array("B")
+        self.types = types if types is not None else TypeTable()
+
+    def append(self, addr, size, kind, type_slot=0, flags=0):
+        piece_sort.PieceArrays.append(self, addr, size, kind)
+        self.type_slots.append(type_slot)
+        self.flags.append(flags)
+
+    def add(self, addr, size, allocator, type_id, type_name, flags=0):
+        """追加一个内存块，类型名按 type_id 驻留"""
+        self.append(addr, size, allocator, self.types.intern(type_id, type_name), flags)
+
+    def nbytes(self):
+        return piece_sort.PieceArrays.nbytes(self) + sum(
+            a.itemsize * len(a) for a in (self.type_slots, self.flags)
+        )
+
+    def gather(self, order):
+        """按下标数组重排，返回共享同一个 TypeTable 的新 PieceTable"""
+        pieces = piece_sort.PieceArrays.gather(self, order)
+        type_slots, flags = self.type_slots, self.flags
+        return PieceTable(
+            pieces.addrs,
+            pieces.sizes,
+            pieces.kinds,
+            array.array(TYPE_SLOT_TYPECODE, (type_slots[i] for i in order)),
+            array.array("B", (flags[i] for i in order)),
+            types=self.types,
+        )
+
+    def aggregate(self, limit=None):
+        """按类型汇总，返回与 maze-result.json 的 items 相同格式的列表（按总大小降序）"""
+        amounts = [0] * len(self.types)
+        totals = [0] * len(self.types)
+        sizes = self.sizes
+        for i, slot in enumerate(self.type_slots):
+            amounts[slot] += 1
+            totals[slot] += sizes[i]
+        slots = sorted(
+            (slot for slot in range(len(self.types)) if amounts[slot]),
+            key=lambda slot: (-totals[slot], self.types.type_id(slot)),
+        )
+        if limit:
+            slots = slots[:limit]
+        return [
+            {
+                "order": order,
+                "amount": amounts[slot],
+                "total_size": totals[slot],
+                "avg_size": totals[slot] // amounts[slot],
+                "type": self.types.name(slot),
+                "type_id": self.types.type_id(slot),
+            }
+            for order, slot in enumerate(slots, 1)
+        ]
+
+
+def estimate_peak_bytes(num_pieces, num_types=0, avg_type_name=32):
+    """按内存块数量估算 PieceTable 的内存（含按地址排序时的缓冲）"""
+    per_piece = PIECE_BYTES + piece_sort.SORT_SCRATCH_BYTES
+    return num_pieces * per_piece + num_types * (avg_type_name + 16)
+
+
+# ---------------------------------------------------------------------------
+# benchmark
+# ---------------------------------------------------------------------------
+
+
+def read_rss():
+    """当前进程的 RSS（字节），不支持时返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+def chunk_type(size, types):
+    """bench 用的类型：按大小命名为 malloc(N)，同一大小同一个 type_id"""
+    name = "malloc(%d)" % size
+    type_id = types.get(name)
+    if type_id is None:
+        type_id = SYNTHETIC_TYPE_ID_BASE + len(types)
+        types[name] = type_id
+    return type_id, name
+
+
+def build_objects(chunks):
+    """对照组：每个内存块一个对象，每个对象有自己的类型名字符串"""
+    types = {}
+    objects = []
+    for start, end in chunks:
+        type_id, name = chunk_type(end - start, types)
+        piece = piece_sort.MemoryPiece(start, end - start, ALLOCATOR_PTMALLOC)
+        piece.type_id = type_id
+        # maze 中每个内存块的类型名是各自拼接出来的字符串
+        piece.type_name = "".join(["malloc(", str(end - start), ")"])
+        piece.flags = 0
+        objects.append(piece)
+    return objects
+
+
+def build_table(chunks):
+    types = {}
+    table = PieceTable()
+    for start, end in chunks:
+        type_id, name = chunk_type(end - start, types)
+        table.add(start, end - start, ALLOCATOR_PTMALLOC, type_id, name)
+    return table
+
+
+def measure(build, chunks):
+    """返回 (结果, RSS 增量)"""
+    gc.collect()
+    before = read_rss()
+    result = build(chunks)
+    gc.collect()
+    after = read_rss()
+    if before is None or after is None:
+        return result, None
+    return result, max(after - before, 0)
+
+
+def run_bench(label, chunks, core_size, project_core_size):
+    """比较两种表示的内存，并按 core 大小外推；汇总结果不一致时返回 False"""
+    n = len(chunks)
+    print("%s: %d pieces" % (label, n))
+
+    table, table_rss = measure(build_table, chunks)
+    items = table.aggregate()
+    if sum(item["amount"] for item in items) != n:
+        print("  ❌ Aggregated amounts do not add up to the piece count")
+        return False
+    print("  Types: %d interned, string table %s" % (
+        len(table.types), cli_util.format_size(table.types.nbytes())))
+
+    objects, objects_rss = measure(build_objects, chunks)
+    object_bytes = piece_sort.object_bytes(objects[0]) if objects else 0
+    del objects
+    gc.collect()
+
+    print("  %-16s %12s %12s %12s" % ("Representation", "Bytes/piece", "RSS delta", "RSS/piece"))
+    for name, per_piece, rss in (
+        ("objects", object_bytes, objects_rss),
+        ("piece table", table.nbytes() // max(n, 1), table_rss),
+    ):
+        print("  %-16s %12d %12s %12s" % (
+            name, per_piece, cli_util.format_size(rss),
+            "%.0f" % (float(rss) / n) if rss is not None and n else "N/A"))
+
+    if core_size and project_core_size:
+        projected = n * project_core_size // core_size
+        print("  Projected for a %s core (%d pieces): piece table %s, objects %s" % (
+            cli_util.format_size(project_core_size), projected,
+            cli_util.format_size(estimate_peak_bytes(projected, len(table.types))),
+            cli_util.format_size(projected * float(objects_rss) / n) if objects_rss and n else "N/A"))
+    return True
+
+
+def synthetic_chunks(num_chunks, seed=1):
+    chunks, _ = interval_index.synthetic_workload(num_chunks, 0, seed=seed)
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact memory piece table")
+    sub = parser.add_subparsers(dest="command")
+    bench_parser = sub.add_parser("bench", help="Compare memory use with one object per piece")
+    bench_parser.add_argument("source", nargs="?", help="Test dir, tarball or core file")
+    bench_parser.add_argument("--synthetic", type=int, metavar="N",
+                              help="Use N random chunks instead of a core")
+    bench_parser.add_argument("--project-core-size", default="64G",
+                              help="Extrapolate to a core of this size (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command != "bench" or not (args.source or args.synthetic):
+        parser.print_help()
+        sys.exit(1)
+    try:
+        project_core_size = cli_util.parse_size(args.project_core_size)
+    except ValueError:
+        print("Error: Invalid size: %s" % args.project_core_size)
+        sys.exit(1)
+
+    if args.synthetic:
+        chunks = synthetic_chunks(args.synthetic)
+        # 随机数据按块的总大小代替 core 大小外推
+        core_size = sum(end - start for start, end in chunks)
+        label = "synthetic"
+    else:
+        source = interval_index.resolve_source(args.source)
+        try:
+            core_path = interval_index.find_core_file(source)
+            chunks, _ = interval_index.load_core_workload(core_path, 0)
+        except (RuntimeError, ValueError, IOError, OSError, tarfile.TarError) as e:
+            print("Error: %s" % str(e))
+            sys.exit(1)
+        core_size = os.path.getsize(core_path)
+        label = "%s (core %s)" % (args.source, cli_util.format_size(core_size))
+
+    sys.exit(0 if run_bench(label, chunks, core_size, project_core_size) else 1)
+
+
+if __name__ == "__main__":
+    main()
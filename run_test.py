@@ -9,9 +9,28 @@ import glob
 import importlib
 import subprocess
 import shutil
-import tarfile
 import errno
-
+import collections
+import heapq
+import signal
+import threading
+import fnmatch
+import hashlib
+import multiprocessing
+import time
+
+import cli_util
+import perf_history
+import tar_manifest
+import coredump_store
+import zstd_archive
+import symbol_cache
+import type_db
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 if sys.version_info[0] >= 3:
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
@@ -39,59 +58,207 @@ def ensure_dir(path):
         raise RuntimeError("Failed to create directory %s: %s" % (path, str(e)))
 
 
-def print_output_excerpt(output, max_lines=40):
-    """打印输出末尾片段，便于快速定位问题"""
-    if not output:
-        return
+# 并行模式下每个 job 使用独立的工作根目录：maze 会在 cwd 解包 tarball、
+# 写 maze-result.json 和 postman-db，这些运行期产物不能在 job 之间共享。
+JOB_ROOT_EXCLUDE_PATTERNS = [
+    "tmp",
+    "postman-db",
+    "maze-result*.json",
+    "maze.log",
+    "maze.py.log",
+    "maps",
+    "core.*",
+    "*.exe",
+    "*.md5",
+    "*.debug",
+    "ctypes-*",
+    "libthread_db.so",
+    ".s3_*.json",
+    ".use_parse_dwarf*.json",
+]
+
+
+# maze 的 --limit 参数，同时参与结果缓存 key 的计算
+MAZE_LIMIT = 500
+
+# mimalloc 各版本的结构体布局表（cpp/mimalloc_layouts.py 生成），相对 maze 根目录
+MIMALLOC_LAYOUTS_FILE = os.path.join("testdata", "cpp", "mimalloc_layouts.json")
+
+# maze 程序文件（相对 maze 根目录，不存在的跳过），maze_reads_env 在其中查找环境变量名
+MAZE_PROGRAM_FILES = ["maze", ".maze", ".gdbcommand.py"]
+
+# 参与结果缓存 key 计算的 maze 文件；布局表决定 mimalloc 的遍历结果，
+# 也视为 maze 程序的一部分，但它是数据，不参与环境变量查找
+MAZE_CACHE_KEY_FILES = MAZE_PROGRAM_FILES + [MIMALLOC_LAYOUTS_FILE]
+
+# 结果缓存格式版本，缓存布局变化时递增以废弃旧缓存
+RESULT_CACHE_VERSION = 1
+
+# 传给 maze 的预解压目录
+EXTRACTED_DIR_ENV = "MAZE_EXTRACTED_DIR"
+
+# 传给 maze 的堆遍历并行度（按 arena / heap segment 分给 worker），未设置时由 maze 决定
+WALKER_JOBS_ENV = "MAZE_WALKER_JOBS"
+
+# 传给 maze 的 MemoryPieceManager 排序方式，未设置时使用 maze 默认的比较排序
+PIECE_SORT_ENV = "MAZE_PIECE_SORT"
+PIECE_SORT_CHOICES = ["comparison", "radix"]
+
+# 传给 maze 的类型数据库目录
+TYPE_DB_ENV = "MAZE_TYPE_DB"
+
+
+def get_maze_root():
+    """返回 maze 根目录（testdata 的父目录）"""
+    testdata_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.dirname(testdata_dir)
+
+
+def make_phases_path(maze_root, test_dir, py_merge=False):
+    """返回测试的 phases.json 路径"""
+    log_name = make_log_name(test_dir, py_merge=py_merge)
+    return os.path.join(maze_root, "tmp", "%s.phases.json" % log_name)
+
+
+def get_maze_revision(maze_root):
+    """返回 maze 仓库的 git revision，有未提交修改时追加 -dirty"""
+    try:
+        with open(os.devnull, "w") as devnull:
+            rev = subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=maze_root, stderr=devnull
+            )
+            dirty = subprocess.check_output(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=maze_root,
+                stderr=devnull,
+            )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    rev = rev.decode("utf-8").strip()
+    if dirty.strip():
+        rev += "-dirty"
+    return rev
+
 
-    lines = output.splitlines()
-    if len(lines) <= max_lines:
-        print(output)
+def prepare_job_root(maze_root, job_name, overrides=None):
+    """为并行 job 创建隔离的工作根目录
+
+    目录位于 <maze_root>/tmp/jobs/<job_name>，通过符号链接复用 maze 根目录下的
+    脚本、二进制和工具链，但排除运行期产物（结果文件、postman-db、解包文件），
+    保证并行 job 之间不共享任何可写文件。
+
+    Args:
+        overrides: {相对路径: 目标路径}，如 {"bin/s3": ...}，用目标替换 maze 根目录
+            下的对应文件；所在的一级目录展开为逐项符号链接的真实目录
+    """
+    job_root = os.path.join(maze_root, "tmp", "jobs", job_name)
+    if os.path.isdir(job_root):
+        shutil.rmtree(job_root)
+    ensure_dir(job_root)
+
+    for name in os.listdir(maze_root):
+        if any(fnmatch.fnmatch(name, p) for p in JOB_ROOT_EXCLUDE_PATTERNS):
+            continue
+        os.symlink(os.path.join(maze_root, name), os.path.join(job_root, name))
+
+    for rel_path, target in sorted((overrides or {}).items()):
+        parts = rel_path.split("/")
+        if len(parts) > 1:
+            top_dir = os.path.join(job_root, parts[0])
+            if os.path.islink(top_dir):
+                os.remove(top_dir)
+                ensure_dir(top_dir)
+                for name in os.listdir(os.path.join(maze_root, parts[0])):
+                    os.symlink(
+                        os.path.join(maze_root, parts[0], name), os.path.join(top_dir, name)
+                    )
+            ensure_dir(os.path.join(job_root, *parts[:-1]))
+        path = os.path.join(job_root, *parts)
+        if os.path.lexists(path):
+            os.remove(path)
+        os.symlink(target, path)
+
+    return job_root
+
+
+# 没有性能历史时，按 tarball 大小估计 maze 峰值 RSS 的倍数
+# （basic-malloc 的 3.4MB tarball 对应约 1GB RSS）
+MEM_ESTIMATE_TARBALL_FACTOR = 300
+
+# 预解压存储的默认大小上限
+DEFAULT_EXTRACT_STORE_SIZE = 50 * 1024 ** 3
+
+# 内存看门狗采样间隔（秒）
+MEM_WATCHDOG_INTERVAL = 1.0
+
+# 失败时打印的 maze 输出末尾行数
+OUTPUT_TAIL_LINES = 40
+
+# 每次从 maze 输出管道读取的字节数
+OUTPUT_BLOCK_SIZE = 64 * 1024
+
+# 单行超过该长度时拆成多行处理（日志文件中保持原样），限制没有换行的输出占用的内存
+OUTPUT_MAX_LINE = 64 * 1024
+
+# maze 保守指针扫描的预过滤统计行前缀，如 `prefilter MarkBssMmap: scanned 1000, rejected 950`
+PREFILTER_LINE_PREFIX = "prefilter "
+
+
+def print_output_excerpt(tail_lines, total_lines, max_lines=OUTPUT_TAIL_LINES):
+    """打印输出末尾片段，便于快速定位问题
+
+    Args:
+        tail_lines: 输出末尾的若干行（不含换行符）
+        total_lines: 输出总行数
+    """
+    if not tail_lines:
         return
 
-    print("Maze output tail (%d/%d lines):" % (max_lines, len(lines)))
-    print("...")
-    print("\n".join(lines[-max_lines:]))
+    lines = list(tail_lines)[-max_lines:]
+    if total_lines > len(lines):
+        print("Maze output tail (%d/%d lines):" % (len(lines), total_lines))
+        print("...")
+    print("\n".join(lines))
 
 
 def find_tarball(test_dir):
-    """查找测试目录下的 tar.gz 文件"""
-    pattern = os.path.join(test_dir, "*.tar.gz")
-    files = glob.glob(pattern)
-    if not files:
-        raise RuntimeError("No tar.gz file found in %s" % test_dir)
-    if len(files) > 1:
-        print("Warning: Multiple tar.gz files found, using: %s" % files[0])
-    return files[0]
+    """查找测试目录下的 coredump 归档
+
+    支持 .tar.gz 和可随机访问的 .tar.zst。maze 通过 --tar 只能读取 gzip，
+    两者都存在时使用 .tar.gz；只有 .tar.zst 时需经预解压存储交给 maze。
+    """
+    for suffix in (".tar.gz", zstd_archive.ZSTD_SUFFIX):
+        files = sorted(glob.glob(os.path.join(test_dir, "*" + suffix)))
+        if not files:
+            continue
+        if len(files) > 1:
+            print("Warning: Multiple %s files found, using: %s" % (suffix, files[0]))
+        return files[0]
+    raise RuntimeError("No tar.gz or tar.zst file found in %s" % test_dir)
 
 
 def cleanup_postman_db(maze_root, tarball_path):
     """清理 postman-db 目录中与当前测试相关的子目录
 
-    根据 tarball 文件名解析 pid，清理对应的 postman-db 子目录，
+    根据 tarball 的 pid 清理对应的 postman-db 子目录，
     避免多个测试之间的状态干扰。
     """
-    import tarfile
-    import re
-
     postman_db_dir = os.path.join(maze_root, "postman-db")
     if not os.path.exists(postman_db_dir):
         return
 
-    # 从 tar 文件中解析 pid
-    pid = None
-    try:
-        with tarfile.open(tarball_path, "r:gz") as tf:
-            for member in tf:
-                name = member.name
-                if name.startswith("./core."):
-                    pid = name.split("./core.")[1]
-                    break
-                if name.startswith("core."):
-                    pid = name.split("core.")[1]
-                    break
-    except Exception:
-        pass
+    # pid 优先从 manifest / 文件名获取，都没有时才扫描 tar 文件
+    pid = tar_manifest.find_tarball_pid(tarball_path)
+    if not pid:
+        try:
+            with zstd_archive.open_tar(tarball_path) as tf:
+                for member in tf:
+                    pid = tar_manifest.pid_from_member_name(member.name)
+                    if pid:
+                        break
+        except Exception:
+            pass
 
     if not pid:
         return
@@ -171,23 +338,361 @@ def find_latest_log_file(maze_root, filename):
     return candidates[0][1]
 
 
-def extract_log_paths_from_output(output, maze_root):
-    """从 maze 控制台输出中提取日志路径。"""
-    maze_log_path = None
-    maze_py_log_path = None
+def parse_log_path_line(line, maze_root):
+    """解析 maze 控制台输出中的日志路径行
+
+    Returns:
+        ("maze", path) / ("python", path)，非日志路径行返回 None
+    """
+    line = line.strip()
+    if line.startswith("log file "):
+        kind = "maze"
+        candidate = line[len("log file ") :].strip()
+    elif line.startswith("python log file "):
+        kind = "python"
+        candidate = line[len("python log file ") :].strip()
+    else:
+        return None
+
+    if not candidate:
+        return None
+    return kind, os.path.abspath(os.path.join(maze_root, candidate))
+
+
+# Python 2 没有 time.monotonic
+monotonic = getattr(time, "monotonic", time.time)
+
+
+def parse_phase_marker(line):
+    """解析 maze 的阶段标记行（如 `* GDB.do`），返回阶段名，非标记行返回 None
+
+    `* xxx took ...` 是阶段结束时的耗时日志，不作为新阶段。
+    """
+    if not line.startswith("* "):
+        return None
+    name = line[2:].strip()
+    if not name or " took " in name:
+        return None
+    return name
+
 
-    for line in output.splitlines():
-        line = line.strip()
-        if line.startswith("log file "):
-            candidate = line[len("log file ") :].strip()
-            if candidate:
-                maze_log_path = os.path.abspath(os.path.join(maze_root, candidate))
-        elif line.startswith("python log file "):
-            candidate = line[len("python log file ") :].strip()
-            if candidate:
-                maze_py_log_path = os.path.abspath(os.path.join(maze_root, candidate))
+def parse_prefilter_line(line):
+    """解析 maze 的预过滤统计行，返回 (阶段名, 扫描的字数, 被拒绝的字数)，非统计行返回 None"""
+    if not line.startswith(PREFILTER_LINE_PREFIX):
+        return None
+    name, sep, counts = line[len(PREFILTER_LINE_PREFIX) :].partition(":")
+    if not sep:
+        return None
+    values = {}
+    for part in counts.split(","):
+        fields = part.split()
+        if len(fields) == 2 and fields[1].isdigit():
+            values[fields[0]] = int(fields[1])
+    if "scanned" not in values or "rejected" not in values:
+        return None
+    return name.strip(), values["scanned"], values["rejected"]
 
-    return maze_log_path, maze_py_log_path
+
+def build_prefilter_report(counts):
+    """按阶段汇总预过滤统计，{name: [scanned, rejected]} -> {name: {scanned, rejected, reject_rate}}"""
+    report = {}
+    for name, (scanned, rejected) in counts.items():
+        report[name] = {
+            "scanned": scanned,
+            "rejected": rejected,
+            "reject_rate": round(float(rejected) / scanned, 4) if scanned else None,
+        }
+    return report
+
+
+def is_gdb_launch_line(line):
+    """maze 启动 GDB 时打印的命令行，如 `./gdb-10-2-lmy-tls/bin/gdb -q -x .gdbcommand.py -ex maze`"""
+    return "/gdb " in line and "-x .gdbcommand.py" in line
+
+
+def read_proc_tree_usage(pid):
+    """读取进程树的 CPU 时间（秒）和 RSS（字节）
+
+    maze 会拉起 .maze、gdb 等子进程，因此统计 pid 及其所有后代进程。
+    CPU 时间包含已退出并被回收的子进程 (cutime/cstime)。
+    非 Linux 或进程已退出时返回 (None, None)。
+    """
+    try:
+        clk_tck = float(os.sysconf("SC_CLK_TCK"))
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        pids = os.listdir("/proc")
+    except (AttributeError, ValueError, OSError):
+        return None, None
+
+    children = {}
+    stats = {}
+    for name in pids:
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % name, "r") as f:
+                stat = f.read()
+            with open("/proc/%s/statm" % name, "r") as f:
+                rss_pages = int(f.read().split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        # comm 字段可能包含空格，从最后一个 ')' 之后开始切分
+        fields = stat[stat.rfind(")") + 2 :].split()
+        p = int(name)
+        ppid = int(fields[1])
+        stats[p] = (fields, rss_pages)
+        children.setdefault(ppid, []).append(p)
+
+    if pid not in stats:
+        return None, None
+
+    cpu_ticks = 0
+    rss_pages = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        fields, pages = stats[p]
+        # utime/stime/cutime/cstime 位于 stat 的第 14-17 字段
+        cpu_ticks += sum(int(v) for v in fields[11:15])
+        rss_pages += pages
+        pending.extend(children.get(p, []))
+
+    return cpu_ticks / clk_tck, rss_pages * page_size
+
+
+def build_phase_profile(marks, end_time, end_cpu):
+    """根据阶段标记的采样点计算每个阶段的耗时
+
+    Args:
+        marks: [(name, time, cpu, rss)]，time 为 monotonic 时间戳
+        end_time: maze 输出结束时的 monotonic 时间戳
+        end_cpu: maze 输出结束时的 CPU 时间，可能为 None
+
+    Returns:
+        list: [{name, start, duration, cpu, rss}]，start 相对第一个阶段
+    """
+    phases = []
+    if not marks:
+        return phases
+
+    base_time = marks[0][1]
+    for i, (name, t, cpu, rss) in enumerate(marks):
+        if i + 1 < len(marks):
+            next_time, next_cpu = marks[i + 1][1], marks[i + 1][2]
+        else:
+            next_time, next_cpu = end_time, end_cpu
+        cpu_delta = None
+        if cpu is not None and next_cpu is not None:
+            cpu_delta = round(next_cpu - cpu, 3)
+        phases.append(
+            {
+                "name": name,
+                "start": round(t - base_time, 3),
+                "duration": round(next_time - t, 3),
+                "cpu": cpu_delta,
+                "rss": rss,
+            }
+        )
+    return phases
+
+
+def iter_output_lines(stream, out):
+    """按 OUTPUT_BLOCK_SIZE 读取 stream 并原样写入 out，逐行生成解码后的内容
+
+    读到数据就处理，不等待缓冲区填满；没有换行的超长输出按 OUTPUT_MAX_LINE
+    拆开，内存占用不随单行长度增长。
+    """
+    fd = stream.fileno()
+    pending = b""
+    while True:
+        block = os.read(fd, OUTPUT_BLOCK_SIZE)
+        if not block:
+            break
+        out.write(block)
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        for raw in lines:
+            yield raw.decode("utf-8", "replace").rstrip("\r")
+        while len(pending) > OUTPUT_MAX_LINE:
+            yield pending[:OUTPUT_MAX_LINE].decode("utf-8", "replace")
+            pending = pending[OUTPUT_MAX_LINE:]
+    if pending:
+        yield pending.decode("utf-8", "replace").rstrip("\r")
+
+
+def write_prefixed_line(prefix, line):
+    """绕过并行 job 的输出缓存，直接把一行写到进程的 stdout"""
+    sys.__stdout__.write("%s%s\n" % (prefix, line))
+    sys.__stdout__.flush()
+
+
+def stream_maze_output(
+    stream, output_path, maze_root, verbose_maze=False, pid=None, verbose_prefix=None
+):
+    """逐行把 maze 输出写入日志文件
+
+    输出不在内存中整体缓存：按固定大小的块读取，只保留末尾 OUTPUT_TAIL_LINES 行
+    用于失败时打印，日志路径行在读到时即时解析，harness 内存占用与 maze 输出量无关。
+    读到阶段标记行时记录时间戳，指定 pid 时同时采样进程树的 CPU 时间和 RSS。
+    verbose_maze 时指定 verbose_prefix 的每行加上前缀后立即写到进程的 stdout
+    （并行 job 的 sys.stdout 是缓存），否则直接 print。
+
+    Returns:
+        dict: tail_lines, total_lines, maze_log_path, maze_py_log_path,
+            phases (见 build_phase_profile), wall_time,
+            gdb_launches（每次启动 GDB 时所在的阶段名）,
+            prefilter（见 build_prefilter_report，同一阶段的多次统计累加）
+    """
+    tail_lines = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    total_lines = 0
+    log_paths = {"maze": None, "python": None}
+    phase_marks = []
+    gdb_launches = []
+    prefilter_counts = {}
+    start_time = monotonic()
+
+    try:
+        out = open(output_path, "wb")
+    except IOError as e:
+        raise RuntimeError(
+            "Failed to write maze output log %s: %s" % (output_path, str(e))
+        )
+
+    with out:
+        for line in iter_output_lines(stream, out):
+            total_lines += 1
+            tail_lines.append(line)
+
+            parsed = parse_log_path_line(line, maze_root)
+            if parsed:
+                log_paths[parsed[0]] = parsed[1]
+
+            phase = parse_phase_marker(line)
+            if phase:
+                cpu, rss = None, None
+                if pid is not None:
+                    cpu, rss = read_proc_tree_usage(pid)
+                phase_marks.append((phase, monotonic(), cpu, rss))
+            elif is_gdb_launch_line(line):
+                gdb_launches.append(phase_marks[-1][0] if phase_marks else None)
+            else:
+                prefilter = parse_prefilter_line(line)
+                if prefilter:
+                    counts = prefilter_counts.setdefault(prefilter[0], [0, 0])
+                    counts[0] += prefilter[1]
+                    counts[1] += prefilter[2]
+
+            if verbose_maze:
+                if verbose_prefix is None:
+                    print(line)
+                else:
+                    write_prefixed_line(verbose_prefix, line)
+
+    end_time = monotonic()
+    end_cpu = None
+    if pid is not None:
+        end_cpu = read_proc_tree_usage(pid)[0]
+
+    return {
+        "tail_lines": tail_lines,
+        "total_lines": total_lines,
+        "maze_log_path": log_paths["maze"],
+        "maze_py_log_path": log_paths["python"],
+        "phases": build_phase_profile(phase_marks, end_time, end_cpu),
+        "wall_time": round(end_time - start_time, 3),
+        "gdb_launches": gdb_launches,
+        "prefilter": build_prefilter_report(prefilter_counts),
+    }
+
+
+def start_mem_watchdog(pid, mem_limit, done):
+    """启动内存看门狗线程
+
+    每 MEM_WATCHDOG_INTERVAL 秒采样一次 maze 进程树的 RSS，超过 mem_limit 时
+    SIGKILL 整个进程组（maze 以独立进程组启动），只终止超限的这一个分析。
+
+    Args:
+        done: threading.Event，maze 输出结束时由调用方设置
+
+    Returns:
+        dict: {"killed": bool, "rss": 触发时的 RSS}
+    """
+    state = {"killed": False, "rss": None}
+
+    def watch():
+        while not done.wait(MEM_WATCHDOG_INTERVAL):
+            _, rss = read_proc_tree_usage(pid)
+            if rss is None:
+                return
+            if rss > mem_limit:
+                state["killed"] = True
+                state["rss"] = rss
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                return
+
+    thread = threading.Thread(target=watch)
+    thread.daemon = True
+    thread.start()
+    return state
+
+
+def terminate_process_group(pid):
+    """向以 os.setsid 启动的进程组发送 SIGTERM，进程组已退出时忽略"""
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+
+def wait_with_rusage(process):
+    """等待子进程退出并返回 (returncode, usage)
+
+    通过 os.wait4 获取 maze 进程（含其已回收的子进程）的 CPU 时间和峰值 RSS。
+    不支持 wait4 的平台 usage 为空 dict。
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait(), {}
+
+    while True:
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+    if os.WIFSIGNALED(status):
+        ret = -os.WTERMSIG(status)
+    else:
+        ret = os.WEXITSTATUS(status)
+    # 告知 Popen 子进程已被回收
+    process.returncode = ret
+
+    usage = {
+        "user_time": round(rusage.ru_utime, 3),
+        "sys_time": round(rusage.ru_stime, 3),
+        # Linux 上 ru_maxrss 单位为 KB
+        "max_rss": rusage.ru_maxrss * 1024,
+    }
+    return ret, usage
+
+
+def write_phase_profile(path, test_dir, py_merge, captured, usage):
+    """把阶段耗时和进程资源占用写入 phases.json"""
+    data = {
+        "test": test_dir,
+        "py_merge": py_merge,
+        "wall_time": captured["wall_time"],
+        "phases": captured["phases"],
+        "gdb_launches": captured["gdb_launches"],
+        "prefilter": captured["prefilter"],
+    }
+    data.update(usage)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
 
 
 def run_maze_analysis(
@@ -196,20 +701,32 @@ def run_maze_analysis(
     py_merge=False,
     no_cpp=False,
     verbose_maze=False,
+    work_root=None,
+    usage=None,
+    mem_limit=None,
+    extracted_dir=None,
+    extra_env=None,
+    verbose_prefix=None,
 ):
     """执行 maze 分析
 
     Args:
-        tarball_path: tar.gz 文件路径
+        tarball_path: coredump 归档（.tar.gz / .tar.zst）路径
         test_dir: 测试目录路径（用于日志命名）
         py_merge: 是否启用 --py-merge 模式
         no_cpp: 是否禁用 C++ 对象分析
         verbose_maze: 是否直接打印完整 maze 输出
+        work_root: maze 的工作目录，默认为 maze 根目录；并行模式下为 job 隔离目录
+        usage: 传入 dict 时写入 maze 进程的 wall_time/user_time/sys_time/max_rss
+        mem_limit: maze 进程树的 RSS 上限（字节），超过时终止本次分析
+        extracted_dir: tarball 的预解压目录，通过 MAZE_EXTRACTED_DIR 传给 maze
+        extra_env: 额外传给 maze 的环境变量（符号缓存、类型数据库等）
+        verbose_prefix: verbose_maze 时每行 maze 输出的前缀，见 stream_maze_output
     """
-    # 获取 maze 根目录（testdata 的父目录）
-    testdata_dir = os.path.dirname(os.path.abspath(__file__))
-    maze_root = os.path.dirname(testdata_dir)
-    maze_script = os.path.join(maze_root, "maze")
+    maze_root = get_maze_root()
+    if work_root is None:
+        work_root = maze_root
+    maze_script = os.path.join(work_root, "maze")
 
     cmd = [
         sys.executable,
@@ -220,7 +737,7 @@ def run_maze_analysis(
         "--json-output",
         "--rmlog",
         "--limit",
-        "500",
+        str(MAZE_LIMIT),
     ]
 
     if py_merge:
@@ -233,48 +750,98 @@ def run_maze_analysis(
     print("Command: %s" % " ".join(cmd))
 
     # 清理旧的结果文件，避免残留文件导致误判
-    result_path = os.path.join(maze_root, "maze-result.json")
+    result_path = os.path.join(work_root, "maze-result.json")
     if os.path.exists(result_path):
         os.remove(result_path)
 
     # 清理 postman-db 缓存，避免测试之间的状态干扰
-    cleanup_postman_db(maze_root, tarball_path)
+    cleanup_postman_db(work_root, tarball_path)
 
-    before_log_snapshots = snapshot_log_files(maze_root)
+    before_log_snapshots = snapshot_log_files(work_root)
 
     tmp_dir = os.path.join(maze_root, "tmp")
     ensure_dir(tmp_dir)
 
     log_name = make_log_name(test_dir, py_merge=py_merge)
     maze_output_path = os.path.join(tmp_dir, "%s.maze-output.log" % log_name)
-
-    # 在 maze 根目录执行
+    phases_path = make_phases_path(maze_root, test_dir, py_merge=py_merge)
+
+    # 关闭 maze 内 Python 部分的输出缓冲，保证阶段标记到达时间准确
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    if extracted_dir:
+        env[EXTRACTED_DIR_ENV] = extracted_dir
+    mimalloc_layouts = os.path.join(maze_root, MIMALLOC_LAYOUTS_FILE)
+    if os.path.isfile(mimalloc_layouts):
+        env["MAZE_MIMALLOC_LAYOUTS"] = mimalloc_layouts
+    if extra_env:
+        env.update(extra_env)
+
+    # 在 maze 工作目录执行，输出边读边写入日志文件；
+    # 限制内存时以独立进程组启动，超限时可以终止 maze 及其所有子进程
     process = subprocess.Popen(
         cmd,
-        cwd=maze_root,
+        cwd=work_root,
+        env=env,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        universal_newlines=True,
+        preexec_fn=os.setsid if mem_limit else None,
     )
-    output, _ = process.communicate()
-
+    output_done = threading.Event()
+    watchdog = None
+    if mem_limit:
+        watchdog = start_mem_watchdog(process.pid, mem_limit, output_done)
+    # 独立进程组中的 maze 收不到终端的 Ctrl-C，中断时先转发终止信号，再等待其退出
     try:
-        with io.open(maze_output_path, "w", encoding="utf-8", errors="replace") as f:
-            f.write(output)
-    except IOError as e:
-        raise RuntimeError(
-            "Failed to write maze output log %s: %s" % (maze_output_path, str(e))
+        captured = stream_maze_output(
+            process.stdout,
+            maze_output_path,
+            work_root,
+            verbose_maze=verbose_maze,
+            pid=process.pid,
+            verbose_prefix=verbose_prefix,
         )
+    except KeyboardInterrupt:
+        if mem_limit:
+            terminate_process_group(process.pid)
+        raise
+    finally:
+        output_done.set()
+        process.stdout.close()
+        try:
+            ret, process_usage = wait_with_rusage(process)
+        except KeyboardInterrupt:
+            if mem_limit:
+                terminate_process_group(process.pid)
+            raise
 
-    ret = process.returncode
+    process_usage["wall_time"] = captured["wall_time"]
+    if usage is not None:
+        usage.update(process_usage)
 
-    if verbose_maze and output:
-        print(output)
-    else:
+    if not verbose_maze:
         print("Maze output saved to: %s" % maze_output_path)
 
-    maze_log_path, maze_py_log_path = extract_log_paths_from_output(output, maze_root)
-    updated_log_files = detect_updated_log_files(maze_root, before_log_snapshots)
+    write_phase_profile(phases_path, test_dir, py_merge, captured, process_usage)
+    print("Maze phase profile: %s" % phases_path)
+    if captured["gdb_launches"]:
+        print(
+            "GDB launches: %d (%s)"
+            % (
+                len(captured["gdb_launches"]),
+                ", ".join(name or "-" for name in captured["gdb_launches"]),
+            )
+        )
+    for name, stats in sorted(captured["prefilter"].items()):
+        if stats["reject_rate"] is not None:
+            print(
+                "Prefilter %s: rejected %.1f%% of %d words"
+                % (name, stats["reject_rate"] * 100, stats["scanned"])
+            )
+
+    maze_log_path = captured["maze_log_path"]
+    maze_py_log_path = captured["maze_py_log_path"]
+    updated_log_files = detect_updated_log_files(work_root, before_log_snapshots)
 
     for path in updated_log_files:
         if path.endswith("maze.log") and maze_log_path is None:
@@ -283,24 +850,218 @@ def run_maze_analysis(
             maze_py_log_path = path
 
     if maze_log_path is None:
-        maze_log_path = find_latest_log_file(maze_root, "maze.log")
+        maze_log_path = find_latest_log_file(work_root, "maze.log")
     if maze_py_log_path is None:
-        maze_py_log_path = find_latest_log_file(maze_root, "maze.py.log")
+        maze_py_log_path = find_latest_log_file(work_root, "maze.py.log")
 
     if maze_log_path:
         print("Maze log: %s" % maze_log_path)
     if maze_py_log_path:
         print("Maze py log: %s" % maze_py_log_path)
 
+    if watchdog and watchdog["killed"]:
+        print_output_excerpt(captured["tail_lines"], captured["total_lines"])
+        raise RuntimeError(
+            "Maze analysis killed: RSS %s exceeded memory limit %s"
+            % (cli_util.format_size(watchdog["rss"]), cli_util.format_size(mem_limit))
+        )
+
     if ret != 0:
-        print_output_excerpt(output)
+        print_output_excerpt(captured["tail_lines"], captured["total_lines"])
         raise RuntimeError("Maze analysis failed with exit code %d" % ret)
 
     # 返回结果文件路径
-    result_path = os.path.join(maze_root, "maze-result.json")
     return result_path
 
 
+def get_result_cache_dir(maze_root):
+    """返回结果缓存目录"""
+    return os.path.join(maze_root, "tmp", "result-cache")
+
+
+def write_json_atomic(path, data):
+    """先写临时文件再 rename，避免并行 job 读到写了一半的 json"""
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.rename(tmp_path, path)
+
+
+def file_digest(path, memo=None):
+    """计算文件 sha256
+
+    memo 为 {abspath: [size, mtime, digest]}，文件 size 和 mtime 未变化时直接复用，
+    避免每次运行都重新读取多 GB 的 tarball。
+    """
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    if memo is not None:
+        entry = memo.get(abs_path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime:
+            return entry[2]
+
+    h = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if memo is not None:
+        memo[abs_path] = [st.st_size, st.st_mtime, digest]
+    return digest
+
+
+# maze_reads_env 的结果，按 (maze 程序路径, mtime, 变量名) 缓存
+_maze_env_support = {}
+
+
+def maze_reads_env(maze_root, name):
+    """maze 是否读取环境变量 name
+
+    maze 程序（MAZE_PROGRAM_FILES）中出现该变量名即认为读取：Go 程序和
+    .gdbcommand.py 中的环境变量名都以字面量保存。
+    """
+    found = False
+    for file_name in MAZE_PROGRAM_FILES:
+        path = os.path.join(maze_root, file_name)
+        if not os.path.isfile(path):
+            continue
+        key = (path, os.path.getmtime(path), name)
+        if key not in _maze_env_support:
+            _maze_env_support[key] = file_contains(path, name.encode("utf-8"))
+        found = found or _maze_env_support[key]
+    return found
+
+
+def file_contains(path, needle, chunk_size=1024 * 1024):
+    """按块扫描文件，判断是否包含 needle"""
+    tail = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            if needle in tail + chunk:
+                return True
+            tail = chunk[-(len(needle) - 1) :]
+
+
+def compute_maze_digest(maze_root, memo=None):
+    """计算 maze 程序（MAZE_CACHE_KEY_FILES）的组合 sha256"""
+    parts = []
+    for name in MAZE_CACHE_KEY_FILES:
+        path = os.path.join(maze_root, name)
+        if os.path.isfile(path):
+            parts.append("%s=%s" % (name, file_digest(path, memo)))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_digest_memo(maze_root):
+    """读取 file_digest 的持久化 memo"""
+    memo_path = os.path.join(get_result_cache_dir(maze_root), "digests.json")
+    if os.path.exists(memo_path):
+        try:
+            with open(memo_path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+
+def save_digest_memo(maze_root, memo):
+    """保存 file_digest 的持久化 memo"""
+    cache_dir = get_result_cache_dir(maze_root)
+    ensure_dir(cache_dir)
+    write_json_atomic(os.path.join(cache_dir, "digests.json"), memo)
+
+
+def compute_tarball_digest(maze_root, tarball_path):
+    """计算 tarball 的 sha256，未变化的 tarball 复用持久化 memo"""
+    memo = load_digest_memo(maze_root)
+    digest = file_digest(tarball_path, memo)
+    save_digest_memo(maze_root, memo)
+    return digest
+
+
+def compute_maze_digest_memoized(maze_root):
+    """计算 maze 程序的组合 sha256，未变化的文件复用持久化 memo，memo 有变化时才写回"""
+    memo = load_digest_memo(maze_root)
+    before = dict(memo)
+    digest = compute_maze_digest(maze_root, memo)
+    if memo != before:
+        save_digest_memo(maze_root, memo)
+    return digest
+
+
+def compute_result_cache_key(
+    maze_root,
+    tarball_path,
+    py_merge=False,
+    no_cpp=False,
+    walker_jobs=None,
+    piece_sort=None,
+):
+    """根据 tarball 内容、maze 程序和命令行参数计算结果缓存 key
+
+    并行遍历的结果应与串行一致，但指定 walker_jobs 时仍单独缓存，
+    保证每种并行度都真正运行过一次，顺序或计数不一致时能被验证发现。
+    piece_sort 同理。
+    """
+    memo = load_digest_memo(maze_root)
+
+    parts = [
+        "v%d" % RESULT_CACHE_VERSION,
+        "tar=%s" % file_digest(tarball_path, memo),
+    ]
+    parts.append("maze=%s" % compute_maze_digest(maze_root, memo))
+    parts.append("py_merge=%d" % int(py_merge))
+    parts.append("no_cpp=%d" % int(no_cpp))
+    parts.append("limit=%d" % MAZE_LIMIT)
+    if walker_jobs:
+        parts.append("walker_jobs=%d" % walker_jobs)
+    if piece_sort:
+        parts.append("piece_sort=%s" % piece_sort)
+
+    save_digest_memo(maze_root, memo)
+
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def find_cached_result(maze_root, cache_key):
+    """返回缓存的 maze-result.json 路径，未命中返回 None"""
+    path = os.path.join(get_result_cache_dir(maze_root), "%s.json" % cache_key)
+    if os.path.exists(path):
+        return path
+    return None
+
+
+def store_cached_result(maze_root, cache_key, result_path):
+    """把本次 maze-result.json 存入结果缓存"""
+    cache_dir = get_result_cache_dir(maze_root)
+    ensure_dir(cache_dir)
+    path = os.path.join(cache_dir, "%s.json" % cache_key)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    shutil.copyfile(result_path, tmp_path)
+    os.rename(tmp_path, path)
+    return path
+
+
+def count_result_objects(data):
+    """结果中各类型对象数量之和（受 --limit 限制，只统计输出的类型）"""
+    return sum(item.get("amount", 0) for item in data.get("items", []))
+
+
+def compute_result_digest(data):
+    """结果内容的摘要，用于检查不同并行度下的结果是否完全一致"""
+    content = json.dumps(
+        {"summary": data.get("summary"), "items": data.get("items")}, sort_keys=True
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
 def load_validate_module(test_dir):
     """加载测试目录下的 validate.py 模块"""
     validate_path = os.path.join(test_dir, "validate.py")
@@ -323,7 +1084,54 @@ def load_validate_module(test_dir):
     return module
 
 
-def run_test(test_dir, py_merge=False, verbose_maze=False):
+def detect_no_cpp(test_dir):
+    """判断测试是否使用 --no-cpp
+
+    检测 no-cpp 标记文件；jemalloc testdata 默认禁用 C++ 分类，
+    避免大块 malloc 被 C++ 弱/虚表分类扰动，影响 allocator 回归结果。
+    """
+    testdata_dir = os.path.dirname(os.path.abspath(__file__))
+    abs_test_dir = os.path.join(testdata_dir, test_dir)
+    return os.path.exists(os.path.join(abs_test_dir, "no-cpp")) or (
+        test_dir.startswith("cpp/") and "jemalloc" in test_dir
+    )
+
+
+def make_maze_flags(py_merge=False, no_cpp=False, walker_jobs=None, piece_sort=None):
+    """性能历史中记录的 maze 参数字符串
+
+    walker_jobs 和 piece_sort 通过环境变量传给 maze，但会显著改变耗时，也记入参数字符串，
+    不同并行度、排序方式的运行在历史中分开比较。
+    """
+    flags = []
+    if py_merge:
+        flags.append("--py-merge")
+    if no_cpp:
+        flags.append("--no-cpp")
+    flags += ["--limit", str(MAZE_LIMIT)]
+    if walker_jobs:
+        flags += ["--walker-jobs", str(walker_jobs)]
+    if piece_sort:
+        flags += ["--piece-sort", piece_sort]
+    return " ".join(flags)
+
+
+def run_test(
+    test_dir,
+    py_merge=False,
+    verbose_maze=False,
+    work_root=None,
+    use_cache=False,
+    usage=None,
+    history_db=None,
+    mem_limit=None,
+    extract_store_size=None,
+    symbol_cache_config=None,
+    type_db_dir=None,
+    walker_jobs=None,
+    piece_sort=None,
+    verbose_prefix=None,
+):
     """
     运行单个测试
 
@@ -331,13 +1139,28 @@ def run_test(test_dir, py_merge=False, verbose_maze=False):
         test_dir: 测试目录路径 (相对于 testdata 目录)
         py_merge: 是否启用 --py-merge 模式
         verbose_maze: 是否直接打印完整 maze 输出
+        work_root: maze 的工作目录，默认为 maze 根目录
+        use_cache: tarball、maze 程序和参数均未变化时复用缓存的分析结果
+        usage: 传入 dict 时写入本次 maze 进程的资源占用，以及结果中的对象数 objects
+            和结果摘要 result_digest（命中缓存时不写入）
+        history_db: 性能历史数据库路径，指定时在实际运行 maze 后追加本次性能数据
+        mem_limit: maze 进程树的 RSS 上限（字节）
+        extract_store_size: 指定时使用预解压存储（tmp/extract-store），值为存储上限（字节）
+        symbol_cache_config: 指定时使用本地符号缓存，见 make_symbol_cache_config；
+            work_root 中的 bin/s3 需要已替换为 symbol_cache.py
+        type_db_dir: 指定时为 tarball 中首次出现的 build-id 生成类型数据库，
+            并通过 MAZE_TYPE_DB 传给 maze（maze 不读取该变量时忽略）
+        walker_jobs: 指定时通过 MAZE_WALKER_JOBS 设置 maze 堆遍历的并行度
+        piece_sort: 指定时通过 MAZE_PIECE_SORT 设置 maze 内存块的排序方式
+        verbose_prefix: verbose_maze 时每行 maze 输出的前缀，指定时绕过 stdout 缓存直接输出
 
     Returns:
         bool: 测试是否通过
     """
     # 转换为绝对路径
     testdata_dir = os.path.dirname(os.path.abspath(__file__))
-    maze_root = os.path.dirname(testdata_dir)
+    if work_root is None:
+        work_root = get_maze_root()
     abs_test_dir = os.path.join(testdata_dir, test_dir)
 
     if not os.path.isdir(abs_test_dir):
@@ -353,14 +1176,14 @@ def run_test(test_dir, py_merge=False, verbose_maze=False):
     tarball = find_tarball(abs_test_dir)
     print("Tarball: %s" % tarball)
 
-    # 检测 no-cpp 标记文件；jemalloc testdata 默认禁用 C++ 分类，
-    # 避免大块 malloc 被 C++ 弱/虚表分类扰动，影响 allocator 回归结果。
-    no_cpp = os.path.exists(os.path.join(abs_test_dir, "no-cpp")) or (
-        test_dir.startswith("cpp/") and "jemalloc" in test_dir
-    )
+    no_cpp = detect_no_cpp(test_dir)
 
     if no_cpp:
         mode_parts.append("--no-cpp")
+    if walker_jobs:
+        mode_parts.append("--walker-jobs %d" % walker_jobs)
+    if piece_sort:
+        mode_parts.append("--piece-sort %s" % piece_sort)
 
     mode_str = ""
     if mode_parts:
@@ -368,14 +1191,81 @@ def run_test(test_dir, py_merge=False, verbose_maze=False):
 
     print("Test: %s%s" % (test_dir, mode_str))
 
-    # 2. 执行 maze 分析
-    result_path = run_maze_analysis(
-        tarball,
-        test_dir,
-        py_merge=py_merge,
-        no_cpp=no_cpp,
-        verbose_maze=verbose_maze,
-    )
+    # 2. 执行 maze 分析（开启缓存时先查找结果缓存）
+    maze_root = get_maze_root()
+    cache_key = None
+    result_path = None
+    if use_cache:
+        cache_key = compute_result_cache_key(
+            maze_root,
+            tarball,
+            py_merge=py_merge,
+            no_cpp=no_cpp,
+            walker_jobs=walker_jobs,
+            piece_sort=piece_sort,
+        )
+        result_path = find_cached_result(maze_root, cache_key)
+        if result_path:
+            print("Result cache hit: %s" % result_path)
+
+    maze_ran = result_path is None
+    if maze_ran:
+        extracted_dir = None
+        # 预解压目录只有 maze 读取 MAZE_EXTRACTED_DIR 时才有用，否则只是多解压一次
+        if not maze_reads_env(maze_root, EXTRACTED_DIR_ENV):
+            if requires_extracted_dir(tarball):
+                raise RuntimeError(
+                    "%s can only be analyzed through %s, which this maze does not read"
+                    % (tarball, EXTRACTED_DIR_ENV)
+                )
+            if extract_store_size:
+                print(
+                    "Warning: maze does not read %s, --extract-store ignored"
+                    % EXTRACTED_DIR_ENV
+                )
+                extract_store_size = None
+        if requires_extracted_dir(tarball) and not extract_store_size:
+            extract_store_size = DEFAULT_EXTRACT_STORE_SIZE
+        if extract_store_size:
+            extracted_dir = prepare_extracted_dir(
+                maze_root, tarball, extract_store_size
+            )
+        extra_env = {}
+        if symbol_cache_config:
+            extra_env.update(prepare_symbol_cache(maze_root, tarball, symbol_cache_config))
+        # 类型数据库只有 maze 读取 MAZE_TYPE_DB 时才有用，否则只是白白扫描 tarball
+        if type_db_dir and not maze_reads_env(maze_root, TYPE_DB_ENV):
+            print("Warning: maze does not read %s, --type-db ignored" % TYPE_DB_ENV)
+            type_db_dir = None
+        if type_db_dir:
+            extra_env.update(prepare_type_db(type_db_dir, tarball))
+        if walker_jobs:
+            if not maze_reads_env(maze_root, WALKER_JOBS_ENV):
+                raise RuntimeError(
+                    "--walker-jobs needs %s, which this maze does not read" % WALKER_JOBS_ENV
+                )
+            extra_env[WALKER_JOBS_ENV] = str(walker_jobs)
+        if piece_sort:
+            if not maze_reads_env(maze_root, PIECE_SORT_ENV):
+                raise RuntimeError(
+                    "--piece-sort needs %s, which this maze does not read" % PIECE_SORT_ENV
+                )
+            extra_env[PIECE_SORT_ENV] = piece_sort
+        result_path = run_maze_analysis(
+            tarball,
+            test_dir,
+            py_merge=py_merge,
+            no_cpp=no_cpp,
+            verbose_maze=verbose_maze,
+            work_root=work_root,
+            usage=usage,
+            mem_limit=mem_limit,
+            extracted_dir=extracted_dir,
+            extra_env=extra_env,
+            verbose_prefix=verbose_prefix,
+        )
+        if cache_key and os.path.exists(result_path):
+            store_cached_result(maze_root, cache_key, result_path)
 
     # 3. 加载结果
     if not os.path.exists(result_path):
@@ -384,9 +1274,19 @@ def run_test(test_dir, py_merge=False, verbose_maze=False):
     with open(result_path, "r") as f:
         data = json.load(f)
 
+    if maze_ran and usage is not None:
+        usage["objects"] = count_result_objects(data)
+        usage["result_digest"] = compute_result_digest(data)
+        core_size = data.get("summary", {}).get("core_size")
+        if usage.get("max_rss") and core_size:
+            print(
+                "Peak RSS: %s (%.1fx core size)"
+                % (cli_util.format_size(usage["max_rss"]), float(usage["max_rss"]) / core_size)
+            )
+
     # 如果是 py_merge 模式，保存结果到单独文件
     if py_merge:
-        merge_result_path = os.path.join(maze_root, "maze-result-with-merge.json")
+        merge_result_path = os.path.join(work_root, "maze-result-with-merge.json")
         with open(merge_result_path, "w") as f:
             json.dump(data, f, indent=2)
         print("PyMerge result saved to: %s" % merge_result_path)
@@ -404,6 +1304,100 @@ def run_test(test_dir, py_merge=False, verbose_maze=False):
         os.environ["MAZE_PY_MERGE"] = "0"
 
     # 6. 执行验证
+    passed = run_validation(validate_module, data, test_dir, mode_str)
+
+    # 7. 记录性能历史
+    if maze_ran and history_db:
+        record_perf_history(
+            history_db,
+            maze_root,
+            test_dir,
+            py_merge,
+            make_maze_flags(py_merge, no_cpp, walker_jobs, piece_sort),
+            data,
+            passed,
+        )
+
+    return passed
+
+
+def requires_extracted_dir(tarball):
+    """.tar.zst 和按 build-id 去重的 tarball 必须经预解压存储交给 maze
+
+    .tar.zst 需要并行解压，去重 tarball 需要从对象存储链接回被移出的 ELF 文件。
+    """
+    if zstd_archive.is_zstd_archive(tarball):
+        return True
+    manifest = tar_manifest.read_manifest(tarball)
+    return bool(manifest and manifest.get("objects"))
+
+
+def prepare_extracted_dir(maze_root, tarball, max_size):
+    """从预解压存储取得 tarball 的解压目录，必要时解压并按 LRU 淘汰旧条目"""
+    store_dir = coredump_store.default_store_dir(maze_root)
+    digest = compute_tarball_digest(maze_root, tarball)
+    extracted_dir = coredump_store.extract(store_dir, tarball, digest=digest)
+    print("Extracted coredump: %s" % extracted_dir)
+    for evicted in coredump_store.prune(store_dir, max_size, keep=[digest]):
+        print("Evicted extracted coredump: %s" % evicted)
+    return extracted_dir
+
+
+def make_symbol_cache_config(maze_root, offline_dir=None, negative_ttl=None):
+    """本地符号缓存配置
+
+    Args:
+        offline_dir: 目录形式的 S3 替身，指定时完全离线运行
+        negative_ttl: 未命中记录的有效期（秒）
+    """
+    return {
+        "cache_dir": symbol_cache.default_cache_dir(maze_root),
+        "upstream": symbol_cache.default_upstream(maze_root),
+        "offline_dir": os.path.abspath(offline_dir) if offline_dir else None,
+        "negative_ttl": (
+            symbol_cache.DEFAULT_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        ),
+    }
+
+
+def prepare_symbol_cache(maze_root, tarball, config):
+    """按 tarball 清单中的 build-id 并行预取符号，返回传给 bin/s3 替身的环境变量"""
+    backend = symbol_cache.Backend(
+        upstream=config["upstream"], offline_dir=config["offline_dir"]
+    )
+    cache = symbol_cache.SymbolCache(config["cache_dir"], backend, config["negative_ttl"])
+    keys = symbol_cache.tarball_symbol_keys(tarball)
+    if keys:
+        counts = cache.prefetch(keys)
+        print(
+            "Symbol cache: %s"
+            % ", ".join("%s %d" % item for item in sorted(counts.items()))
+        )
+
+    env = {
+        "MAZE_SYMBOL_CACHE": config["cache_dir"],
+        "MAZE_SYMBOL_NEGATIVE_TTL": str(config["negative_ttl"]),
+    }
+    if config["upstream"]:
+        env["MAZE_S3_UPSTREAM"] = config["upstream"]
+    if config["offline_dir"]:
+        env["MAZE_S3_DIR"] = config["offline_dir"]
+    return env
+
+
+def prepare_type_db(db_dir, tarball):
+    """为首次出现的 build-id 生成类型数据库（vtable 表），返回传给 maze 的环境变量
+
+    直接读取 tarball 中的 ELF member，不需要解压整个 tarball；已存在的数据库不再重复生成，
+    tarball 未变化且其 build-id 都已有数据库时不读取 tarball。
+    """
+    created = type_db.build_tarball_dbs(db_dir, tarball)
+    print("Type DB: %d new build-ids" % len(created))
+    return {TYPE_DB_ENV: db_dir}
+
+
+def run_validation(validate_module, data, test_dir, mode_str):
+    """执行 validate.py 的 validate(data)，返回是否通过"""
     try:
         result = validate_module.validate(data)
         if result:
@@ -426,62 +1420,923 @@ def run_test(test_dir, py_merge=False, verbose_maze=False):
         return False
 
 
+def record_perf_history(db_path, maze_root, test_dir, py_merge, flags, data, passed):
+    """把本次运行的 phases.json 和结果摘要追加到性能历史数据库
+
+    记录失败只打印警告，不影响测试结果。
+    """
+    phases_path = make_phases_path(maze_root, test_dir, py_merge=py_merge)
+    try:
+        with open(phases_path, "r") as f:
+            profile = json.load(f)
+        perf_history.record_run(
+            db_path,
+            test_dir,
+            flags,
+            profile,
+            summary=data.get("summary"),
+            passed=passed,
+            maze_rev=get_maze_revision(maze_root),
+            maze_hash=compute_maze_digest_memoized(maze_root),
+        )
+    except Exception as e:
+        print("Warning: Failed to record perf history: %s" % str(e))
+
+
+def make_job_label(test_dir, py_merge=False):
+    """生成汇总中使用的测试名"""
+    if py_merge:
+        return "%s (--py-merge)" % test_dir
+    return test_dir
+
+
+def run_job(job):
+    """执行单个测试 job，异常转为失败结果
+
+    Args:
+        job: (test_dir, py_merge, options) 元组，options 为 dict：
+            verbose_maze: 是否直接打印完整 maze 输出
+            isolated: 为 True 时在独立的工作根目录中运行 maze
+            use_cache: 是否启用结果缓存
+            history_db: 性能历史数据库路径，None 表示不记录
+            mem_limit: 单个 maze 分析的 RSS 上限（字节），None 表示不限制
+            job_mem_limit: 显式指定的 --job-mem-limit，None 时 mem_limit 取 --mem-budget
+            extract_store_size: 预解压存储上限（字节），None 表示不使用
+            symbol_cache: 本地符号缓存配置，None 表示不使用
+            type_db: 类型数据库目录，None 表示不使用
+            walker_jobs: maze 堆遍历的并行度，None 表示由 maze 决定
+            piece_sort: maze 内存块的排序方式，None 表示使用 maze 默认
+            verbose_prefix: verbose_maze 时每行 maze 输出的前缀，None 表示直接 print
+
+    Returns:
+        (label, passed, usage)，usage 为 maze 进程资源占用，未运行 maze 时为空 dict
+    """
+    test_dir, py_merge, options = job
+    label = make_job_label(test_dir, py_merge=py_merge)
+    usage = {}
+
+    try:
+        work_root = None
+        overrides = None
+        if options.get("symbol_cache"):
+            # bin/s3 只能在 job 根目录中替换，使用符号缓存时总是隔离运行
+            testdata_dir = os.path.dirname(os.path.abspath(__file__))
+            overrides = {"bin/s3": os.path.join(testdata_dir, "symbol_cache.py")}
+        if options.get("isolated") or overrides:
+            work_root = prepare_job_root(
+                get_maze_root(),
+                make_log_name(test_dir, py_merge=py_merge),
+                overrides=overrides,
+            )
+        passed = run_test(
+            test_dir,
+            py_merge=py_merge,
+            verbose_maze=options.get("verbose_maze", False),
+            work_root=work_root,
+            use_cache=options.get("use_cache", False),
+            usage=usage,
+            history_db=options.get("history_db"),
+            mem_limit=options.get("mem_limit"),
+            extract_store_size=options.get("extract_store_size"),
+            symbol_cache_config=options.get("symbol_cache"),
+            type_db_dir=options.get("type_db"),
+            walker_jobs=options.get("walker_jobs"),
+            piece_sort=options.get("piece_sort"),
+            verbose_prefix=options.get("verbose_prefix"),
+        )
+    except Exception as e:
+        print("")
+        print("❌ Test ERROR: %s" % label)
+        print("   %s" % str(e))
+        passed = False
+
+    return label, passed, usage
+
+
+def run_job_captured(job):
+    """在进程池 worker 中执行 job，并捕获其控制台输出
+
+    并行 job 的输出先缓存在内存中，由主进程按提交顺序整体打印，
+    避免多个 job 的输出交错。--verbose-maze 的完整 maze 输出不缓存，
+    每行加上 job 名前缀后立即输出。
+    """
+    test_dir, py_merge, options = job
+    if options.get("verbose_maze"):
+        prefix = "[%s] " % make_job_label(test_dir, py_merge=py_merge)
+        job = (test_dir, py_merge, dict(options, verbose_prefix=prefix))
+    saved_stdout = sys.stdout
+    buf = StringIO()
+    sys.stdout = buf
+    try:
+        label, passed, usage = run_job(job)
+    finally:
+        sys.stdout = saved_stdout
+    return label, passed, usage, buf.getvalue()
+
+
+def run_indexed_job_captured(indexed_job):
+    """run_job_captured 的带序号版本，供 imap_unordered 使用"""
+    index, job = indexed_job
+    return (index,) + run_job_captured(job)
+
+
+def run_jobs(jobs, num_jobs=1, order=None, mem_budget=None, mem_estimates=None):
+    """执行所有 job，返回按 jobs 原始顺序排列的 (label, passed, usage) 列表
+
+    Args:
+        order: job 的提交顺序（jobs 的下标列表），默认按原始顺序；
+            并行时每个 job 的输出在其完成时整体打印
+        mem_budget: 并行 job 预计峰值 RSS 之和的上限（字节）
+        mem_estimates: 每个 job 的预计峰值 RSS，与 mem_budget 一起使用
+    """
+    if order is None:
+        order = range(len(jobs))
+
+    if num_jobs > 1 and mem_budget:
+        return run_jobs_with_mem_budget(
+            jobs, num_jobs, order, mem_budget, mem_estimates
+        )
+
+    if num_jobs <= 1:
+        results = [None] * len(jobs)
+        for index in order:
+            results[index] = run_job(jobs[index])
+        return results
+
+    results = [None] * len(jobs)
+    pool = multiprocessing.Pool(num_jobs)
+    try:
+        indexed_jobs = [(index, jobs[index]) for index in order]
+        for index, label, passed, usage, output in pool.imap_unordered(
+            run_indexed_job_captured, indexed_jobs
+        ):
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            results[index] = (label, passed, usage)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def run_jobs_with_mem_budget(jobs, num_jobs, order, mem_budget, mem_estimates):
+    """带内存预算准入控制的并行执行
+
+    按 order 顺序扫描待运行 job，只有在运行中 job 数小于 num_jobs、且已准入 job
+    的预计峰值 RSS 之和加上该 job 的预计值不超过 mem_budget 时才准入；放不下的
+    job 让位给后面更小的 job。单个 job 的预计值超过整个预算时，等其他 job
+    全部结束后单独运行；此时预算不再限制它的 RSS，只有显式的 --job-mem-limit 生效。
+    """
+    results = [None] * len(jobs)
+    pending = list(order)
+    running = {}
+    reserved = 0
+
+    pool = multiprocessing.Pool(num_jobs)
+    try:
+        while pending or running:
+            for index in list(pending):
+                if len(running) >= num_jobs:
+                    break
+                estimate = mem_estimates[index]
+                if reserved + estimate > mem_budget and (
+                    running or estimate <= mem_budget
+                ):
+                    continue
+                job = jobs[index]
+                if estimate > mem_budget:
+                    print(
+                        "Warning: %s expects %s RSS, above --mem-budget %s; running alone"
+                        % (job[0], cli_util.format_size(estimate), cli_util.format_size(mem_budget))
+                    )
+                    # 默认的 RSS 上限等于预算，按预计值会终止这个 job
+                    test_dir, py_merge, options = job
+                    job = (test_dir, py_merge, dict(options, mem_limit=options.get("job_mem_limit")))
+                pending.remove(index)
+                reserved += estimate
+                running[index] = pool.apply_async(
+                    run_indexed_job_captured, ((index, job),)
+                )
+
+            finished = [i for i, r in running.items() if r.ready()]
+            if not finished:
+                time.sleep(0.2)
+                continue
+
+            for index in finished:
+                _, label, passed, usage, output = running.pop(index).get()
+                reserved -= mem_estimates[index]
+                sys.stdout.write(output)
+                sys.stdout.flush()
+                results[index] = (label, passed, usage)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def estimate_job_metric(jobs, history_db, metric, default_rate, readonly=False):
+    """根据性能历史估计每个 job 的 metric（wall_time / max_rss）
+
+    有历史记录的 job 取最近几次运行的中位数；没有历史的 job 按 tarball 大小乘以
+    有历史的 job 的平均「metric / tarball 字节」估计，完全没有历史时使用
+    default_rate。readonly 时只读打开 history_db（固定的历史快照）。
+    """
+    expected = {}
+    if history_db and os.path.exists(history_db):
+        try:
+            if readonly:
+                conn = perf_history.open_db_readonly(history_db)
+            else:
+                conn = perf_history.open_db(history_db)
+            try:
+                expected = perf_history.query_expected_values(conn, metric)
+            finally:
+                conn.close()
+        except Exception as e:
+            print("Warning: Failed to read perf history: %s" % str(e))
+
+    testdata_dir = os.path.dirname(os.path.abspath(__file__))
+    known = []
+    sizes = []
+    for test_dir, py_merge, options in jobs:
+        flags = make_maze_flags(
+            py_merge,
+            detect_no_cpp(test_dir),
+            options.get("walker_jobs"),
+            options.get("piece_sort"),
+        )
+        try:
+            size = os.path.getsize(find_tarball(os.path.join(testdata_dir, test_dir)))
+        except (RuntimeError, OSError):
+            size = 0
+        sizes.append(size)
+        known.append(expected.get((perf_history.normalize_test(test_dir), flags)))
+
+    rate_samples = [
+        value / float(size)
+        for value, size in zip(known, sizes)
+        if value is not None and size
+    ]
+    if rate_samples:
+        rate = sum(rate_samples) / len(rate_samples)
+    else:
+        rate = default_rate
+
+    return [
+        value if value is not None else size * rate
+        for value, size in zip(known, sizes)
+    ]
+
+
+def estimate_job_durations(jobs, history_db, readonly=False):
+    """估计每个 job 的耗时（秒），没有任何历史时以 tarball 大小 (MB) 作为相对权重"""
+    return estimate_job_metric(
+        jobs, history_db, "wall_time", 1.0 / (1024 * 1024), readonly=readonly
+    )
+
+
+def estimate_job_peak_rss(jobs, history_db):
+    """估计每个 job 的 maze 峰值 RSS（字节）"""
+    return estimate_job_metric(
+        jobs, history_db, "max_rss", MEM_ESTIMATE_TARBALL_FACTOR
+    )
+
+
+def shard_by_name(names, shard_index, shard_count):
+    """按名字排序后轮流分配，返回第 shard_index 份的下标（从 1 开始）
+
+    只取决于名字集合，与参数顺序和本地历史无关。
+    """
+    ordered = sorted(range(len(names)), key=lambda i: names[i])
+    return sorted(ordered[shard_index - 1 :: shard_count])
+
+
+def order_jobs_lpt(durations):
+    """最长处理时间优先 (LPT)：按预计耗时从长到短排列 job 下标
+
+    进程池中空闲的 worker 总是领取剩余最长的 job，大 core 不会拖在最后单独运行。
+    """
+    return sorted(range(len(durations)), key=lambda i: (-durations[i], i))
+
+
+def shard_jobs(durations, shard_index, shard_count):
+    """按预计耗时把 job 均衡分成 shard_count 份，返回第 shard_index 份的下标
+
+    按 LPT 顺序把每个 job 分给当前总耗时最小的分片，结果只取决于 durations；
+    durations 必须来自各分片相同且运行中不变的输入（--shard-history 快照），
+    否则各分片看到的划分不同。shard_index 从 1 开始。
+    """
+    heap = [(0.0, i) for i in range(shard_count)]
+    assigned = [[] for _ in range(shard_count)]
+    for index in order_jobs_lpt(durations):
+        total, shard = heapq.heappop(heap)
+        assigned[shard].append(index)
+        heapq.heappush(heap, (total + durations[index], shard))
+    return sorted(assigned[shard_index - 1])
+
+
+# benchmark 统计和基线比较的指标
+BENCH_METRICS = ["wall_time", "user_time", "sys_time", "max_rss"]
+
+# 与基线比较时判定回归的指标
+BENCH_REGRESSION_METRICS = ["wall_time", "max_rss"]
+
+
+def percentile(values, pct):
+    """最近秩法百分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = int(round(pct / 100.0 * len(ordered) + 0.5)) - 1
+    rank = max(0, min(rank, len(ordered) - 1))
+    return ordered[rank]
+
+
+def median(values):
+    """中位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def summarize_bench_runs(runs):
+    """汇总同一测试多次运行的资源占用
+
+    Args:
+        runs: [usage dict]
+
+    Returns:
+        dict: {metric: {"median": x, "p95": y}}，只包含有采样值的指标
+    """
+    stats = {}
+    for metric in BENCH_METRICS:
+        values = [run[metric] for run in runs if run.get(metric) is not None]
+        if values:
+            stats[metric] = {
+                "median": median(values),
+                "p95": percentile(values, 95),
+            }
+    return stats
+
+
+def load_bench_baseline(path):
+    """读取基线文件，不存在时返回空 dict"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get("tests", {})
+
+
+def save_bench_baseline(path, bench_stats):
+    """保存基线文件"""
+    ensure_dir(os.path.dirname(os.path.abspath(path)))
+    with open(path, "w") as f:
+        json.dump({"version": 1, "tests": bench_stats}, f, indent=2, sort_keys=True)
+
+
+def compare_bench_baseline(label, stats, baseline, threshold):
+    """与基线比较中位数，返回回归描述列表"""
+    regressions = []
+    base = baseline.get(label)
+    if not base:
+        return regressions
+
+    for metric in BENCH_REGRESSION_METRICS:
+        if metric not in stats or metric not in base:
+            continue
+        old = base[metric]["median"]
+        new = stats[metric]["median"]
+        if old and new > old * (1 + threshold / 100.0):
+            regressions.append(
+                "%s median %.3f -> %.3f (+%.1f%%)"
+                % (metric, old, new, (new - old) * 100.0 / old)
+            )
+    return regressions
+
+
+def format_bench_value(metric, value):
+    """格式化 benchmark 数值"""
+    if value is None:
+        return "N/A"
+    if metric == "max_rss":
+        return "%.1fM" % (value / 1024.0 / 1024.0)
+    return "%.2fs" % value
+
+
+def run_bench(jobs, repeat, baseline_path, threshold, save_baseline=False):
+    """benchmark 模式：每个 job 顺序运行 repeat 次并与基线比较
+
+    为避免相互干扰，benchmark 始终顺序执行且不使用结果缓存。
+    只统计通过验证的运行：失败的运行可能提前退出，耗时和内存都不具代表性。
+
+    Returns:
+        (results, regressed)：results 为 [(label, passed)]，
+        任意一次运行失败即视为失败；regressed 为是否存在性能回归
+    """
+    runs = collections.OrderedDict()
+    passed_map = {}
+    for i in range(repeat):
+        print("")
+        print("Benchmark round %d/%d" % (i + 1, repeat))
+        for label, passed, usage in run_jobs(jobs):
+            runs.setdefault(label, [])
+            if passed and usage:
+                runs[label].append(usage)
+            passed_map[label] = passed_map.get(label, True) and passed
+
+    baseline = load_bench_baseline(baseline_path)
+    bench_stats = {}
+    regressed = False
+
+    print("")
+    print("Benchmark Summary (%d runs, threshold %.1f%%)" % (repeat, threshold))
+    for label, label_runs in runs.items():
+        stats = summarize_bench_runs(label_runs)
+        bench_stats[label] = stats
+        if len(label_runs) < repeat:
+            print("  %s: (%d/%d runs passed)" % (label, len(label_runs), repeat))
+        else:
+            print("  %s:" % label)
+        for metric in BENCH_METRICS:
+            if metric in stats:
+                print(
+                    "    %-9s median %s  p95 %s"
+                    % (
+                        metric,
+                        format_bench_value(metric, stats[metric]["median"]),
+                        format_bench_value(metric, stats[metric]["p95"]),
+                    )
+                )
+        for msg in compare_bench_baseline(label, stats, baseline, threshold):
+            print("    ❌ Regression: %s" % msg)
+            regressed = True
+
+    if save_baseline:
+        # 只更新本次运行的测试，其他测试的基线保持不变；
+        # 没有通过的运行（没有采样值）的测试不覆盖旧基线
+        merged = dict(baseline)
+        merged.update((label, stats) for label, stats in bench_stats.items() if stats)
+        save_bench_baseline(baseline_path, merged)
+        print("Benchmark baseline saved to: %s" % baseline_path)
+
+    results = [(label, passed_map[label]) for label in runs]
+    return results, regressed
+
+
+# 堆遍历阶段：分配器 walker（maze/mallocer/jemalloc.WalkJemalloc 等），
+# 以及逐个 arena / pool 分类 obmalloc 对象的 Python.obmalloc / Python.unicode
+WALKER_PHASE_PATTERNS = ["*mallocer/*.Walk*", "Python.obmalloc", "Python.unicode"]
+
+# --scaling 未指定测试目录时使用的测试（相对 testdata 目录）
+SCALING_DEFAULT_TESTS = [
+    "cpp/*-jemalloc-*-multithread",
+    "cpp/*-mimalloc-*-multithread",
+    "python/20260129-complex-types*",
+]
+
+
+def read_walker_time(phases_path):
+    """phases.json 中堆遍历阶段（WALKER_PHASE_PATTERNS）的总耗时（秒），没有阶段数据时返回 None"""
+    try:
+        with open(phases_path, "r") as f:
+            phases = json.load(f).get("phases", [])
+    except (IOError, OSError, ValueError):
+        return None
+    durations = [
+        phase["duration"]
+        for phase in phases
+        if any(fnmatch.fnmatch(phase["name"], p) for p in WALKER_PHASE_PATTERNS)
+    ]
+    if not durations:
+        return None
+    return sum(durations)
+
+
+def run_scaling(jobs, worker_counts):
+    """扩展性测试：每个 job 依次以各 worker 数运行，报告耗时、吞吐和加速比
+
+    顺序执行且不使用结果缓存；同一测试在不同 worker 数下的结果必须完全一致，
+    否则视为失败（并行遍历的合并顺序不确定）。
+
+    Returns:
+        [(label, passed)]
+    """
+    maze_root = get_maze_root()
+    results = []
+    report = []
+    for test_dir, py_merge, options in jobs:
+        options = dict(options, isolated=False, use_cache=False)
+        label = make_job_label(test_dir, py_merge=py_merge)
+        passed = True
+        rows = []
+        for count in worker_counts:
+            print("")
+            print("Scaling: %s with %d walker jobs" % (label, count))
+            _, run_passed, usage = run_job(
+                (test_dir, py_merge, dict(options, walker_jobs=count))
+            )
+            passed = passed and run_passed and "objects" in usage
+            walker_time = read_walker_time(
+                make_phases_path(maze_root, test_dir, py_merge=py_merge)
+            )
+            rows.append((count, usage, walker_time))
+
+        digests = set(usage["result_digest"] for _, usage, _ in rows if "objects" in usage)
+        deterministic = len(digests) <= 1
+        passed = passed and deterministic
+        results.append((label, passed))
+        report.append((label, rows, deterministic))
+
+    print("")
+    print("Scaling Summary")
+    for label, rows, deterministic in report:
+        print("  %s:" % label)
+        print(
+            "    %7s %9s %9s %12s %8s"
+            % ("Workers", "Wall", "Walk", "Objects/s", "Speedup")
+        )
+        base_time = None
+        for count, usage, walker_time in rows:
+            if "objects" not in usage:
+                print("    %7d %9s" % (count, "FAILED"))
+                continue
+            # 吞吐和加速比优先按堆遍历阶段计算，没有阶段标记时按整体 wall time
+            elapsed = walker_time or usage.get("wall_time")
+            if base_time is None:
+                base_time = elapsed
+            print(
+                "    %7d %9s %9s %12s %8s"
+                % (
+                    count,
+                    format_bench_value("wall_time", usage.get("wall_time")),
+                    format_bench_value("wall_time", walker_time),
+                    "%.0f" % (usage["objects"] / elapsed) if elapsed else "N/A",
+                    "%.2fx" % (base_time / elapsed) if elapsed and base_time else "N/A",
+                )
+            )
+        if not deterministic:
+            print("    ❌ Results differ between worker counts")
+
+    return results
+
+
+def take_option_value(args, i, name):
+    """取出选项 args[i] 的值，缺失时报错退出"""
+    if i + 1 >= len(args):
+        print("Error: %s requires a value" % name)
+        sys.exit(1)
+    return args[i + 1]
+
+
 def main():
     if len(sys.argv) < 2:
         print(
-            "Usage: python run_test.py [--py-merge] [--verbose-maze] <test_dir> [test_dir2 ...]"
+            "Usage: python run_test.py [--py-merge] [--verbose-maze] [--jobs N] [--cache] [--py-merge-parallel] [--bench N] [--no-history] [--shard i/n] [--mem-budget SIZE] [--extract-store] [--symbol-cache] [--type-db] [--walker-jobs N] [--piece-sort comparison|radix] [--scaling 1,2,4,8] <test_dir> [test_dir2 ...]"
         )
         print("")
         print("Options:")
         print("  --py-merge    Also run tests with --py-merge mode")
+        print("  --py-merge-parallel  Like --py-merge, but run both modes of a test at the same time")
         print("  --verbose-maze  Print full maze output instead of saving it to tmp/")
+        print("  --jobs N, -j N  Run N tests in parallel, each in tmp/jobs/<name>")
+        print("  --cache       Reuse cached maze results for unchanged tarball/maze/flags")
+        print("  --bench N     Run each test N times and report median/p95 wall, CPU and peak RSS")
+        print("  --bench-baseline PATH  Baseline file (default: tmp/bench-baseline.json)")
+        print("  --bench-threshold PCT  Fail when median wall time/RSS regresses by more than PCT (default: 10)")
+        print("  --bench-save  Save this benchmark as the new baseline")
+        print("  --no-history  Do not append this run to tmp/perf-history.sqlite3")
+        print("  --history-db PATH  Perf history database (default: tmp/perf-history.sqlite3)")
+        print("  --shard i/n   Only run shard i (1-based) of n; tests are dealt out by sorted name")
+        print("  --shard-history PATH  Balance shards by durations from this read-only perf history snapshot")
+        print("  --mem-budget SIZE  Only start a job when the predicted peak RSS of running jobs fits, e.g. 32G")
+        print("  --job-mem-limit SIZE  Kill a maze analysis whose RSS exceeds SIZE (default: --mem-budget)")
+        print("  --extract-store  Extract each tarball once into tmp/extract-store and pass it to maze")
+        print("  --extract-store-size SIZE  LRU size limit of the extract store (default: 50G)")
+        print("  --symbol-cache  Serve maze's bin/s3 downloads from tmp/symbol-cache, remembering misses")
+        print("  --offline-s3 DIR  Use DIR instead of S3 (implies --symbol-cache)")
+        print("  --symbol-negative-ttl SECONDS  How long a missing symbol is not requested again (default: 86400)")
+        print("  --type-db     Build tmp/type-db/<build-id>.tdb for new build-ids and pass it to maze")
+        print("  --walker-jobs N  Number of workers maze uses to walk allocator arenas (MAZE_WALKER_JOBS)")
+        print("  --piece-sort comparison|radix  How maze sorts memory pieces (MAZE_PIECE_SORT)")
+        print("  --scaling LIST  Run each test with each walker job count, e.g. 1,2,4,8, and report")
+        print("                  wall time, objects/sec and speedup (default tests: %s)"
+              % " ".join(SCALING_DEFAULT_TESTS))
         print("")
         print("Examples:")
         print("  python testdata/run_test.py python/20260128-basic")
         print("  python testdata/run_test.py --py-merge python/20260201-class-merge")
+        print("  python testdata/run_test.py -j 8 cpp/20260211-jemalloc-5-3-0-multithread python/20260128-basic")
         sys.exit(1)
 
     # 解析参数
     args = sys.argv[1:]
     enable_py_merge = False
+    py_merge_parallel = False
     verbose_maze = False
+    num_jobs = 1
+    use_cache = False
+    bench_repeat = 0
+    bench_baseline = os.path.join(get_maze_root(), "tmp", "bench-baseline.json")
+    bench_threshold = 10.0
+    bench_save = False
+    record_history = True
+    history_db = perf_history.default_db_path(get_maze_root())
+    shard = None
+    shard_history = None
+    mem_budget = None
+    job_mem_limit = None
+    extract_store_size = None
+    use_symbol_cache = False
+    offline_s3_dir = None
+    symbol_negative_ttl = None
+    use_type_db = False
+    walker_jobs = None
+    piece_sort = None
+    scaling_counts = None
     test_dirs = []
 
-    for arg in args:
+    i = 0
+    while i < len(args):
+        arg = args[i]
         if arg == "--py-merge":
             enable_py_merge = True
+        elif arg == "--py-merge-parallel":
+            enable_py_merge = True
+            py_merge_parallel = True
         elif arg == "--verbose-maze":
             verbose_maze = True
+        elif arg == "--cache":
+            use_cache = True
+        elif arg in ("--jobs", "-j"):
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                num_jobs = int(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+            if num_jobs < 1:
+                print("Error: %s must be >= 1" % arg)
+                sys.exit(1)
+        elif arg == "--bench":
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                bench_repeat = int(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+            if bench_repeat < 1:
+                print("Error: %s must be >= 1" % arg)
+                sys.exit(1)
+        elif arg == "--bench-baseline":
+            bench_baseline = take_option_value(args, i, arg)
+            i += 1
+        elif arg == "--bench-threshold":
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                bench_threshold = float(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+        elif arg == "--bench-save":
+            bench_save = True
+        elif arg == "--no-history":
+            record_history = False
+        elif arg == "--history-db":
+            history_db = take_option_value(args, i, arg)
+            i += 1
+        elif arg == "--shard":
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                shard_index, shard_count = [int(v) for v in value.split("/")]
+            except ValueError:
+                print("Error: Invalid value for %s: %s (expected i/n)" % (arg, value))
+                sys.exit(1)
+            if shard_count < 1 or not 1 <= shard_index <= shard_count:
+                print("Error: Invalid shard %s" % value)
+                sys.exit(1)
+            shard = (shard_index, shard_count)
+        elif arg == "--shard-history":
+            shard_history = take_option_value(args, i, arg)
+            i += 1
+        elif arg == "--symbol-cache":
+            use_symbol_cache = True
+        elif arg == "--offline-s3":
+            offline_s3_dir = take_option_value(args, i, arg)
+            i += 1
+            if not os.path.isdir(offline_s3_dir):
+                print("Error: Directory not found: %s" % offline_s3_dir)
+                sys.exit(1)
+            use_symbol_cache = True
+        elif arg == "--symbol-negative-ttl":
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                symbol_negative_ttl = int(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+        elif arg == "--type-db":
+            use_type_db = True
+        elif arg == "--walker-jobs":
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                walker_jobs = int(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+            if walker_jobs < 1:
+                print("Error: %s must be >= 1" % arg)
+                sys.exit(1)
+        elif arg == "--piece-sort":
+            piece_sort = take_option_value(args, i, arg)
+            i += 1
+            if piece_sort not in PIECE_SORT_CHOICES:
+                print(
+                    "Error: %s must be one of: %s" % (arg, ", ".join(PIECE_SORT_CHOICES))
+                )
+                sys.exit(1)
+        elif arg == "--scaling":
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                scaling_counts = cli_util.parse_worker_counts(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+        elif arg == "--extract-store":
+            if extract_store_size is None:
+                extract_store_size = DEFAULT_EXTRACT_STORE_SIZE
+        elif arg in ("--mem-budget", "--job-mem-limit", "--extract-store-size"):
+            value = take_option_value(args, i, arg)
+            i += 1
+            try:
+                size = cli_util.parse_size(value)
+            except ValueError:
+                print("Error: Invalid value for %s: %s" % (arg, value))
+                sys.exit(1)
+            if arg == "--mem-budget":
+                mem_budget = size
+            elif arg == "--job-mem-limit":
+                job_mem_limit = size
+            else:
+                extract_store_size = size
         else:
             test_dirs.append(arg)
+        i += 1
+
+    if not test_dirs and scaling_counts:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        for pattern in SCALING_DEFAULT_TESTS:
+            test_dirs += sorted(
+                os.path.relpath(path, testdata_dir)
+                for path in glob.glob(os.path.join(testdata_dir, pattern))
+            )
 
     if not test_dirs:
         print("Error: No test directories specified")
         sys.exit(1)
 
-    results = []
+    # 每个测试目录先跑普通模式，开启 --py-merge 时再跑一次 merge 模式
+    # 两种模式的 job 在提交顺序中相邻，进程池至少 2 个 worker 时会被同时调度，
+    # 各自在隔离的工作根目录中运行，互不干扰；两者通过预解压存储共用一次解压
+    if py_merge_parallel:
+        if num_jobs < 2:
+            num_jobs = 2
+        if not extract_store_size:
+            if maze_reads_env(get_maze_root(), EXTRACTED_DIR_ENV):
+                extract_store_size = DEFAULT_EXTRACT_STORE_SIZE
+            else:
+                print(
+                    "Warning: maze does not read %s, each mode extracts the tarball itself"
+                    % EXTRACTED_DIR_ENV
+                )
+
+    # 并行度只通过环境变量传给 maze，maze 不读取时各个 worker 数的结果完全相同，
+    # 缓存和历史却按不同参数记录，直接报错
+    if (walker_jobs or scaling_counts) and not maze_reads_env(
+        get_maze_root(), WALKER_JOBS_ENV
+    ):
+        print(
+            "Error: maze does not read %s, --walker-jobs and --scaling have no effect"
+            % WALKER_JOBS_ENV
+        )
+        sys.exit(1)
+    if piece_sort and not maze_reads_env(get_maze_root(), PIECE_SORT_ENV):
+        print("Error: maze does not read %s, --piece-sort has no effect" % PIECE_SORT_ENV)
+        sys.exit(1)
 
+    if shard and record_history:
+        # 分片运行不写性能历史，避免各分片读写同一份历史时结果互相影响
+        print("Note: Perf history is not recorded for sharded runs")
+        record_history = False
+
+    options = {
+        "verbose_maze": verbose_maze,
+        "isolated": num_jobs > 1,
+        "use_cache": use_cache,
+        "history_db": history_db if record_history else None,
+        "mem_limit": job_mem_limit or mem_budget,
+        "job_mem_limit": job_mem_limit,
+        "extract_store_size": extract_store_size,
+        "symbol_cache": None,
+        "type_db": type_db.default_db_dir(get_maze_root()) if use_type_db else None,
+        "walker_jobs": walker_jobs,
+        "piece_sort": piece_sort,
+    }
+    if use_symbol_cache:
+        options["symbol_cache"] = make_symbol_cache_config(
+            get_maze_root(), offline_dir=offline_s3_dir, negative_ttl=symbol_negative_ttl
+        )
+    jobs = []
     for test_dir in test_dirs:
-        # 普通模式测试
-        try:
-            passed = run_test(test_dir, verbose_maze=verbose_maze)
-            results.append((test_dir, passed))
-        except Exception as e:
-            print("")
-            print("❌ Test ERROR: %s" % test_dir)
-            print("   %s" % str(e))
-            results.append((test_dir, False))
-
-        # --py-merge 模式测试
+        jobs.append((test_dir, False, options))
         if enable_py_merge:
-            try:
-                passed = run_test(test_dir, py_merge=True, verbose_maze=verbose_maze)
-                results.append(("%s (--py-merge)" % test_dir, passed))
-            except Exception as e:
-                print("")
-                print("❌ Test ERROR: %s (--py-merge)" % test_dir)
-                print("   %s" % str(e))
-                results.append(("%s (--py-merge)" % test_dir, False))
+            jobs.append((test_dir, True, options))
+
+    # 按历史耗时排序；不需要时不读取历史，保持原有启动开销
+    durations = None
+    if num_jobs > 1:
+        durations = estimate_job_durations(jobs, history_db)
+        if py_merge_parallel:
+            # 同一测试的两种模式使用相同的预计耗时，LPT 排序后仍然相邻
+            for i in range(0, len(jobs), 2):
+                durations[i] = durations[i + 1] = max(durations[i : i + 2])
+
+    if shard:
+        # 按测试目录分片，同一测试的两种模式总在同一个分片中，共用一次解压。
+        # 划分只使用各分片相同的输入：测试名，或 --shard-history 指定的只读快照
+        groups = collections.OrderedDict()
+        for index, (test_dir, _, _) in enumerate(jobs):
+            groups.setdefault(perf_history.normalize_test(test_dir), []).append(index)
+        names = sorted(groups)
+        groups = [groups[name] for name in names]
+        if shard_history:
+            if not os.path.exists(shard_history):
+                print("Error: Shard history not found: %s" % shard_history)
+                sys.exit(1)
+            snapshot = estimate_job_durations(jobs, shard_history, readonly=True)
+            shard_groups = shard_jobs(
+                [sum(snapshot[i] for i in group) for group in groups], shard[0], shard[1]
+            )
+        else:
+            shard_groups = shard_by_name(names, shard[0], shard[1])
+        selected = sorted(index for g in shard_groups for index in groups[g])
+        print(
+            "Shard %d/%d: %d/%d jobs (%s)"
+            % (
+                shard[0],
+                shard[1],
+                len(selected),
+                len(jobs),
+                "balanced by %s" % shard_history if shard_history else "by name",
+            )
+        )
+        jobs = [jobs[i] for i in selected]
+        if durations is not None:
+            durations = [durations[i] for i in selected]
+
+    bench_regressed = False
+    if scaling_counts:
+        if bench_repeat or num_jobs > 1 or use_cache:
+            print("Warning: --scaling runs sequentially without result cache or --bench")
+        results = run_scaling(jobs, scaling_counts)
+    elif bench_repeat:
+        if num_jobs > 1 or use_cache:
+            print("Warning: --bench runs sequentially without result cache")
+        options["isolated"] = False
+        options["use_cache"] = False
+        results, bench_regressed = run_bench(
+            jobs,
+            bench_repeat,
+            bench_baseline,
+            bench_threshold,
+            save_baseline=bench_save,
+        )
+    else:
+        order = None
+        mem_estimates = None
+        if num_jobs > 1:
+            order = order_jobs_lpt(durations)
+            if mem_budget:
+                mem_estimates = estimate_job_peak_rss(jobs, history_db)
+        results = run_jobs(
+            jobs,
+            num_jobs=num_jobs,
+            order=order,
+            mem_budget=mem_budget,
+            mem_estimates=mem_estimates,
+        )
+        results = [r[:2] for r in results]
 
     # 打印汇总
     print("")
@@ -499,9 +2354,11 @@ def main():
             failed_count += 1
 
     print("Total: %d passed, %d failed" % (passed_count, failed_count))
+    if bench_regressed:
+        print("Benchmark: performance regression detected")
 
     # 返回退出码
-    sys.exit(0 if failed_count == 0 else 1)
+    sys.exit(0 if failed_count == 0 and not bench_regressed else 1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地符号 / ctypes 缓存，兼容 maze 的 `./bin/s3` 命令行
+
+maze 每次运行都会逐个执行 `./bin/s3 download symbols/<build-id>.debug <file>`，
+大部分 build-id 在 S3 上并不存在，每次都以 NoSuchKey 失败。本模块作为
+`bin/s3` 的替身：
+
+- 下载成功的对象缓存在 <maze_root>/tmp/symbol-cache/objects/<key>，之后直接复制
+- 后端明确报告 NoSuchKey 的 key 在 negative/<key> 记录一次未命中，TTL（默认 1 天）
+  内不再请求；没有配置后端或请求出错（网络、权限等）时不记录，下次照常请求
+- 未命中缓存时请求后端：真正的 bin/s3（MAZE_S3_UPSTREAM），或者离线时用
+  目录代替 S3（MAZE_S3_DIR，<dir>/<key> 即对象内容），CI 可以完全离线运行
+
+run_test.py 开启 --symbol-cache 时把 job 根目录中的 bin/s3 替换为本脚本，并在
+运行 maze 前按 tarball 清单中的 build-id 并行预取，maze 的串行请求全部命中本地。
+
+环境变量：
+    MAZE_SYMBOL_CACHE          缓存目录
+    MAZE_S3_UPSTREAM           真正的 s3 命令行工具
+    MAZE_S3_DIR                目录形式的 S3 替身，设置后不请求 MAZE_S3_UPSTREAM
+    MAZE_SYMBOL_NEGATIVE_TTL   未命中记录的有效期（秒）
+
+Usage:
+    bin/s3 download <key> <output>
+    bin/s3 upload <key> <input>
+    python3 symbol_cache.py prefetch <tarball> [tarball2 ...] [-j N]
+    python3 symbol_cache.py stats
+    python3 symbol_cache.py clear-negative
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+import tar_manifest
+
+
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+
+# 预取的默认并行度，请求以网络等待为主
+DEFAULT_PREFETCH_JOBS = 16
+
+# s3 工具在对象不存在时输出的错误
+NO_SUCH_KEY = b"NoSuchKey"
+
+OBJECTS_SUBDIR = "objects"
+NEGATIVE_SUBDIR = "negative"
+
+
+def default_cache_dir(maze_root=None):
+    """默认缓存目录：<maze_root>/tmp/symbol-cache"""
+    if maze_root is None:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        maze_root = os.path.dirname(testdata_dir)
+    return os.path.join(maze_root, "tmp", "symbol-cache")
+
+
+def default_upstream(maze_root=None):
+    """maze 自带的 s3 命令行工具，不存在时返回 None"""
+    if maze_root is None:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        maze_root = os.path.dirname(testdata_dir)
+    path = os.path.join(maze_root, "bin", "s3")
+    if os.path.isfile(path) and os.path.realpath(path) != os.path.realpath(__file__):
+        return path
+    return None
+
+
+def symbol_keys(build_id):
+    """build-id 对应的符号和 ctypes key"""
+    return ["symbols/%s.debug" % build_id, "ctypes-%s" % build_id]
+
+
+def key_path(base_dir, key):
+    """key 在 base_dir 下的路径，拒绝跳出 base_dir 的 key"""
+    parts = [p for p in key.split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        raise ValueError("Invalid key: %s" % key)
+    return os.path.join(base_dir, *parts)
+
+
+def ensure_parent(path):
+    """创建 path 的父目录，并发创建时忽略已存在"""
+    parent = os.path.dirname(path)
+    if parent and not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:
+            if not os.path.isdir(parent):
+                raise
+
+
+def copy_atomic(src, dst):
+    """复制到临时文件再 rename，并行 job 不会读到写了一半的文件"""
+    ensure_parent(dst)
+    tmp_path = "%s.%d.tmp" % (dst, os.getpid())
+    shutil.copyfile(src, tmp_path)
+    os.rename(tmp_path, dst)
+
+
+class Backend(object):
+    """符号后端：目录形式的 S3 替身，或真正的 s3 命令行工具"""
+
+    def __init__(self, upstream=None, offline_dir=None):
+        self.upstream = upstream
+        self.offline_dir = offline_dir
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            upstream=os.environ.get("MAZE_S3_UPSTREAM") or default_upstream(),
+            offline_dir=os.environ.get("MAZE_S3_DIR") or None,
+        )
+
+    def fetch(self, key, output):
+        """下载 key 到 output
+
+        成功返回 True，后端确认对象不存在返回 False，无法确定（没有后端、请求出错）
+        返回 None，调用方不应为 None 记录未命中。
+        """
+        if self.offline_dir:
+            path = key_path(self.offline_dir, key)
+            if not os.path.isfile(path):
+                return False
+            copy_atomic(path, output)
+            return True
+
+        if not self.upstream:
+            return None
+        ensure_parent(output)
+        with open(os.devnull, "w") as devnull:
+            proc = subprocess.Popen(
+                [self.upstream, "download", key, output],
+                stdout=devnull,
+                stderr=subprocess.PIPE,
+            )
+            _, stderr = proc.communicate()
+        if proc.returncode == 0 and os.path.isfile(output) and os.path.getsize(output) > 0:
+            return True
+        if NO_SUCH_KEY in stderr:
+            return False
+        return None
+
+    def store(self, key, input_path):
+        """上传 input_path 为 key"""
+        if self.offline_dir:
+            copy_atomic(input_path, key_path(self.offline_dir, key))
+        elif self.upstream:
+            subprocess.check_call([self.upstream, "upload", key, input_path])
+
+
+class SymbolCache(object):
+    """带 TTL 未命中记录的本地对象缓存"""
+
+    def __init__(self, cache_dir, backend, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.negative_ttl = negative_ttl
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get("MAZE_SYMBOL_CACHE") or default_cache_dir(),
+            Backend.from_env(),
+            int(os.environ.get("MAZE_SYMBOL_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL)),
+        )
+
+    def object_path(self, key):
+        return key_path(os.path.join(self.cache_dir, OBJECTS_SUBDIR), key)
+
+    def negative_path(self, key):
+        return key_path(os.path.join(self.cache_dir, NEGATIVE_SUBDIR), key)
+
+    def is_negative(self, key):
+        """key 是否在 TTL 内记录过未命中"""
+        try:
+            missed_at = os.path.getmtime(self.negative_path(key))
+        except OSError:
+            return False
+        return time.time() - missed_at < self.negative_ttl
+
+    def lookup(self, key):
+        """返回 (缓存中的对象路径或 None, 来源)
+
+        来源为 "hit"、"negative"、"fetched" 或 "missing"。只有后端确认 key 不存在时
+        才记录未命中，其他失败返回 "missing" 但不写记录。
+        """
+        path = self.object_path(key)
+        if os.path.isfile(path):
+            return path, "hit"
+        if self.is_negative(key):
+            return None, "negative"
+
+        ensure_parent(path)
+        tmp_path = "%s.%d.download" % (path, os.getpid())
+        try:
+            found = self.backend.fetch(key, tmp_path)
+            if found:
+                os.rename(tmp_path, path)
+                return path, "fetched"
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if found is None:
+            return None, "missing"
+        negative = self.negative_path(key)
+        ensure_parent(negative)
+        with open(negative, "w"):
+            os.utime(negative, None)
+        return None, "missing"
+
+    def download(self, key, output):
+        """兼容 `s3 download`：命中时复制到 output 并返回 True"""
+        path, _ = self.lookup(key)
+        if path is None:
+            return False
+        copy_atomic(path, output)
+        return True
+
+    def upload(self, key, input_path):
+        """兼容 `s3 upload`：写入后端和本地缓存，清除未命中记录"""
+        self.backend.store(key, input_path)
+        copy_atomic(input_path, self.object_path(key))
+        try:
+            os.remove(self.negative_path(key))
+        except OSError:
+            pass
+
+    def prefetch(self, keys, jobs=DEFAULT_PREFETCH_JOBS):
+        """并行查找 keys，返回 {来源: 数量}"""
+        counts = {}
+        pool = ThreadPool(max(1, min(jobs, len(keys) or 1)))
+        try:
+            for _, source in pool.imap_unordered(self.lookup, keys):
+                counts[source] = counts.get(source, 0) + 1
+        finally:
+            pool.close()
+            pool.join()
+        return counts
+
+    def stats(self):
+        """返回 (对象数, 对象总字节数, 有效未命中数, 过期未命中数)"""
+        objects = size = negative = expired = 0
+        now = time.time()
+        for root, _, files in os.walk(os.path.join(self.cache_dir, OBJECTS_SUBDIR)):
+            for name in files:
+                objects += 1
+                size += os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(os.path.join(self.cache_dir, NEGATIVE_SUBDIR)):
+            for name in files:
+                if now - os.path.getmtime(os.path.join(root, name)) < self.negative_ttl:
+                    negative += 1
+                else:
+                    expired += 1
+        return objects, size, negative, expired
+
+
+def tarball_symbol_keys(tarball_path):
+    """按 tarball 清单中的 build-id 列出 maze 会请求的 key"""
+    manifest = tar_manifest.read_manifest(tarball_path)
+    if not manifest:
+        return []
+    keys = []
+    for build_id in sorted(set(manifest.get("build_ids", {}).values())):
+        keys.extend(symbol_keys(build_id))
+    return keys
+
+
+def main():
+    args = sys.argv[1:]
+    cache = SymbolCache.from_env()
+
+    # 作为 bin/s3 替身被 maze 调用
+    if len(args) == 3 and args[0] == "download":
+        if cache.download(args[1], args[2]):
+            return
+        print("NoSuchKey: %s" % args[1], file=sys.stderr)
+        sys.exit(1)
+    if len(args) == 3 and args[0] == "upload":
+        cache.upload(args[1], args[2])
+        return
+
+    parser = argparse.ArgumentParser(description="Local symbol / ctypes cache")
+    sub = parser.add_subparsers(dest="command")
+    prefetch_parser = sub.add_parser("prefetch", help="Fetch symbols for tarballs in parallel")
+    prefetch_parser.add_argument("tarballs", nargs="+")
+    prefetch_parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_PREFETCH_JOBS)
+    sub.add_parser("stats", help="Show cache statistics")
+    sub.add_parser("clear-negative", help="Forget all recorded misses")
+    args = parser.parse_args(args)
+
+    if args.command == "prefetch":
+        keys = []
+        for tarball in args.tarballs:
+            keys.extend(tarball_symbol_keys(tarball))
+        counts = cache.prefetch(sorted(set(keys)), jobs=args.jobs)
+        print(", ".join("%s %d" % item for item in sorted(counts.items())) or "No keys")
+    elif args.command == "stats":
+        objects, size, negative, expired = cache.stats()
+        print("Cache: %s" % cache.cache_dir)
+        print("Objects: %d (%.1fM)" % (objects, size / 1024.0 / 1024.0))
+        print("Negative entries: %d (%d expired)" % (negative, expired))
+    elif args.command == "clear-negative":
+        shutil.rmtree(os.path.join(cache.cache_dir, NEGATIVE_SUBDIR), ignore_errors=True)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+coredump tarball manifest
+
+为 `maze-tar-coredump.py` 生成的 coredump-<pid>-<ts>.tar.gz 生成旁路清单
+`<tarball>.manifest.json`（.tar.zst 同样适用），记录 pid、每个 member 在解压后 tar 流中的偏移和大小、
+exe 路径以及 ELF member 的 build-id（包括去重 tarball 中移到对象存储的 member）。工具只需读取这个小 json 就能拿到这些信息，
+不必再解压 gzip 流。
+
+清单需要完整解压一次 tarball，应在打包后立即生成：
+
+    python3 cmd/maze-tar-coredump.py core.<pid>
+    python3 testdata/tar_manifest.py coredump-<pid>-<ts>.tar.gz
+
+Usage:
+    python3 tar_manifest.py <tarball> [tarball2 ...]
+    python3 tar_manifest.py --all        # 为 testdata 下所有缺少清单的 tarball 生成
+    python3 tar_manifest.py --cat <tarball> <member>   # 输出单个 member，.tar.zst 只解压覆盖的 frame
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import glob
+import struct
+
+import zstd_archive
+
+
+MANIFEST_VERSION = 1
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+# 超过该大小的 ELF member（coredump 本身）不读取 build-id
+BUILD_ID_MAX_MEMBER_SIZE = 256 * 1024 * 1024
+
+# 去重 tarball 中记录 {member 名: build-id} 的 member，见 object_store.py
+REFS_MEMBER = ".objects.json"
+
+TARBALL_NAME_RE = re.compile(r"^coredump-(\d+)-\d+\.tar\.(?:gz|zst)$")
+
+ELF_MAGIC = b"\x7fELF"
+PT_NOTE = 4
+NT_GNU_BUILD_ID = 3
+
+
+def manifest_path(tarball_path):
+    """返回 tarball 对应的清单路径"""
+    return tarball_path + MANIFEST_SUFFIX
+
+
+def pid_from_tarball_name(tarball_path):
+    """从 coredump-<pid>-<ts>.tar.gz / .tar.zst 文件名解析 pid，不匹配时返回 None"""
+    match = TARBALL_NAME_RE.match(os.path.basename(tarball_path))
+    if match:
+        return match.group(1)
+    return None
+
+
+def pid_from_member_name(name):
+    """从 core.<pid> member 名解析 pid"""
+    name = name[2:] if name.startswith("./") else name
+    if name.startswith("core."):
+        return name[len("core.") :]
+    return None
+
+
+def read_manifest(tarball_path):
+    """读取清单，不存在、版本不符或与 tarball 大小不一致时返回 None
+
+    git checkout / LFS 拉取不保留 mtime，因此用 tarball 大小判断清单是否过期。
+    """
+    path = manifest_path(tarball_path)
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        tarball_size = os.path.getsize(tarball_path)
+    except (OSError, IOError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    if manifest.get("tarball_size") != tarball_size:
+        return None
+    return manifest
+
+
+def find_tarball_pid(tarball_path):
+    """O(1) 获取 tarball 的 pid：优先读清单，其次解析文件名
+
+    两者都不可用时返回 None，由调用方决定是否回退到扫描 tarball。
+    """
+    manifest = read_manifest(tarball_path)
+    if manifest and manifest.get("pid"):
+        return manifest["pid"]
+    return pid_from_tarball_name(tarball_path)
+
+
+def parse_elf_build_id(data):
+    """从 ELF 文件内容的 PT_NOTE 段解析 GNU build-id，失败返回 None"""
+    if len(data) < 64 or data[:4] != ELF_MAGIC:
+        return None
+
+    is_64 = data[4:5] == b"\x02"
+    endian = "<" if data[5:6] == b"\x01" else ">"
+    try:
+        if is_64:
+            e_phoff = struct.unpack_from(endian + "Q", data, 0x20)[0]
+            e_phentsize, e_phnum = struct.unpack_from(endian + "HH", data, 0x36)
+        else:
+            e_phoff = struct.unpack_from(endian + "I", data, 0x1C)[0]
+            e_phentsize, e_phnum = struct.unpack_from(endian + "HH", data, 0x2A)
+
+        for i in range(e_phnum):
+            ph = e_phoff + i * e_phentsize
+            p_type = struct.unpack_from(endian + "I", data, ph)[0]
+            if p_type != PT_NOTE:
+                continue
+            if is_64:
+                p_offset, _, _, p_filesz = struct.unpack_from(endian + "QQQQ", data, ph + 8)
+            else:
+                p_offset, _, _, p_filesz = struct.unpack_from(endian + "IIII", data, ph + 4)
+
+            pos = p_offset
+            end = p_offset + p_filesz
+            while pos + 12 <= end:
+                namesz, descsz, n_type = struct.unpack_from(endian + "III", data, pos)
+                name_start = pos + 12
+                desc_start = name_start + ((namesz + 3) & ~3)
+                name = data[name_start : name_start + namesz]
+                if n_type == NT_GNU_BUILD_ID and name == b"GNU\x00":
+                    desc = data[desc_start : desc_start + descsz]
+                    return "".join("%02x" % c for c in bytearray(desc))
+                pos = desc_start + ((descsz + 3) & ~3)
+    except struct.error:
+        return None
+    return None
+
+
+def build_manifest(tarball_path):
+    """完整读取一次 tarball，生成清单 dict"""
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "tarball": os.path.basename(tarball_path),
+        "tarball_size": os.path.getsize(tarball_path),
+        "pid": None,
+        "exe": None,
+        "members": [],
+        "build_ids": {},
+        "objects": {},
+    }
+
+    with zstd_archive.open_tar(tarball_path) as tf:
+        for member in tf:
+            entry = {
+                "name": member.name,
+                "offset": member.offset_data,
+                "size": member.size,
+                "type": "file" if member.isfile() else "other",
+            }
+            manifest["members"].append(entry)
+            if not member.isfile():
+                continue
+
+            if member.name == REFS_MEMBER:
+                # 去重 tarball：被移到对象存储的 ELF member 及其 build-id
+                refs = json.loads(tf.extractfile(member).read().decode("utf-8"))
+                manifest["objects"].update(refs)
+                manifest["build_ids"].update(refs)
+                continue
+
+            pid = pid_from_member_name(member.name)
+            if pid and manifest["pid"] is None:
+                manifest["pid"] = pid
+                continue
+
+            if member.size > BUILD_ID_MAX_MEMBER_SIZE:
+                continue
+            data = tf.extractfile(member).read()
+            if data[:4] == ELF_MAGIC:
+                build_id = parse_elf_build_id(data)
+                if build_id:
+                    entry["build_id"] = build_id
+                    manifest["build_ids"][member.name] = build_id
+            elif member.name.endswith(".exe") and len(data) < 4096:
+                # <pid>.exe 记录的是被 gcore 进程的 exe 路径
+                manifest["exe"] = data.decode("utf-8", "replace").strip()
+
+    if manifest["pid"] is None:
+        manifest["pid"] = pid_from_tarball_name(tarball_path)
+    return manifest
+
+
+def write_manifest(tarball_path):
+    """生成并写入清单，返回清单路径"""
+    manifest = build_manifest(tarball_path)
+    path = manifest_path(tarball_path)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def find_all_tarballs(testdata_dir):
+    """testdata 下所有测试目录中的 tarball"""
+    tarballs = []
+    for suffix in (".tar.gz", zstd_archive.ZSTD_SUFFIX):
+        tarballs.extend(glob.glob(os.path.join(testdata_dir, "*", "*", "*" + suffix)))
+    return sorted(tarballs)
+
+
+def find_member(tarball_path, name):
+    """在归档中定位 member，返回 (offset, size)，找不到时返回 None
+
+    优先使用清单中的偏移；没有清单时顺序扫描。
+    """
+    manifest = read_manifest(tarball_path)
+    if manifest:
+        for entry in manifest["members"]:
+            if entry["name"] in (name, "./" + name):
+                return entry["offset"], entry["size"]
+        return None
+
+    with zstd_archive.open_tar(tarball_path) as tf:
+        for member in tf:
+            if member.name in (name, "./" + name):
+                return member.offset_data, member.size
+    return None
+
+
+def read_member(tarball_path, name):
+    """读取单个 member 的内容，找不到时返回 None
+
+    .tar.zst 只解压覆盖该 member 的 frame；.tar.gz 只能从头解压。
+    """
+    if zstd_archive.is_zstd_archive(tarball_path):
+        location = find_member(tarball_path, name)
+        if location is None:
+            return None
+        return zstd_archive.read_range(tarball_path, location[0], location[1])
+    with zstd_archive.open_tar(tarball_path) as tf:
+        for member in tf:
+            if member.name in (name, "./" + name) and member.isfile():
+                return tf.extractfile(member).read()
+    return None
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python tar_manifest.py <tarball> [tarball2 ...]")
+        print("       python tar_manifest.py --all")
+        print("       python tar_manifest.py --cat <tarball> <member>")
+        sys.exit(1)
+
+    if args[0] == "--cat":
+        if len(args) != 3:
+            print("Usage: python tar_manifest.py --cat <tarball> <member>")
+            sys.exit(1)
+        data = read_member(args[1], args[2])
+        if data is None:
+            print("Error: Member not found: %s" % args[2])
+            sys.exit(1)
+        out = getattr(sys.stdout, "buffer", sys.stdout)
+        out.write(data)
+        return
+
+    if args == ["--all"]:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        tarballs = [
+            t for t in find_all_tarballs(testdata_dir) if read_manifest(t) is None
+        ]
+    else:
+        tarballs = args
+
+    failed = 0
+    for tarball in tarballs:
+        try:
+            path = write_manifest(tarball)
+            print("Manifest written: %s" % path)
+        except Exception as e:
+            print("Error: Failed to build manifest for %s: %s" % (tarball, str(e)))
+            failed += 1
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
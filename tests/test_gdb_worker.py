@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""gdb_worker 请求/应答协议的往返测试，服务端使用假的 op 处理函数，不需要 GDB"""
+import os
+import sys
+import unittest
+
+TESTDATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TESTDATA_DIR)
+
+import gdb_worker  # noqa: E402
+import type_db  # noqa: E402
+
+# 服务端：GDB_HANDLERS 的替身，type_layout 返回与 GDB 相同格式的布局
+FAKE_SERVER = """
+import sys
+sys.path.insert(0, %r)
+import gdb_worker
+
+def type_layout(name):
+    if name != "Foo":
+        raise KeyError(name)
+    return {"name": name, "size": 16, "fields": [
+        {"name": "_vptr", "type": "void **", "offset": 0, "bitpos": 0,
+         "bitsize": 0, "size": 8, "base": False},
+        {"name": "x", "type": "int", "offset": 8, "bitpos": 64,
+         "bitsize": 0, "size": 4, "base": False}]}
+
+def sizeof(name):
+    return len(name)
+
+def find_types(regex):
+    if regex == "^std::vector<":
+        return ["std::vector<int, std::allocator<int> >", "std::vector<Missing>"]
+    return []
+
+def flat_layout(name):
+    if "Missing" in name:
+        raise KeyError(name)
+    return {"name": name, "size": 24, "fields": {
+        "_M_impl._M_start": 0, "_M_impl._M_finish": 8, "_M_impl._M_end_of_storage": 16}}
+
+print("noise before ready")
+gdb_worker.serve(handlers={
+    "type_layout": type_layout, "sizeof": sizeof,
+    "find_types": find_types, "flat_layout": flat_layout})
+""" % TESTDATA_DIR
+
+
+def fake_worker():
+    return gdb_worker.WorkerClient([sys.executable, "-c", FAKE_SERVER])
+
+
+class GdbWorkerProtocolTest(unittest.TestCase):
+    def test_request_round_trip(self):
+        with fake_worker() as worker:
+            self.assertEqual(worker.request("sizeof", name="abcd"), 4)
+            self.assertEqual(worker.request("type_layout", name="Foo")["size"], 16)
+
+    def test_error_response(self):
+        with fake_worker() as worker:
+            self.assertRaises(gdb_worker.GdbWorkerError, worker.request, "nope")
+            self.assertRaises(
+                gdb_worker.GdbWorkerError, worker.request, "type_layout", name="Bar"
+            )
+            # 出错后同一个会话仍然可用
+            self.assertEqual(worker.request("sizeof", name="ab"), 2)
+
+    def test_batch(self):
+        with fake_worker() as worker:
+            results = worker.batch(
+                [("sizeof", {"name": "abc"}), ("type_layout", {"name": "Bar"})]
+            )
+            self.assertEqual(results, [3, None])
+            self.assertRaises(
+                gdb_worker.GdbWorkerError,
+                worker.batch,
+                [("type_layout", {"name": "Bar"})],
+                strict=True,
+            )
+
+    def test_close_stops_server(self):
+        worker = fake_worker().start()
+        process = worker.process
+        worker.close()
+        self.assertEqual(process.returncode, 0)
+
+    def test_collect_type_layouts(self):
+        with fake_worker() as worker:
+            types = type_db.collect_type_layouts(worker, ["Foo", "Bar"])
+        self.assertEqual(
+            types,
+            {"Foo": {"size": 16, "fields": [["_vptr", 0, 8, "void **"], ["x", 8, 4, "int"]]}},
+        )
+
+    def test_collect_container_layouts(self):
+        with fake_worker() as worker:
+            containers = type_db.collect_container_layouts(worker)
+        self.assertEqual(
+            containers,
+            {
+                "std::vector<int, std::allocator<int> >": {
+                    "kind": "vector",
+                    "size": 24,
+                    "fields": {
+                        "_M_impl._M_start": 0,
+                        "_M_impl._M_finish": 8,
+                        "_M_impl._M_end_of_storage": 16,
+                    },
+                }
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
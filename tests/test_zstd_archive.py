@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""zstd_archive 的 .tar.zst 读写测试，需要 zstandard 模块或 zstd 命令行工具"""
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+
+TESTDATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TESTDATA_DIR)
+
+import zstd_archive  # noqa: E402
+
+
+def zstd_available():
+    if zstd_archive.zstandard is not None:
+        return True
+    try:
+        zstd_archive.find_zstd()
+    except RuntimeError:
+        return False
+    return True
+
+
+class RecordingPool(ThreadPool):
+    """记录创建的线程池，测试结束后检查它们是否都已 join"""
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        ThreadPool.__init__(self, *args, **kwargs)
+        self.joined = False
+        RecordingPool.instances.append(self)
+
+    def join(self):
+        ThreadPool.join(self)
+        self.joined = True
+
+
+@unittest.skipUnless(zstd_available(), "needs zstandard or the zstd CLI")
+class OpenTarTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        tar_data = io.BytesIO()
+        with tarfile.open(fileobj=tar_data, mode="w") as tf:
+            for name in ["maps", "core.1"]:
+                data = os.urandom(64 * 1024)
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+        tar_data.seek(0)
+        self.path = os.path.join(self.tmp_dir, "coredump-1-1" + zstd_archive.ZSTD_SUFFIX)
+        zstd_archive.write_seekable(tar_data, self.path, frame_size=16 * 1024, jobs=2)
+        RecordingPool.instances = []
+        self.saved_pool = zstd_archive.ThreadPool
+        zstd_archive.ThreadPool = RecordingPool
+
+    def tearDown(self):
+        zstd_archive.ThreadPool = self.saved_pool
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_members(self):
+        with zstd_archive.open_tar(self.path, jobs=2) as tf:
+            names = [member.name for member in tf]
+        self.assertEqual(names, ["maps", "core.1"])
+
+    def test_close_shuts_down_pool(self):
+        # 只读第一个 member 就关闭，解压生成器停在中途
+        with zstd_archive.open_tar(self.path, jobs=2) as tf:
+            member = tf.next()
+            self.assertEqual(member.name, "maps")
+            self.assertEqual(len(tf.extractfile(member).read()), 64 * 1024)
+        self.assertEqual(len(RecordingPool.instances), 1)
+        self.assertTrue(RecordingPool.instances[0].joined)
+
+
+if __name__ == "__main__":
+    unittest.main()
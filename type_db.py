@@ -0,0 +1,592 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+按 build-id 存放的 DWARF 类型布局数据库
+
+libc、libstdc++ 等在几乎所有 core 中完全相同，但 maze 每次分析都重新解析或下载
+它们的类型信息（.use_parse_dwarf.json、ctypes-<build-id>、CppVtable）。本模块把
+一个 build-id 的类型布局写成一个只读文件 <maze_root>/tmp/type-db/<build-id>.tdb，
+第一次遇到该 build-id 时直接从 tarball 中的 ELF member 生成（不解压整个 tarball），
+之后的分析 mmap 后直接二分查找，不整体解析。
+
+每个文件包含三个 section：
+
+- types       类型名 -> {"size": N, "fields": [[name, offset, size, type], ...]}
+- vtables     vtable 起始地址 -> [类名, vtable 大小]，按地址查找所在的 vtable
+- containers  STL 容器类型名 -> {"kind": "vector", "size": 24,
+              "fields": {"_M_impl._M_start": 0, "_M_impl._M_finish": 8, ...}}
+
+vtables 用 nm 收集；types 和 containers 由 gdb_worker.GdbWorker 在一个常驻 GDB 中
+批量查询（types 为有 vtable 的类和 DEFAULT_TYPE_NAMES，containers 为调试信息中
+CONTAINER_PATTERNS 匹配的全部实例化类型），没有可用的 GDB 时为空。
+
+<db_dir>/tarballs.json 记录每个 tarball（按路径、大小和 mtime）包含的 build-id，
+全部已有数据库时不再读取 tarball。
+
+文件格式（小端）：
+    header   magic "MZTYPEDB" | version u32 | section 数 u32
+    section  name 16 字节 | 索引偏移 u64 | 条目数 u64          （按 name 排序）
+    索引     key 偏移 u64 | key 长度 u32 | value 偏移 u64 | value 长度 u32（按 key 字节序排序）
+    数据     key 为 utf-8 字符串或 8 字节大端地址，value 为紧凑 JSON
+
+Usage:
+    python3 type_db.py list
+    python3 type_db.py show <build-id> [--type T] [--vtable ADDR] [--container T]
+    python3 type_db.py import <build-id> <layout.json>     # {"types": {}, "vtables": {}, "containers": {}}
+    python3 type_db.py vtables <elf> [--build-id ID]        # 用 nm 收集 vtable 写入数据库
+    python3 type_db.py tarball <tarball>                    # 为 tarball 中的 ELF member 生成数据库
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+import tar_manifest
+import zstd_archive
+import object_store
+import gdb_worker
+
+
+MAGIC = b"MZTYPEDB"
+VERSION = 1
+DB_SUFFIX = ".tdb"
+
+HEADER = struct.Struct("<8sII")
+SECTION = struct.Struct("<16sQQ")
+ENTRY = struct.Struct("<QIQI")
+ADDRESS = struct.Struct(">Q")
+
+SECTIONS = ["containers", "types", "vtables"]
+
+# 容器种类 -> GDB `info types` 的类型名正则
+CONTAINER_PATTERNS = [
+    ("string", "^std::__cxx11::basic_string<"),
+    ("vector", "^std::vector<"),
+    ("list", "^std::__cxx11::list<"),
+    ("deque", "^std::deque<"),
+    ("map", "^std::map<"),
+    ("set", "^std::set<"),
+    ("unordered_map", "^std::unordered_map<"),
+    ("unordered_set", "^std::unordered_set<"),
+]
+
+# 每种容器最多记录的实例化类型数
+MAX_CONTAINER_TYPES = 500
+
+# 记录 tarball 中 build-id 的索引文件
+TARBALL_INDEX = "tarballs.json"
+
+# 没有 vtable 也总是查询布局的类型（存在于该 ELF 的调试信息中时）
+DEFAULT_TYPE_NAMES = [
+    "struct malloc_state",
+    "struct malloc_chunk",
+    "struct _heap_info",
+    "struct tcache_perthread_struct",
+    "PyObject",
+    "PyTypeObject",
+]
+
+
+def default_db_dir(maze_root=None):
+    """默认数据库目录：<maze_root>/tmp/type-db"""
+    if maze_root is None:
+        testdata_dir = os.path.dirname(os.path.abspath(__file__))
+        maze_root = os.path.dirname(testdata_dir)
+    return os.path.join(maze_root, "tmp", "type-db")
+
+
+def db_path(db_dir, build_id):
+    """build-id 对应的数据库文件"""
+    return os.path.join(db_dir, build_id + DB_SUFFIX)
+
+
+def encode_key(section, key):
+    """vtables 的 key 为大端地址，字节序即数值序；其余为 utf-8 字符串"""
+    if section == "vtables":
+        return ADDRESS.pack(int(key))
+    return key.encode("utf-8")
+
+
+def encode_value(value):
+    return json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def write_db(path, sections):
+    """写入数据库文件（先写临时文件再 rename）
+
+    Args:
+        sections: {section 名: {key: value}}，vtables 的 key 为整数地址
+    """
+    names = sorted(sections)
+    blobs = []
+    indexes = []
+    data_offset = HEADER.size + SECTION.size * len(names)
+    for name in names:
+        items = sorted(
+            (encode_key(name, k), encode_value(v)) for k, v in sections[name].items()
+        )
+        indexes.append(items)
+        data_offset += ENTRY.size * len(items)
+
+    index_data = []
+    section_table = []
+    index_offset = HEADER.size + SECTION.size * len(names)
+    for name, items in zip(names, indexes):
+        section_table.append(SECTION.pack(name.encode("utf-8"), index_offset, len(items)))
+        for key, value in items:
+            key_offset = data_offset
+            data_offset += len(key)
+            value_offset = data_offset
+            data_offset += len(value)
+            index_data.append(ENTRY.pack(key_offset, len(key), value_offset, len(value)))
+            blobs.append(key)
+            blobs.append(value)
+        index_offset += ENTRY.size * len(items)
+
+    db_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(db_dir):
+        try:
+            os.makedirs(db_dir)
+        except OSError:
+            if not os.path.isdir(db_dir):
+                raise
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names)))
+        f.write(b"".join(section_table))
+        f.write(b"".join(index_data))
+        f.write(b"".join(blobs))
+    os.rename(tmp_path, path)
+
+
+class TypeDB(object):
+    """只读、mmap 的类型布局数据库，查找时只解码命中的条目"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError("Not a type database: %s" % path)
+        self._sections = {}
+        for i in range(count):
+            name, offset, entries = SECTION.unpack_from(
+                self._map, HEADER.size + i * SECTION.size
+            )
+            self._sections[name.rstrip(b"\0").decode("utf-8")] = (offset, entries)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _entry(self, section, i):
+        offset = self._sections[section][0] + i * ENTRY.size
+        key_offset, key_len, value_offset, value_len = ENTRY.unpack_from(self._map, offset)
+        return key_offset, key_len, value_offset, value_len
+
+    def _key(self, section, i):
+        key_offset, key_len, _, _ = self._entry(section, i)
+        return self._map[key_offset : key_offset + key_len]
+
+    def _value(self, section, i):
+        _, _, value_offset, value_len = self._entry(section, i)
+        return json.loads(self._map[value_offset : value_offset + value_len].decode("utf-8"))
+
+    def _bisect(self, section, key):
+        """返回第一个 key >= key 的下标"""
+        lo, hi = 0, self._sections.get(section, (0, 0))[1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(section, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _get(self, section, key):
+        if section not in self._sections:
+            return None
+        raw = encode_key(section, key)
+        i = self._bisect(section, raw)
+        if i < self._sections[section][1] and self._key(section, i) == raw:
+            return self._value(section, i)
+        return None
+
+    def count(self, section):
+        return self._sections.get(section, (0, 0))[1]
+
+    def type_layout(self, name):
+        """类型布局，不存在时返回 None"""
+        return self._get("types", name)
+
+    def container(self, name):
+        """STL 容器布局，不存在时返回 None"""
+        return self._get("containers", name)
+
+    def vtable_class(self, addr):
+        """地址所在 vtable 的类名（vptr 通常指向 vtable 起始 +16），不在任何 vtable 中时返回 None"""
+        if "vtables" not in self._sections:
+            return None
+        i = self._bisect("vtables", ADDRESS.pack(addr + 1)) - 1
+        if i < 0:
+            return None
+        start = ADDRESS.unpack(self._key("vtables", i))[0]
+        class_name, size = self._value("vtables", i)
+        if addr < start + max(size, 1):
+            return class_name
+        return None
+
+    def items(self, section):
+        """遍历 section 中的全部 (key, value)"""
+        for i in range(self.count(section)):
+            key = self._key(section, i)
+            if section == "vtables":
+                key = ADDRESS.unpack(key)[0]
+            else:
+                key = key.decode("utf-8")
+            yield key, self._value(section, i)
+
+    def to_dict(self):
+        return dict((name, dict(self.items(name))) for name in self._sections)
+
+
+def open_db(db_dir, build_id):
+    """打开 build-id 的数据库，不存在时返回 None"""
+    path = db_path(db_dir, build_id)
+    if not os.path.exists(path):
+        return None
+    return TypeDB(path)
+
+
+def update_db(db_dir, build_id, types=None, vtables=None, containers=None):
+    """合并新的条目后重新写入，已有条目以新值为准"""
+    sections = dict((name, {}) for name in SECTIONS)
+    db = open_db(db_dir, build_id)
+    if db is not None:
+        with db:
+            for name, items in db.to_dict().items():
+                sections.setdefault(name, {}).update(items)
+    for name, items in (("types", types), ("vtables", vtables), ("containers", containers)):
+        if items:
+            sections[name].update(items)
+    write_db(db_path(db_dir, build_id), sections)
+    return db_path(db_dir, build_id)
+
+
+def collect_vtables(elf_path):
+    """用 nm 收集 ELF 中的 vtable：{起始地址: [类名, 大小]}
+
+    先读 .symtab，被 strip 时回退到 .dynsym。
+    """
+    vtables = {}
+    for extra in ([], ["-D"]):
+        try:
+            with open(os.devnull, "w") as devnull:
+                out = subprocess.check_output(
+                    ["nm", "-C", "-S", "--defined-only"] + extra + [elf_path],
+                    stderr=devnull,
+                )
+        except (OSError, subprocess.CalledProcessError):
+            continue
+        for line in out.decode("utf-8", "replace").splitlines():
+            parts = line.split(" ", 3)
+            if len(parts) != 4 or not parts[3].startswith("vtable for "):
+                continue
+            class_name = parts[3][len("vtable for ") :].split("@")[0]
+            vtables[int(parts[0], 16)] = [class_name, int(parts[1], 16)]
+        if vtables:
+            break
+    return vtables
+
+
+def collect_type_layouts(worker, type_names):
+    """通过 gdb_worker.GdbWorker 一次批量查询类型布局，返回 types section 的条目"""
+    type_names = list(type_names)
+    layouts = worker.batch([("type_layout", {"name": name}) for name in type_names])
+    types = {}
+    for name, layout in zip(type_names, layouts):
+        if layout is None:
+            continue
+        types[name] = {
+            "size": layout["size"],
+            "fields": [[f["name"], f["offset"], f["size"], f["type"]] for f in layout["fields"]],
+        }
+    return types
+
+
+def collect_container_layouts(worker):
+    """通过 GdbWorker 查找调试信息中的 STL 容器实例化类型并查询展开后的布局
+
+    两次往返：先批量 find_types，再批量 flat_layout。
+    """
+    found = worker.batch([("find_types", {"regex": regex}) for _, regex in CONTAINER_PATTERNS])
+    names = []
+    for (kind, _), type_names in zip(CONTAINER_PATTERNS, found):
+        names.extend((kind, name) for name in (type_names or [])[:MAX_CONTAINER_TYPES])
+    layouts = worker.batch([("flat_layout", {"name": name}) for _, name in names])
+    containers = {}
+    for (kind, name), layout in zip(names, layouts):
+        if layout is None:
+            continue
+        containers[name] = {"kind": kind, "size": layout["size"], "fields": layout["fields"]}
+    return containers
+
+
+@contextlib.contextmanager
+def elf_tempfile(data):
+    """把 ELF 内容写入临时文件，供 nm / GDB 读取"""
+    fd, path = tempfile.mkstemp(suffix=".elf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def collect_elf_layouts(path, use_gdb):
+    """收集一个 ELF 文件的全部 section 条目
+
+    vtables 由 nm 收集；use_gdb 时启动一个只加载该 ELF 的常驻 GDB，
+    批量查询类型和容器布局。GDB 出错时只返回 vtables。
+    """
+    vtables = collect_vtables(path)
+    types = {}
+    containers = {}
+    if use_gdb:
+        names = sorted(set(name for name, _ in vtables.values())) + DEFAULT_TYPE_NAMES
+        try:
+            with gdb_worker.GdbWorker(path) as worker:
+                types = collect_type_layouts(worker, names)
+                containers = collect_container_layouts(worker)
+        except (OSError, gdb_worker.GdbWorkerError) as e:
+            print("Warning: GDB type lookup failed for %s: %s" % (path, str(e)))
+    return {"types": types, "vtables": vtables, "containers": containers}
+
+
+def iter_tarball_elfs(tarball_path, wanted, objects_dir=None):
+    """不解压整个 tarball，读取其中的 ELF member，生成 (member 名, build-id, 内容)
+
+    只读取 wanted(build_id) 为 True 的 member。有清单时按清单中的 build-id 挑选：
+    .tar.zst 只解压覆盖这些 member 的 frame，.tar.gz 顺序读一遍；没有清单时
+    顺序读一遍，逐个解析 build-id。去重 tarball 中被移出的 ELF 文件直接从对象存储读取。
+    """
+    objects_dir = objects_dir or object_store.default_objects_dir()
+    manifest = tar_manifest.read_manifest(tarball_path)
+    if manifest:
+        objects = manifest.get("objects", {})
+        names = dict(
+            (name, build_id)
+            for name, build_id in manifest.get("build_ids", {}).items()
+            if wanted(build_id)
+        )
+        for name in sorted(names):
+            if name in objects:
+                with open(object_store.object_path(objects_dir, names[name]), "rb") as f:
+                    yield name, names[name], f.read()
+        names = dict((n, b) for n, b in names.items() if n not in objects)
+        if not names:
+            return
+        if zstd_archive.is_zstd_archive(tarball_path):
+            for name in sorted(names):
+                data = tar_manifest.read_member(tarball_path, name)
+                if data is not None:
+                    yield name, names[name], data
+            return
+        with zstd_archive.open_tar(tarball_path) as tf:
+            for member in tf:
+                if member.isfile() and member.name in names:
+                    yield member.name, names[member.name], tf.extractfile(member).read()
+        return
+
+    with zstd_archive.open_tar(tarball_path) as tf:
+        for member in tf:
+            if not member.isfile() or tar_manifest.pid_from_member_name(member.name):
+                continue
+            if member.name == tar_manifest.REFS_MEMBER:
+                refs = json.loads(tf.extractfile(member).read().decode("utf-8"))
+                for name, build_id in sorted(refs.items()):
+                    if wanted(build_id):
+                        with open(object_store.object_path(objects_dir, build_id), "rb") as f:
+                            yield name, build_id, f.read()
+                continue
+            if member.size > tar_manifest.BUILD_ID_MAX_MEMBER_SIZE:
+                continue
+            data = tf.extractfile(member).read()
+            if data[:4] != tar_manifest.ELF_MAGIC:
+                continue
+            build_id = tar_manifest.parse_elf_build_id(data)
+            if build_id and wanted(build_id):
+                yield member.name, build_id, data
+
+
+def load_tarball_index(db_dir):
+    """{tarball 绝对路径: [大小, mtime, [build-id]]}，不存在或损坏时返回空 dict"""
+    try:
+        with open(os.path.join(db_dir, TARBALL_INDEX), "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def record_tarball_build_ids(db_dir, tarball_path, build_ids):
+    """把 tarball 的 build-id 写入索引（先写临时文件再 rename）"""
+    st = os.stat(tarball_path)
+    index = load_tarball_index(db_dir)
+    index[os.path.abspath(tarball_path)] = [st.st_size, st.st_mtime, sorted(build_ids)]
+    path = os.path.join(db_dir, TARBALL_INDEX)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def tarball_dbs_up_to_date(db_dir, tarball_path):
+    """索引中记录的 tarball 未变化，且其全部 build-id 都已有数据库"""
+    entry = load_tarball_index(db_dir).get(os.path.abspath(tarball_path))
+    if not entry:
+        return False
+    st = os.stat(tarball_path)
+    size, mtime, build_ids = entry
+    if size != st.st_size or mtime != st.st_mtime:
+        return False
+    return all(os.path.exists(db_path(db_dir, build_id)) for build_id in build_ids)
+
+
+def build_tarball_dbs(db_dir, tarball_path):
+    """为 tarball 中还没有数据库的 build-id 生成数据库，返回新生成的 build-id 列表
+
+    索引表明全部 build-id 都已有数据库时直接返回，不读取 tarball。
+    """
+    if tarball_dbs_up_to_date(db_dir, tarball_path):
+        return []
+    created = []
+    seen = set()
+    use_gdb = None
+
+    def wanted(build_id):
+        seen.add(build_id)
+        return build_id not in created and not os.path.exists(db_path(db_dir, build_id))
+
+    for _, build_id, data in iter_tarball_elfs(tarball_path, wanted):
+        if not wanted(build_id):
+            continue
+        if use_gdb is None:
+            use_gdb = gdb_worker.gdb_available()
+            if not use_gdb:
+                print("Warning: No usable GDB, type databases only contain vtables")
+        with elf_tempfile(data) as path:
+            update_db(db_dir, build_id, **collect_elf_layouts(path, use_gdb))
+        created.append(build_id)
+    if not os.path.isdir(db_dir):
+        os.makedirs(db_dir)
+    record_tarball_build_ids(db_dir, tarball_path, seen)
+    return created
+
+
+def elf_build_id(path):
+    """读取 ELF 文件的 build-id"""
+    with open(path, "rb") as f:
+        return tar_manifest.parse_elf_build_id(f.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build-id keyed type layout database")
+    parser.add_argument("--db", default=default_db_dir(), help="Database directory")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("list", help="List databases")
+
+    show_parser = sub.add_parser("show", help="Show a database or look up entries")
+    show_parser.add_argument("build_id")
+    show_parser.add_argument("--type")
+    show_parser.add_argument("--vtable", help="Address, e.g. 0x20b148")
+    show_parser.add_argument("--container")
+
+    import_parser = sub.add_parser("import", help="Merge vtables from a JSON file")
+    import_parser.add_argument("build_id")
+    import_parser.add_argument("layout")
+
+    vtables_parser = sub.add_parser("vtables", help="Collect vtables of an ELF file with nm")
+    vtables_parser.add_argument("elf")
+    vtables_parser.add_argument("--build-id", help="Default: read from the ELF file")
+
+    tarball_parser = sub.add_parser(
+        "tarball", help="Build databases for the ELF members of a coredump tarball"
+    )
+    tarball_parser.add_argument("tarball")
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        names = sorted(n for n in os.listdir(args.db) if n.endswith(DB_SUFFIX)) \
+            if os.path.isdir(args.db) else []
+        for name in names:
+            with TypeDB(os.path.join(args.db, name)) as db:
+                print(
+                    "%s  types %6d  vtables %6d  containers %4d"
+                    % (
+                        name[: -len(DB_SUFFIX)],
+                        db.count("types"),
+                        db.count("vtables"),
+                        db.count("containers"),
+                    )
+                )
+    elif args.command == "show":
+        db = open_db(args.db, args.build_id)
+        if db is None:
+            print("Error: No database for %s" % args.build_id)
+            sys.exit(1)
+        with db:
+            if args.type:
+                print(json.dumps(db.type_layout(args.type), indent=2))
+            elif args.vtable:
+                print(db.vtable_class(int(args.vtable, 0)))
+            elif args.container:
+                print(json.dumps(db.container(args.container), indent=2))
+            else:
+                for name in SECTIONS:
+                    print("%-10s %d" % (name, db.count(name)))
+    elif args.command == "import":
+        with open(args.layout, "r") as f:
+            layout = json.load(f)
+        vtables = dict((int(k, 0), v) for k, v in layout.get("vtables", {}).items())
+        path = update_db(
+            args.db,
+            args.build_id,
+            types=layout.get("types"),
+            vtables=vtables,
+            containers=layout.get("containers"),
+        )
+        print("Database written: %s" % path)
+    elif args.command == "vtables":
+        build_id = args.build_id or elf_build_id(args.elf)
+        if not build_id:
+            print("Error: No build-id in %s, use --build-id" % args.elf)
+            sys.exit(1)
+        vtables = collect_vtables(args.elf)
+        path = update_db(args.db, build_id, vtables=vtables)
+        print("%d vtables written: %s" % (len(vtables), path))
+    elif args.command == "tarball":
+        created = build_tarball_dbs(args.db, args.tarball)
+        print("%d new databases in %s" % (len(created), args.db))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
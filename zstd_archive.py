@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+可随机访问的 zstd coredump 归档 (.tar.zst)
+
+.tar.gz 是单个 gzip 流，只能单核从头解压。.tar.zst 把 tar 流按固定大小
+（默认 4M）切成相互独立的 zstd frame，末尾附加 zstd seekable format 的
+seek table（skippable frame，普通 zstd / `tar --zstd` 会忽略它）：
+
+- 解压时各 frame 在多个核上并行解压，按顺序输出
+- 结合清单中 member 在 tar 流中的偏移，只解压覆盖该 member 的 frame，
+  即可读取 maps、<pid>.exe 等单个小文件
+
+安装了 zstandard 模块时在进程内压缩和解压；否则调用 zstd 命令行工具（环境变量
+ZSTD 或 PATH 中的 zstd），解压时每个 zstd 进程处理一批连续的 frame
+（DECOMPRESS_BATCH_SIZE），而不是每个 frame 启动一个进程。
+
+读取单个 member 见 tar_manifest.py --cat。
+
+由 .tar.gz 转换：python3 convert_tarball.py --zstd <tarball.tar.gz>
+
+Usage:
+    python3 zstd_archive.py list <archive.tar.zst>
+    python3 zstd_archive.py decompress <archive.tar.zst> <output.tar> [-j N]
+"""
+from __future__ import print_function
+import os
+import sys
+import gzip
+import struct
+import tarfile
+import argparse
+import collections
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# 可选依赖：有 zstandard 时不必启动 zstd 子进程
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+ZSTD_SUFFIX = ".tar.zst"
+
+DEFAULT_FRAME_SIZE = 4 * 1024 * 1024
+
+DEFAULT_LEVEL = 3
+
+# 使用 zstd 命令行工具时，一个进程解压的连续 frame 的总大小（解压后）
+DECOMPRESS_BATCH_SIZE = 32 * 1024 * 1024
+
+# zstd seekable format: https://github.com/facebook/zstd/tree/dev/contrib/seekable_format
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+SEEK_TABLE_FOOTER_SIZE = 9
+SEEK_TABLE_CHECKSUM_FLAG = 0x80
+
+Frame = collections.namedtuple(
+    "Frame", ["compressed_offset", "compressed_size", "offset", "size"]
+)
+
+
+def is_zstd_archive(path):
+    """是否为 .tar.zst 归档"""
+    return path.endswith(ZSTD_SUFFIX)
+
+
+def find_zstd():
+    """返回 zstd 可执行文件路径，找不到时抛出 RuntimeError"""
+    candidates = []
+    if os.environ.get("ZSTD"):
+        candidates.append(os.environ["ZSTD"])
+    for path_dir in os.environ.get("PATH", "").split(os.pathsep):
+        candidates.append(os.path.join(path_dir, "zstd"))
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    raise RuntimeError("zstd not found, install zstd or set ZSTD=/path/to/zstd")
+
+
+def run_zstd(args, data):
+    """以 data 为 stdin 运行 zstd，返回 stdout"""
+    process = subprocess.Popen(
+        [find_zstd(), "-q", "-c"] + args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    out, err = process.communicate(data)
+    if process.returncode != 0:
+        raise RuntimeError("zstd failed: %s" % err.decode("utf-8", "replace").strip())
+    return out
+
+
+def compress_frame(data, level=DEFAULT_LEVEL):
+    """把 data 压缩为一个独立的 zstd frame"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return run_zstd(["-%d" % level], data)
+
+
+def batch_frames(frames, batch_size=DECOMPRESS_BATCH_SIZE):
+    """把 frame 按顺序分成解压后总大小约为 batch_size 的若干批连续 frame"""
+    batch = []
+    size = 0
+    for frame in frames:
+        batch.append(frame)
+        size += frame.size
+        if size >= batch_size:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def read_frames(path, batch):
+    """读取并解压一批连续的 frame，返回拼接后的数据
+
+    zstd 命令行工具把串联的多个 frame 依次解压，整批只需启动一个进程。
+    """
+    start = batch[0].compressed_offset
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(batch[-1].compressed_offset + batch[-1].compressed_size - start)
+    if zstandard is None:
+        return run_zstd(["-d"], data)
+    dctx = zstandard.ZstdDecompressor()
+    parts = []
+    for frame in batch:
+        pos = frame.compressed_offset - start
+        parts.append(dctx.decompress(
+            data[pos : pos + frame.compressed_size], max_output_size=frame.size))
+    return b"".join(parts)
+
+
+def default_jobs():
+    """并行度默认为 CPU 核数"""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def iter_ordered(pool, func, items, window):
+    """在 pool 中并行执行 func(item)，按 items 顺序产出结果
+
+    同时最多有 window 个任务在执行或等待取走，限制内存占用。
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def read_chunks(fileobj, size):
+    """按 size 切分读取 fileobj"""
+    while True:
+        chunk = fileobj.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def write_seekable(src, out_path, level=DEFAULT_LEVEL, frame_size=DEFAULT_FRAME_SIZE,
+                   jobs=None):
+    """把 src 的内容写为 seekable zstd 归档
+
+    Returns:
+        int: frame 数
+    """
+    jobs = jobs or default_jobs()
+    entries = []
+    tmp_path = "%s.%d.tmp" % (out_path, os.getpid())
+    pool = ThreadPool(jobs)
+    try:
+        with open(tmp_path, "wb") as out:
+            frames = iter_ordered(
+                pool,
+                lambda chunk: (compress_frame(chunk, level), len(chunk)),
+                read_chunks(src, frame_size),
+                jobs * 2,
+            )
+            for compressed, size in frames:
+                out.write(compressed)
+                entries.append((len(compressed), size))
+
+            table = b"".join(struct.pack("<II", c, d) for c, d in entries)
+            footer = struct.pack("<IBI", len(entries), 0, SEEKABLE_MAGIC)
+            out.write(struct.pack("<II", SKIPPABLE_MAGIC, len(table) + len(footer)))
+            out.write(table)
+            out.write(footer)
+        os.rename(tmp_path, out_path)
+    finally:
+        pool.close()
+        pool.join()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(entries)
+
+
+def read_seek_table(path):
+    """读取 seek table，返回 [Frame]"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        if file_size < SEEK_TABLE_FOOTER_SIZE + 8:
+            raise ValueError("Not a seekable zstd archive: %s" % path)
+        f.seek(file_size - SEEK_TABLE_FOOTER_SIZE)
+        num_frames, descriptor, magic = struct.unpack(
+            "<IBI", f.read(SEEK_TABLE_FOOTER_SIZE)
+        )
+        if magic != SEEKABLE_MAGIC:
+            raise ValueError("Not a seekable zstd archive: %s" % path)
+
+        entry_size = 12 if descriptor & SEEK_TABLE_CHECKSUM_FLAG else 8
+        table_size = num_frames * entry_size
+        f.seek(file_size - SEEK_TABLE_FOOTER_SIZE - table_size - 8)
+        skippable_magic, _ = struct.unpack("<II", f.read(8))
+        if skippable_magic != SKIPPABLE_MAGIC:
+            raise ValueError("Corrupted seek table: %s" % path)
+        table = f.read(table_size)
+
+    frames = []
+    compressed_offset = 0
+    offset = 0
+    for i in range(num_frames):
+        compressed_size, size = struct.unpack_from("<II", table, i * entry_size)
+        frames.append(Frame(compressed_offset, compressed_size, offset, size))
+        compressed_offset += compressed_size
+        offset += size
+    return frames
+
+
+def iter_decompressed(path, frames=None, jobs=None):
+    """按批并行解压 frame，按顺序产出解压后的数据"""
+    if frames is None:
+        frames = read_seek_table(path)
+    jobs = jobs or default_jobs()
+    pool = ThreadPool(jobs)
+    try:
+        batches = batch_frames(frames)
+        for data in iter_ordered(pool, lambda batch: read_frames(path, batch), batches,
+                                 jobs * 2):
+            yield data
+    finally:
+        pool.close()
+        pool.join()
+
+
+def read_range(path, offset, size, frames=None):
+    """读取解压后 tar 流中 [offset, offset + size) 的数据，只解压覆盖的 frame"""
+    if frames is None:
+        frames = read_seek_table(path)
+    end = offset + size
+    covered = [fr for fr in frames if fr.offset < end and fr.offset + fr.size > offset]
+    if not covered:
+        return b""
+    data = read_frames(path, covered)
+    start = offset - covered[0].offset
+    return data[start : start + size]
+
+
+class DecompressedStream(object):
+    """把并行解压的 frame 串成只读流，供 tarfile 以流模式读取"""
+
+    def __init__(self, path, jobs=None):
+        self._chunks = iter_decompressed(path, jobs=jobs)
+        self._buf = b""
+        self._pos = 0
+
+    def read(self, size=-1):
+        parts = []
+        while size < 0 or size > 0:
+            if self._pos >= len(self._buf):
+                try:
+                    self._buf = next(self._chunks)
+                except StopIteration:
+                    break
+                self._pos = 0
+            if size < 0:
+                end = len(self._buf)
+            else:
+                end = min(len(self._buf), self._pos + size)
+                size -= end - self._pos
+            parts.append(self._buf[self._pos : end])
+            self._pos = end
+        return b"".join(parts)
+
+    def close(self):
+        self._chunks.close()
+
+
+def open_tar(path, jobs=None):
+    """打开 .tar.gz 或 .tar.zst，返回 TarFile
+
+    .tar.zst 以流模式打开，只能按顺序遍历 member；关闭 TarFile 时同时关闭解压流，
+    结束解压线程池。
+    """
+    if is_zstd_archive(path):
+        stream = DecompressedStream(path, jobs=jobs)
+        try:
+            tar = tarfile.open(fileobj=stream, mode="r|")
+        except Exception:
+            stream.close()
+            raise
+        # tarfile 的 _Stream 默认不关闭外部传入的 fileobj
+        tar.fileobj._extfileobj = False
+        return tar
+    return tarfile.open(path, "r:*")
+
+
+def convert(tarball_path, level=DEFAULT_LEVEL, frame_size=DEFAULT_FRAME_SIZE, jobs=None):
+    """把 coredump-<pid>-<ts>.tar.gz 转换为同目录下的 .tar.zst，返回新路径"""
+    if not tarball_path.endswith(".tar.gz"):
+        raise ValueError("Expected a .tar.gz file: %s" % tarball_path)
+    out_path = tarball_path[: -len(".tar.gz")] + ZSTD_SUFFIX
+    with gzip.open(tarball_path, "rb") as src:
+        write_seekable(src, out_path, level=level, frame_size=frame_size, jobs=jobs)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seekable zstd coredump archives")
+    sub = parser.add_subparsers(dest="command")
+
+    list_parser = sub.add_parser("list", help="Show the seek table")
+    list_parser.add_argument("archive")
+
+    decompress_parser = sub.add_parser("decompress", help="Decompress to a .tar file")
+    decompress_parser.add_argument("archive")
+    decompress_parser.add_argument("output")
+    decompress_parser.add_argument("-j", "--jobs", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        frames = read_seek_table(args.archive)
+        for i, frame in enumerate(frames):
+            print("%6d %12d %10d  ->  %12d %10d" % (
+                i, frame.compressed_offset, frame.compressed_size, frame.offset, frame.size))
+        print("Total: %d frames, %.1fM" % (
+            len(frames), sum(fr.size for fr in frames) / 1024.0 / 1024.0))
+    elif args.command == "decompress":
+        with open(args.output, "wb") as out:
+            for data in iter_decompressed(args.archive, jobs=args.jobs):
+                out.write(data)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()